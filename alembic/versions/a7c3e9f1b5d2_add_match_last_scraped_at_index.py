@@ -0,0 +1,28 @@
+"""add match last_scraped_at index
+
+Revision ID: a7c3e9f1b5d2
+Revises: f2a9c6e1d7b4
+Create Date: 2026-10-18 21:03:15.847126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f1b5d2'
+down_revision = 'f2a9c6e1d7b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the bot checks the latest scraping time before every digest
+    with op.get_context().autocommit_block():
+        op.create_index('ix_match_last_scraped_at', 'match', ['last_scraped_at'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_match_last_scraped_at', table_name='match', postgresql_concurrently=True)
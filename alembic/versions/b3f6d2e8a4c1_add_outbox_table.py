@@ -0,0 +1,40 @@
+"""add outbox table
+
+Revision ID: b3f6d2e8a4c1
+Revises: e7d1a4c8b2f9
+Create Date: 2026-10-18 18:12:31.508214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f6d2e8a4c1'
+down_revision = 'e7d1a4c8b2f9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('payload_hash', sa.String(length=64), nullable=False),
+    sa.Column('slot', sa.String(), nullable=False),
+    sa.Column('text', sa.String(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempt_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('claimed_at', sa.DateTime(), nullable=True),
+    sa.Column('done_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['chat_id'], ['chat.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('chat_id', 'payload_hash', 'slot', name='outbox_chat_id_payload_hash_slot_key')
+    )
+    op.create_index('ix_outbox_status_id', 'outbox', ['status', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_status_id', table_name='outbox')
+    op.drop_table('outbox')
@@ -0,0 +1,32 @@
+"""add outbox news item table
+
+Revision ID: d8e2b5f7a3c6
+Revises: a7c3e9f1b5d2
+Create Date: 2026-10-18 22:41:07.392518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8e2b5f7a3c6'
+down_revision = 'a7c3e9f1b5d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('outbox_news_item',
+    sa.Column('outbox_id', sa.Integer(), nullable=False),
+    sa.Column('news_item_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['news_item_id'], ['news_item.id'], ),
+    sa.ForeignKeyConstraint(['outbox_id'], ['outbox.id'], ),
+    sa.PrimaryKeyConstraint('outbox_id', 'news_item_id')
+    )
+    op.create_index('ix_outbox_news_item_news_item_id', 'outbox_news_item', ['news_item_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_news_item_news_item_id', table_name='outbox_news_item')
+    op.drop_table('outbox_news_item')
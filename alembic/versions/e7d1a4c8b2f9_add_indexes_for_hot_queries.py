@@ -0,0 +1,37 @@
+"""add indexes for hot queries
+
+Revision ID: e7d1a4c8b2f9
+Revises: 5a8e3f1d9b62
+Create Date: 2026-10-18 16:40:52.273915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7d1a4c8b2f9'
+down_revision = '5a8e3f1d9b62'
+branch_labels = None
+depends_on = None
+
+# translation.match_id is covered by translation_match_id_streamer_id_key already
+_INDEXES = [
+    ('ix_match_unix_time_utc_sec', 'match', ['unix_time_utc_sec']),
+    ('ix_news_item_date_time_utc_comment_avg_hour', 'news_item', ['date_time_utc', 'comment_avg_hour']),
+    ('ix_subscriber_chat_id', 'subscriber', ['chat_id']),
+    ('ix_user_request_utc_time', 'user_request', ['utc_time']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY doesn't lock the tables for writes, but it can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table_name, columns in _INDEXES:
+            op.create_index(name, table_name, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table_name, _ in reversed(_INDEXES):
+            op.drop_index(name, table_name=table_name, postgresql_concurrently=True)
@@ -0,0 +1,48 @@
+"""add news item hotness
+
+Revision ID: f2a9c6e1d7b4
+Revises: b3f6d2e8a4c1
+Create Date: 2026-10-18 19:12:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a9c6e1d7b4'
+down_revision = 'b3f6d2e8a4c1'
+branch_labels = None
+depends_on = None
+
+# the same as config.NEWS_HOTNESS_GRAVITY and config.NEWS_HOTNESS_AGE_OFFSET_HOURS at the time of the migration;
+# the values are recomputed with the actual config on the next scraping anyway
+_GRAVITY = 1.5
+_AGE_OFFSET_HOURS = 2
+
+
+def upgrade() -> None:
+    op.add_column('news_item', sa.Column('hotness', sa.Float(), nullable=True))
+
+    # see db.news_item.get_hotness(); computed by the database, so the rows are not loaded (and it works with --sql)
+    op.execute(f"""
+        UPDATE news_item
+        SET hotness = COALESCE(comment_count, 0)
+            / POWER(GREATEST(EXTRACT(EPOCH FROM (NOW() - date_time_utc)) / 3600, 0) + {_AGE_OFFSET_HOURS}, {_GRAVITY})
+    """)
+
+    # CREATE INDEX CONCURRENTLY doesn't lock the table for writes, but it can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_news_item_date_time_utc_hotness', 'news_item', ['date_time_utc', 'hotness'],
+                        unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_news_item_date_time_utc_comment_avg_hour', table_name='news_item',
+                      postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_news_item_date_time_utc_comment_avg_hour', 'news_item',
+                        ['date_time_utc', 'comment_avg_hour'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_news_item_date_time_utc_hotness', table_name='news_item', postgresql_concurrently=True)
+
+    op.drop_column('news_item', 'hotness')
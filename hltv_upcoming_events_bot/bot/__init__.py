@@ -1 +1 @@
-from .bot import send_message, start
\ No newline at end of file
+from .bot import get_bot, send_message, start
@@ -1,20 +1,27 @@
 import datetime
 import logging
+import threading
+from typing import Optional
 
 import telegram
 from telegram import ParseMode, Update
 from telegram.ext import Updater, CommandHandler, CallbackContext
+from telegram.utils.request import Request
 
 import hltv_upcoming_events_bot
 import hltv_upcoming_events_bot.service.db as db_service
 import hltv_upcoming_events_bot.service.matches as matches_service
 import hltv_upcoming_events_bot.service.news as news_service
 import hltv_upcoming_events_bot.service.tg_notifier as tg_notifier_service
+import hltv_upcoming_events_bot.service.user_request_log as user_request_log
 from hltv_upcoming_events_bot import config
 from hltv_upcoming_events_bot.bot.utils import log_command
 
 _logger = logging.getLogger('hltv_upcoming_events_bot.bot')
 
+_BOT: Optional[telegram.Bot] = None
+_BOT_LOCK = threading.Lock()
+
 
 def start_command(engine: Update, context: CallbackContext) -> None:
     log_command(engine, _logger)
@@ -73,12 +80,36 @@ def version_command(engine: Update, context: CallbackContext) -> None:
     engine.message.reply_text(hltv_upcoming_events_bot.__version__, parse_mode=ParseMode.HTML)
 
 
-def send_message(chat_id: int, msg: str):
-    bot = telegram.Bot(config.BOT_TOKEN)
+def get_bot(token: str = None) -> telegram.Bot:
+    """
+    Returns: bot shared by command handlers and notifications; its HTTPS connections are pooled and reused, so
+        sending a message doesn't start a new connection every time
+    """
+
+    global _BOT
+
+    with _BOT_LOCK:
+        if _BOT is None:
+            _BOT = telegram.Bot(token if token is not None else config.BOT_TOKEN,
+                                request=Request(con_pool_size=config.BOT_CON_POOL_SIZE))
+
+        return _BOT
+
+
+def send_message(chat_id: int, msg: str) -> bool:
+    """
+    Returns: True if the message is sent; RetryAfter is raised to the caller, so it can send the message later
+    """
+
+    bot = get_bot()
     try:
         bot.send_message(chat_id=chat_id, text=msg, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+        return True
+    except telegram.error.RetryAfter:
+        raise
     except telegram.error.TelegramError as ex:
         _logger.error(f'failed to send message (chat_id={chat_id}): {ex}')
+        return False
 
 
 def error_handler(update: object, context: CallbackContext) -> None:
@@ -108,7 +139,7 @@ def error_handler(update: object, context: CallbackContext) -> None:
 
 
 def start(token: str) -> None:
-    engine = Updater(token)
+    engine = Updater(bot=get_bot(token), workers=config.BOT_UPDATE_WORKERS)
     dispatcher = engine.dispatcher
 
     commands_str = '''
@@ -131,8 +162,13 @@ def start(token: str) -> None:
 
     dispatcher.add_error_handler(error_handler)
 
-    engine.start_polling()
-    engine.idle()
+    user_request_log.start()
+    try:
+        engine.start_polling()
+        engine.idle()
+    finally:
+        # idle() returns once the updater is stopped, so no more commands are logged after that
+        user_request_log.stop()
 
 
 def _get_help_text() -> str:
@@ -7,9 +7,12 @@ import sys
 import click as click
 
 import hltv_upcoming_events_bot.bot as bot_impl
+import hltv_upcoming_events_bot.service.browser_sessions as browser_sessions
 import hltv_upcoming_events_bot.service.db as db_service
 import hltv_upcoming_events_bot.service.matches as matches_service
 import hltv_upcoming_events_bot.service.news as news_service
+import hltv_upcoming_events_bot.service.page_corpus as page_corpus
+import hltv_upcoming_events_bot.service.parser_benchmark as parser_benchmark
 import hltv_upcoming_events_bot.service.tg_notifier as tg_notifier_service
 from hltv_upcoming_events_bot import config
 from hltv_upcoming_events_bot.cli.schedule_thread import ScheduleThread
@@ -101,20 +104,52 @@ def start():
 
     init_db(config.DB_FILENAME)
     matches_service.init()
+    news_service.start()
 
 
 @parser.command(help='Parse only once; do not work in background')
-def once():
+@click.option('--full/--incremental', default=None,
+              help='Parse pages of all the upcoming matches or only new, stale, and starting soon ones')
+@click.option('--record', default=None, help='Save fetched pages to the corpus file (for replaying them later)')
+def once(full: bool, record: str):
     init_db(config.DB_FILENAME)
-    matches_service.populate_translations()
+    if record is not None:
+        page_corpus.start_recording(record)
+
+    matches_service.populate_translations(not full if full is not None else None)
+    browser_sessions.close()
+    page_corpus.stop_recording()
 
 
 @parser.command()
 @click.option('--to-date', default=None, type=click.DateTime(formats=["%Y-%m-%dT%H:%M:%S"]),
               help='Parse news until specified date')
-def news(to_date: datetime.datetime):
+@click.option('--record', default=None, help='Save fetched pages to the corpus file (for replaying them later)')
+def news(to_date: datetime.datetime, record: str):
     init_db(config.DB_FILENAME)
+    if record is not None:
+        page_corpus.start_recording(record)
+
     news_service.populate_news(to_date if to_date is not None else None)
+    browser_sessions.close()
+    page_corpus.stop_recording()
+
+
+@parser.command(help='Refresh comment counts of the stored news from the list page only; news pages are not loaded')
+def comments():
+    init_db(config.DB_FILENAME)
+
+    news_service.refresh_comment_counts()
+    browser_sessions.close()
+
+
+@parser.command(help='Measure parsers performance on the recorded pages; no network access is needed')
+@click.option('--corpus', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='Corpus file recorded by --record option')
+@click.option('-n', '--repeat', default=1, help='Number of runs')
+def bench(corpus: str, repeat: int):
+    for result in parser_benchmark.run_benchmark(page_corpus.PageCorpus(corpus), repeat):
+        print(result)
 
 
 @click.group()
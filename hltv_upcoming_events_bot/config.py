@@ -1,11 +1,52 @@
 DEBUG = False
 BOT_TOKEN = None  # None means it will be taken from command line; it will be set if appropriate env variable is set
+BOT_UPDATE_WORKERS = 4  # threads handling bot commands
+BROADCAST_WORKERS = 8  # messages to subscribers sent in parallel
+# HTTPS connections to Telegram: one per update and broadcast worker plus 4 for getUpdates, the job queue etc.
+BOT_CON_POOL_SIZE = BOT_UPDATE_WORKERS + 4 + BROADCAST_WORKERS
+BROADCAST_RATE_PER_SEC = 25  # Telegram allows ~30 messages per second to different chats
+BROADCAST_CHAT_INTERVAL_SEC = 1.0  # ... and ~1 message per second to the same chat
+BROADCAST_MAX_RETRIES = 5  # message is considered failed after that number of RetryAfter errors
+# notifications are delivered at least once: the one sent right before a crash is sent again after the claim timeout
+OUTBOX_BATCH_SIZE = 100  # notifications claimed from the outbox at once; each one is marked as sent when delivered
+OUTBOX_CLAIM_TIMEOUT_SEC = 10 * 60  # claimed notification is sent by another worker if not sent within that time
+OUTBOX_MAX_ATTEMPTS = 3  # notification that failed to be sent that number of times is given up
+OUTBOX_RETRY_DELAY_SEC = 5 * 60  # failed notification is sent again not earlier than that
+OUTBOX_DRAIN_INTERVAL_SEC = 60  # notifications left in the outbox (e.g. after restart) are sent that often
+USER_REQUEST_LOG_FLUSH_INTERVAL_SEC = 0.5  # logged bot commands are written to the database not rarer than that
+USER_REQUEST_LOG_BATCH_SIZE = 200  # ... or as soon as that number of commands is logged
+USER_REQUEST_LOG_QUEUE_SIZE = 10000  # commands logged above that while the database is slow are dropped
 
 # parsing
 BASE_URL = 'https://www.hltv.org'  # no trailing slash
+PARSER_MAX_WORKERS = 4  # max number of browsers used in parallel for parsing match pages
+NEWS_PARSER_MAX_WORKERS = 4  # max number of browsers used in parallel for parsing news item pages
+TOURNAMENT_CACHE_TTL_SEC = 24 * 60 * 60  # parsed tournament is re-parsed from its page after that
+PARSER_INCREMENTAL = True  # parse pages of new matches only (plus stale ones and the ones that start soon)
+MATCH_RESCRAPE_AGE_SEC = 12 * 60 * 60  # match page is parsed again if it was parsed earlier than that
+MATCH_RESCRAPE_BEFORE_START_SEC = 2 * 60 * 60  # match page is always parsed if the match starts within that time
+FETCHER_USE_HTTP = True  # try plain HTTP request before opening page in the browser
+FETCHER_HTTP_TIMEOUT_SEC = 15
+FETCHER_HTTP_MAX_FAILURES_IN_ROW = 3  # after that, the browser is used first for the domain
+FETCHER_HTTP_PROBE_INTERVAL = 20  # number of browser-first requests after which plain HTTP is tried again
+BROWSER_MAX_NAVIGATIONS = 200  # browser is restarted after that number of page loads
+BROWSER_MAX_MEMORY_MB = 512  # browser is restarted when its page memory exceeds that
+BROWSER_READY_TIMEOUT_SEC = 10  # page without the expected element is reloaded after that
+BROWSER_READY_POLL_SEC = 0.25  # opened page is checked for the expected element that often
+BROWSER_MAX_RELOADS = 1  # page that is still incomplete after that number of reloads is returned as is
+COOKIES_FILENAME = '.cookies.json'  # browser cookies (e.g. passed challenges) kept between runs
+PARSER_WRITE_QUEUE_SIZE = 16  # max number of parsed matches waiting to be written to the database
+MATCH_DIGEST_CACHE_TTL_SEC = 10 * 60  # rendered digest of matches is kept that long if matches are not updated
+
+# news
+NEWS_HOTNESS_GRAVITY = 1.5  # the higher it is, the faster old news items get down in the ranking
+NEWS_HOTNESS_AGE_OFFSET_HOURS = 2  # keeps just published news items with a couple of comments from the top
+NEWS_COMMENT_REFRESH_INTERVAL_MIN = 15  # comment counts are refreshed from the list page that often
 
 # database
 DB_USE_SQLITE = False
+DB_DIMENSION_CACHE_SIZE = 4096  # max number of cached teams, tournaments, streamers, chats etc. (each kind)
+DB_DIMENSION_CACHE_TTL_SEC = 10 * 60  # cached teams, tournaments etc. changed by another process expire after that
 DB_FILENAME = 'hltv_events'  # used as a database name for Postgres
 if DB_USE_SQLITE:
     # makes sense for SQLite only
@@ -1,17 +1,26 @@
-from .chat import add_chat, get_chat, get_chat_by_telegram_id
+from .chat import add_chat, add_chats_from_domain_objects, get_chat, get_chat_by_telegram_id, \
+    get_chat_ids_by_telegram_ids
 from .common import init_db, create_engine
-from .match import Match, add_match_from_domain_object, get_match_id_by_url
-from .match_state import get_match_state, get_match_state_by_name
-from .news_item import add_news_item, add_news_item_from_domain_object, get_news_item_by_url, get_recent_news_items, \
-    get_recent_news_items_for_chat, update_news_item
-from .news_item_sent import add_news_item_sent, get_news_item_sent_by_news_item_id_and_chat_id
+from .match import Match, add_matches_from_domain_objects, get_match_by_url, get_match_id_by_url, \
+    get_matches_last_scraped_at_by_urls, get_matches_version
+from .match_state import get_match_state, get_match_state_by_name, get_match_states_by_ids
+from .news_item import add_news_item, add_news_item_from_domain_object, add_news_items_from_domain_objects, \
+    get_news_item_by_url, get_news_item_ids_by_urls, get_news_item_urls_with_short_desc, get_recent_news_items, \
+    get_recent_news_items_for_chat, get_recent_news_items_for_subscribers, get_hotness, update_news_item, \
+    update_news_item_comment_counts, update_news_item_comment_counts_by_urls, update_news_items_hotness
+from .news_item_sent import add_news_item_sent, add_news_items_sent, get_news_item_sent_by_news_item_id_and_chat_id
+from .outbox import OutboxMessage, OutboxNewsItem, add_outbox_messages, add_outbox_news_items, claim_outbox_messages, \
+    get_outbox_message_ids, get_outbox_news_item_and_chat_ids, get_outbox_status_counts, \
+    release_failed_outbox_messages, set_outbox_messages_status
 from .ret_code import RetCode
-from .subscriber import add_subscriber_from_domain_object, delete_subscriber_by_id, get_subscribers, \
-    get_subscriber_by_telegram_id
-from .streamer import Streamer, add_streamer_from_domain_object, get_streamer, get_streamer_by_url, \
+from .subscriber import add_subscriber_from_domain_object, delete_subscriber_by_id, get_subscribed_chats, \
+    get_subscribers, get_subscriber_by_telegram_id
+from .streamer import Streamer, add_streamers_from_domain_objects, get_streamer, get_streamer_by_url, \
     get_streamer_id_by_url
-from .tournament import add_tournament_from_domain_object, get_tournament, get_tournament_id_by_name
-from .translation import add_translation, get_translations_by_match_id
-from .user import add_user, get_user_by_telegram_id, get_user, get_users
-from .user_request import add_user_request, get_recent_user_requests
+from .team import get_teams_by_ids
+from .tournament import get_tournament, get_tournament_by_url, get_tournament_by_url_or_hltv_id, \
+    get_tournament_id_by_name, get_tournaments_by_ids
+from .translation import add_translations, get_translations_by_match_id, get_translations_in_period
+from .user import add_user, add_users_from_domain_objects, get_user_by_telegram_id, get_user, get_users
+from .user_request import add_user_request, add_user_requests, get_recent_user_requests
 
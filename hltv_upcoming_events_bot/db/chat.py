@@ -1,12 +1,15 @@
 import logging
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 from sqlalchemy import Column, Integer, String, BigInteger
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session
 
 from hltv_upcoming_events_bot import domain
-from hltv_upcoming_events_bot.db.common import Base
+from hltv_upcoming_events_bot.db import dimension_cache
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
+
+_logger = logging.getLogger('hltv_upcoming_events_bot.db')
 
 
 class Chat(Base):
@@ -41,10 +44,47 @@ def add_chat(telegram_id: int, title: str, type: str, session: Session) -> Optio
     return chat.id
 
 
+def add_chats_from_domain_objects(chats: List[domain.Chat], session: Session) -> Dict[int, Integer]:
+    """
+    Adds chats that are not in the database yet; the session is not committed.
+
+    Returns: chat IDs by Telegram ID (the existing chats included)
+    """
+
+    cache = dimension_cache.get_caches(session).chats
+
+    rows = list({c.telegram_id: {'telegram_id': c.telegram_id, 'title': c.title, 'type': c.type}
+                 for c in chats}.values())
+    out = cache.get_ids([row['telegram_id'] for row in rows])
+
+    missing_rows = [row for row in rows if row['telegram_id'] not in out]
+    if len(missing_rows) == 0:
+        return out
+
+    added_count = insert_or_ignore(Chat, missing_rows, session, ['telegram_id'])
+    if added_count > 0:
+        _logger.info(f'{added_count} chat(s) added')
+
+    for telegram_id, chat_id in get_chat_ids_by_telegram_ids([row['telegram_id'] for row in missing_rows],
+                                                             session).items():
+        out[telegram_id] = chat_id
+        dimension_cache.put_after_commit(session, cache, telegram_id, chat_id)
+
+    return out
+
+
 def get_chat(chat_id: Integer, session: Session) -> Optional[Chat]:
     return session.get(Chat, chat_id)
 
 
+def get_chat_ids_by_telegram_ids(telegram_ids: List[int], session: Session) -> Dict[int, Integer]:
+    if len(telegram_ids) == 0:
+        return dict()
+
+    return {row.telegram_id: row.id
+            for row in session.query(Chat.id, Chat.telegram_id).filter(Chat.telegram_id.in_(telegram_ids))}
+
+
 def get_chat_by_telegram_id(telegram_id: int, session: Session) -> Optional[Chat]:
     try:
         return session.query(Chat).filter(Chat.telegram_id == telegram_id).one()
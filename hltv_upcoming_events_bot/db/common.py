@@ -1,10 +1,11 @@
 import logging
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.engine import Engine
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import Session, declarative_base
 
 from hltv_upcoming_events_bot import config
 
@@ -42,3 +43,39 @@ def init_db(name: str):
 
 def get_engine():
     return engine
+
+
+def insert_or_ignore(model, rows: List[Dict], session: Session, index_elements: List[str] = None) -> int:
+    """
+    Inserts rows with a single INSERT ... ON CONFLICT DO NOTHING statement (PostgreSQL and SQLite); rows that
+    conflict with the existing ones (by `index_elements` or by any unique constraint if not set) are skipped.
+    The session is not committed.
+
+    Returns: number of inserted rows
+    """
+
+    if len(rows) == 0:
+        return 0
+
+    insert = postgresql.insert if session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    result = session.execute(insert(model).values(rows).on_conflict_do_nothing(index_elements=index_elements))
+    return max(result.rowcount, 0)
+
+
+def upsert(model, rows: List[Dict], session: Session, index_elements: List[str], update_columns: List[str]) -> int:
+    """
+    Inserts rows with a single INSERT ... ON CONFLICT DO UPDATE statement (PostgreSQL and SQLite); rows that
+    conflict with the existing ones by `index_elements` update `update_columns` of them instead. The session is not
+    committed.
+
+    Returns: number of inserted and updated rows
+    """
+
+    if len(rows) == 0:
+        return 0
+
+    insert = postgresql.insert if session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(model).values(rows)
+    statement = statement.on_conflict_do_update(index_elements=index_elements,
+                                                set_={c: getattr(statement.excluded, c) for c in update_columns})
+    return max(session.execute(statement).rowcount, 0)
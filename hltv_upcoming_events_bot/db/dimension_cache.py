@@ -0,0 +1,186 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Generic, Hashable, Iterable, List, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from hltv_upcoming_events_bot import config
+
+_D = TypeVar('_D')
+
+_PENDING_KEY = 'dimension_cache_pending'
+
+_CACHES: 'weakref.WeakKeyDictionary[object, DimensionCaches]' = weakref.WeakKeyDictionary()
+_CACHES_LOCK = threading.Lock()
+
+
+class DimensionCache(Generic[_D]):
+    """
+    LRU cache of a small, rarely changed table (teams, tournaments, chats etc.): ID by natural key (name, URL or
+    Telegram ID) and domain object by ID. Both maps are bounded by `max_size`.
+
+    Entries are invalidated on changes by the process that makes them only (e.g. the parser), so they also expire
+    after `ttl_sec`: that's how long the other processes (e.g. the bot) may see a renamed team or tournament.
+    """
+
+    def __init__(self, max_size: int, ttl_sec: float):
+        self._max_size = max_size
+        self._ttl_sec = ttl_sec
+        self._ids: OrderedDict = OrderedDict()
+        self._objects: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_ids(self, keys: Iterable[Hashable]) -> Dict[Hashable, int]:
+        """
+        Returns: IDs of the cached keys; missing keys are not in the result
+        """
+
+        out = dict()
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                obj_id = _get_unexpired(self._ids, key, now)
+                if obj_id is not None:
+                    out[key] = obj_id
+
+        return out
+
+    def get_objects(self, ids: Iterable[int]) -> Dict[int, _D]:
+        """
+        Returns: domain objects of the cached IDs; missing IDs are not in the result
+        """
+
+        out = dict()
+        with self._lock:
+            now = time.monotonic()
+            for obj_id in ids:
+                obj = _get_unexpired(self._objects, obj_id, now)
+                if obj is not None:
+                    out[obj_id] = obj
+
+        return out
+
+    def put(self, key: Hashable, obj_id: int, obj: Optional[_D] = None):
+        with self._lock:
+            expires_at = time.monotonic() + self._ttl_sec
+
+            self._ids[key] = (obj_id, expires_at)
+            self._ids.move_to_end(key)
+            if len(self._ids) > self._max_size:
+                self._ids.popitem(last=False)
+
+            if obj is not None:
+                self._objects[obj_id] = (obj, expires_at)
+                self._objects.move_to_end(obj_id)
+                if len(self._objects) > self._max_size:
+                    self._objects.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            obj_id, _ = self._ids.pop(key, (None, 0.0))
+            if obj_id is not None:
+                self._objects.pop(obj_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._objects.clear()
+
+
+def _create_cache() -> DimensionCache:
+    return DimensionCache(config.DB_DIMENSION_CACHE_SIZE, config.DB_DIMENSION_CACHE_TTL_SEC)
+
+
+@dataclass
+class DimensionCaches(object):
+    teams: DimensionCache = field(default_factory=_create_cache)
+    match_states: DimensionCache = field(default_factory=_create_cache)
+    tournaments: DimensionCache = field(default_factory=_create_cache)
+    streamers: DimensionCache = field(default_factory=_create_cache)
+    chats: DimensionCache = field(default_factory=_create_cache)
+    users: DimensionCache = field(default_factory=_create_cache)
+
+
+def get_caches(session: Session) -> DimensionCaches:
+    """
+    Returns: caches of the database the session is bound to (IDs make sense within one database only)
+    """
+
+    engine = session.get_bind().engine
+    with _CACHES_LOCK:
+        caches = _CACHES.get(engine)
+        if caches is None:
+            caches = DimensionCaches()
+            _CACHES[engine] = caches
+
+        return caches
+
+
+def put_after_commit(session: Session, cache: DimensionCache, key: Hashable, obj_id: int, obj=None):
+    """
+    Puts the entry to the cache once the session is committed; rows inserted by a transaction that is rolled back
+    never get to the cache.
+    """
+
+    session.info.setdefault(_PENDING_KEY, list()).append((cache, key, obj_id, obj))
+
+
+def get_objects(session: Session, cache: DimensionCache, model, key_attr_name: str, ids: Iterable[int]) -> Dict:
+    """
+    Read-through lookup of domain objects by ID: IDs missing in the cache are loaded by a single query.
+
+    Returns: domain objects by ID; unknown IDs are not in the result
+    """
+
+    ids = set(obj_id for obj_id in ids if obj_id is not None)
+
+    out = cache.get_objects(ids)
+    missing_ids = [obj_id for obj_id in ids if obj_id not in out]
+    if len(missing_ids) > 0:
+        for row in session.query(model).filter(model.id.in_(missing_ids)):
+            obj = row.to_domain_object()
+            cache.put(getattr(row, key_attr_name), row.id, obj)
+            out[row.id] = obj
+
+    return out
+
+
+def clear():
+    with _CACHES_LOCK:
+        for caches in _CACHES.values():
+            for cache in (caches.teams, caches.match_states, caches.tournaments, caches.streamers, caches.chats,
+                          caches.users):
+                cache.clear()
+
+
+def _get_unexpired(entries: OrderedDict, key: Hashable, now: float):
+    """
+    Returns: value of the entry (it becomes the most recently used one) or None if it's missed or expired
+    """
+
+    value, expires_at = entries.get(key, (None, 0.0))
+    if value is None:
+        return None
+
+    if expires_at <= now:
+        del entries[key]
+        return None
+
+    entries.move_to_end(key)
+    return value
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session: Session):
+    pending: List = session.info.pop(_PENDING_KEY, list())
+    for cache, key, obj_id, obj in pending:
+        cache.put(key, obj_id, obj)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session: Session):
+    session.info.pop(_PENDING_KEY, None)
@@ -1,104 +1,121 @@
 import datetime
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
 
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, BigInteger
-from sqlalchemy.orm import Session
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, BigInteger, DateTime, func
+from sqlalchemy.orm import Session, relationship
 
 import hltv_upcoming_events_bot.db as db
 from hltv_upcoming_events_bot import domain
-from hltv_upcoming_events_bot.db.common import Base
+from hltv_upcoming_events_bot.db.common import Base, upsert
 from hltv_upcoming_events_bot.db.match_stars import MatchStars
-from hltv_upcoming_events_bot.db.team import Team, add_team, get_team
+from hltv_upcoming_events_bot.db.team import add_teams_from_domain_objects
 
 _logger = logging.getLogger('hltv_upcoming_events_bot.db')
 
+# columns updated when a known match is parsed again
+_MUTABLE_COLUMNS = ['unix_time_utc_sec', 'team1_id', 'team2_id', 'stars', 'state_id']
+
 
 class Match(Base):
     __tablename__ = "match"
     id = Column(Integer, primary_key=True)
-    unix_time_utc_sec = Column(BigInteger, nullable=False)
+    unix_time_utc_sec = Column(BigInteger, nullable=False, index=True)
     team1_id = Column(Integer, ForeignKey("team.id"))
     team2_id = Column(Integer, ForeignKey("team.id"))
     stars = Column(Enum(MatchStars))
     state_id = Column(Integer, ForeignKey("match_state.id"))
     tournament_id = Column(Integer, ForeignKey('tournament.id'))
     url = Column(String, nullable=False, unique=True)
+    last_scraped_at = Column(DateTime, index=True)  # the latest one is the version of the scraped data
+
+    team1 = relationship('Team', foreign_keys=[team1_id])
+    team2 = relationship('Team', foreign_keys=[team2_id])
+    state = relationship('MatchState', back_populates='matches')
+    tournament = relationship('Tournament', back_populates='matches')
+    translations = relationship('Translation', back_populates='match')
 
     def __repr__(self):
         return f"Match(id={self.id!r})"
 
-    def to_domain_object(self, session: Session):
-        team1 = get_team(self.team1_id, session)
-        team2 = get_team(self.team2_id, session)
-        tournament = db.get_tournament(self.tournament_id, session)
-        match_state = db.get_match_state(self.state_id, session)
-
-        return domain.match.Match(team1=team1.to_domain_object(), team2=team2.to_domain_object(),
+    def to_domain_object(self, team1: domain.Team = None, team2: domain.Team = None,
+                         tournament: domain.Tournament = None, state: domain.MatchState = None):
+        """
+        Teams, tournament and state are taken from relationships unless they are given (e.g. from the dimension
+        cache); load them along with the match to avoid a query per relationship.
+        """
+
+        if team1 is None:
+            team1 = self.team1.to_domain_object()
+        if team2 is None:
+            team2 = self.team2.to_domain_object()
+        if tournament is None:
+            tournament = self.tournament.to_domain_object()
+        if state is None:
+            state = self.state.to_domain_object()
+
+        return domain.match.Match(team1=team1, team2=team2,
                                   time_utc=datetime.datetime.fromtimestamp(self.unix_time_utc_sec),
                                   stars=self.stars,
-                                  tournament=tournament.to_domain_object(),
-                                  state=match_state.to_domain_object(),
+                                  tournament=tournament,
+                                  state=state,
                                   url=self.url)
 
 
-def add_match_from_domain_object(match: domain.match.Match, session: Session) -> Optional[Match]:
-    team1 = Team.from_domain_object(match.team1, session)
-    team1_id = team1.id if team1 else add_team(match.team1.name, match.team1.url, session)
-
-    team2 = Team.from_domain_object(match.team2, session)
-    team2_id = team2.id if team2 else add_team(match.team2.name, match.team2.url, session)
-
-    state_name = domain.get_match_state_name(match.state)
-    state = db.match_state.get_match_state_by_name(state_name, session)
-    state_id = state.id if state else db.match_state.add_match_state(state_name, session)
+def add_matches_from_domain_objects(matches: List[domain.match.Match], session: Session) -> Dict[str, Integer]:
+    """
+    Adds matches that are not in the database yet along with their teams, states and tournaments; every kind of
+    object is resolved by a single query for all the matches. The existing matches are updated (they are parsed
+    again because their time, teams or state may be changed); their tournament is kept if the new one is unknown.
+    The session is not committed.
 
-    tournament_id = db.tournament.get_tournament_id_by_name(match.tournament.name, session)
-    if tournament_id is None:
-        tournament_id = db.tournament.add_tournament_from_domain_object(match.tournament, session)
-        if tournament_id is None:
-            tournament_id = db.tournament.get_unknown_tournament_id(session)
-            if tournament_id is None:
-                _logger.error(
-                    f'failed to add match from domain object: failed to found tournament (name={match.tournament.name})')
-                return None
+    Returns: match IDs by URL (the existing matches included)
+    """
 
-    match = add_match(team1_id, team2_id,
-                      int(datetime.datetime.timestamp(match.time_utc)), MatchStars.from_domain_object(match.stars),
-                      tournament_id, state_id, match.url, session)
+    matches = list({m.url: m for m in matches}.values())
+    if len(matches) == 0:
+        return dict()
 
-    return match
+    team_ids = add_teams_from_domain_objects([t for m in matches for t in (m.team1, m.team2)], session)
+    state_ids = db.match_state.add_match_states([domain.get_match_state_name(m.state) for m in matches], session)
+    tournament_ids = db.tournament.add_tournaments_from_domain_objects(
+        [m.tournament for m in matches if m.tournament is not None and m.tournament.name], session)
 
+    unknown_tournament_id = None
+    if any(m.tournament is None or m.tournament.name not in tournament_ids for m in matches):
+        unknown_tournament_id = db.tournament.get_unknown_tournament_id(session)
 
-def add_match(team1_id: Integer, team2_id: Integer, unix_time_sec: int, match_stars: MatchStars, tournament_id: Integer,
-              state_id: Integer, url: str, session: Session) -> Optional[Match]:
-    team1 = get_team(team1_id, session)
-    if team1 is None:
-        _logger.error(f'failed to add match because team1 (id={team1_id}) is not found')
-        return None
-
-    team2 = get_team(team2_id, session)
-    if team2 is None:
-        _logger.error(f'failed to add match because team2 (id={team2_id}) is not found')
-        return None
-
-    match = get_match_by_url(url, session)
-    if match is None:
-        match = Match(unix_time_utc_sec=unix_time_sec, team1_id=team1_id, team2_id=team2_id, stars=match_stars,
-                      state_id=state_id, tournament_id=tournament_id, url=url)
-        try:
-            session.add(match)
-            session.commit()
-            _logger.info(
-                f"Match added: team1 (id={team1.id}, name={team1.name}) vs team2 (id={team2.id}, name={team2.name}) "
-                f"with the status (id={state_id}) at {str(datetime.datetime.fromtimestamp(match.unix_time_utc_sec))}")
-            return match
-        except Exception as e:
-            _logger.error(f"Failed to add match between team1 (id={team1_id}) and team2 (id={team2_id}) at "
-                          f"{datetime.datetime.fromtimestamp(unix_time_sec)}: {e}")
-            return None
-
-    return match
+    rows = list()
+    rows_with_unknown_tournament = list()
+    for match in matches:
+        tournament_id = tournament_ids.get(match.tournament.name) if match.tournament is not None else None
+        match_rows = rows
+        if tournament_id is None:
+            tournament_id = unknown_tournament_id
+            match_rows = rows_with_unknown_tournament
+            if tournament_id is None:
+                _logger.error(f'failed to add match (url={match.url}): failed to found tournament '
+                              f'(name={match.tournament.name if match.tournament is not None else None})')
+                continue
+
+        match_rows.append({
+            'unix_time_utc_sec': int(datetime.datetime.timestamp(match.time_utc)),
+            'team1_id': team_ids.get(match.team1.name),
+            'team2_id': team_ids.get(match.team2.name),
+            'stars': MatchStars.from_domain_object(match.stars),
+            'state_id': state_ids.get(domain.get_match_state_name(match.state)),
+            'tournament_id': tournament_id,
+            'url': match.url,
+        })
+
+    changed_count = upsert(Match, rows, session, ['url'], _MUTABLE_COLUMNS + ['tournament_id']) + \
+        upsert(Match, rows_with_unknown_tournament, session, ['url'], _MUTABLE_COLUMNS)
+    if changed_count > 0:
+        _logger.info(f'{changed_count} match(es) added or updated')
+
+    urls = [row['url'] for row in rows + rows_with_unknown_tournament]
+    return {row.url: row.id for row in session.query(Match.id, Match.url).filter(Match.url.in_(urls))} \
+        if len(urls) > 0 else dict()
 
 
 # def get_match(match_id: Integer) -> Optional[Match]:
@@ -116,6 +133,25 @@ def get_match_id_by_url(match_url: str, session: Session) -> Optional[Integer]:
         return None
     return ret.id
 
+
+def get_matches_last_scraped_at_by_urls(match_urls: List[str], session: Session) -> \
+        Dict[str, Optional[datetime.datetime]]:
+    if len(match_urls) == 0:
+        return dict()
+
+    rows = session.query(Match.url, Match.last_scraped_at).filter(Match.url.in_(match_urls)).all()
+    return {row.url: row.last_scraped_at for row in rows}
+
+
+def get_matches_version(session: Session) -> Optional[datetime.datetime]:
+    """
+    Returns: time the latest batch of parsed matches was written (None if there are no parsed matches); it changes
+        every time the parser writes matches and their translations, so it's used to check if the data derived from
+        them is still up-to-date (by a single index lookup)
+    """
+
+    return session.query(func.max(Match.last_scraped_at)).scalar()
+
 # def get_upcoming_matches_in_datetime_interval(start_from: int, until_to: int, session) -> List[Match]:
 #     return session.query(Match)\
 #         .filter(and_(start_from < Match.unix_time_utc_sec, Match.unix_time_utc_sec < until_to))\
@@ -1,11 +1,12 @@
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
 
 from sqlalchemy import Column, Integer, String
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, relationship
 
 import hltv_upcoming_events_bot.domain as domain
-from hltv_upcoming_events_bot.db.common import Base
+from hltv_upcoming_events_bot.db import dimension_cache
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
 
 _logger = logging.getLogger('hltv_upcoming_events_bot.db')
 
@@ -15,6 +16,8 @@ class MatchState(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False, unique=True)
 
+    matches = relationship('Match', back_populates='state')
+
     def __repr__(self):
         return f"MatchState(id={self.id!r}, name={self.name!r})"
 
@@ -48,6 +51,43 @@ def add_match_state(name: str, session: Session) -> Optional[Integer]:
     return match_state.id
 
 
+def add_match_states(names: List[str], session: Session) -> Dict[str, Integer]:
+    """
+    Adds match states that are not in the database yet; the session is not committed.
+
+    Returns: match state IDs by name (the existing states included)
+    """
+
+    cache = dimension_cache.get_caches(session).match_states
+
+    names = list(set(names))
+    out = cache.get_ids(names)
+
+    missing_names = [name for name in names if name not in out]
+    if len(missing_names) == 0:
+        return out
+
+    added_count = insert_or_ignore(MatchState, [{'name': name} for name in missing_names], session, ['name'])
+    if added_count > 0:
+        _logger.info(f'{added_count} match state(s) added')
+
+    for match_state in session.query(MatchState).filter(MatchState.name.in_(missing_names)):
+        out[match_state.name] = match_state.id
+        dimension_cache.put_after_commit(session, cache, match_state.name, match_state.id,
+                                         match_state.to_domain_object())
+
+    return out
+
+
+def get_match_states_by_ids(match_state_ids: List[Integer], session: Session) -> Dict[Integer, domain.MatchState]:
+    """
+    Returns: domain objects by match state ID (from the cache if possible)
+    """
+
+    return dimension_cache.get_objects(session, dimension_cache.get_caches(session).match_states, MatchState, 'name',
+                                       match_state_ids)
+
+
 def get_match_state(match_state_id: Integer, session: Session) -> Optional[MatchState]:
     return session.get(MatchState, match_state_id)
 
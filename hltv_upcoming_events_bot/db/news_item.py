@@ -1,13 +1,17 @@
 import datetime
 import logging
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
 
-from sqlalchemy import Column, Integer, String, DateTime, Float, desc, and_
+from sqlalchemy import Column, Integer, String, DateTime, Float, Index, bindparam, column, desc, and_, func, update, \
+    values
 from sqlalchemy.orm import Session
 
-from hltv_upcoming_events_bot import domain
-from hltv_upcoming_events_bot.db.common import Base
+import hltv_upcoming_events_bot.db as db
+from hltv_upcoming_events_bot import config, domain
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
+from hltv_upcoming_events_bot.db.chat import Chat
 from hltv_upcoming_events_bot.db.news_item_sent import NewsItemSent
+from hltv_upcoming_events_bot.db.outbox import STATUS_CLAIMED, STATUS_PENDING, OutboxMessage, OutboxNewsItem
 
 _logger = logging.getLogger('hltv_upcoming_events_bot.db')
 
@@ -21,6 +25,12 @@ class NewsItem(Base):
     url = Column(String, nullable=False, unique=True)
     comment_count = Column(Integer)
     comment_avg_hour = Column(Float)
+    hotness = Column(Float)  # see get_hotness(); it's recomputed every time comment counts are updated
+
+    __table_args__ = (
+        # recent news items are filtered by time and ordered by hotness
+        Index('ix_news_item_date_time_utc_hotness', 'date_time_utc', 'hotness'),
+    )
 
     def __repr__(self):
         return f"News_item(id={self.id!r}, datetime={self.date_time_utc}, title={self.title!r}, url={self.url!r})"
@@ -31,6 +41,23 @@ class NewsItem(Base):
                                comment_avg_hour=self.comment_avg_hour)
 
 
+def get_hotness(comment_count: Optional[int], date_time_utc: datetime.datetime,
+                now_utc: datetime.datetime = None) -> float:
+    """
+    Returns: comments per hour decayed by age, so a fresh discussed news item goes above an old one with more
+        comments (NEWS_HOTNESS_GRAVITY sets how fast news items get cold)
+    """
+
+    if now_utc is None:
+        now_utc = datetime.datetime.now(datetime.timezone.utc)
+    if date_time_utc.tzinfo is None:
+        date_time_utc = date_time_utc.replace(tzinfo=datetime.timezone.utc)
+
+    age_hour = max((now_utc - date_time_utc).total_seconds() / 3600, 0.0)
+
+    return (comment_count or 0) / (age_hour + config.NEWS_HOTNESS_AGE_OFFSET_HOURS) ** config.NEWS_HOTNESS_GRAVITY
+
+
 def add_news_item_from_domain_object(news_item: domain.NewsItem, session: Session) -> Optional[NewsItem]:
     return add_news_item(news_item.date_time_utc, news_item.title, news_item.short_desc, news_item.url,
                          news_item.comment_count, news_item.comment_avg_hour, session)
@@ -41,7 +68,8 @@ def add_news_item(date_time_utc: datetime.date, title: str, short_description: s
     news_item = get_news_item_by_url(url, session)
     if news_item is None:
         news_item = NewsItem(date_time_utc=date_time_utc, title=title, short_desc=short_description, url=url,
-                             comment_count=comment_count, comment_avg_hour=comment_avg_hour)
+                             comment_count=comment_count, comment_avg_hour=comment_avg_hour,
+                             hotness=get_hotness(comment_count, date_time_utc))
         try:
             session.add(news_item)
             # session.commit()
@@ -54,6 +82,111 @@ def add_news_item(date_time_utc: datetime.date, title: str, short_description: s
     return news_item
 
 
+def add_news_items_from_domain_objects(news_items: List[domain.NewsItem], session: Session) -> int:
+    """
+    Adds news items with a single INSERT ... ON CONFLICT DO NOTHING; the existing ones (by URL) are kept as is.
+    The session is not committed.
+
+    Returns: number of added news items
+    """
+
+    now_utc = datetime.datetime.now(datetime.timezone.utc)
+    rows = list({n.url: {'date_time_utc': n.date_time_utc, 'title': n.title, 'short_desc': n.short_desc, 'url': n.url,
+                         'comment_count': n.comment_count, 'comment_avg_hour': n.comment_avg_hour,
+                         'hotness': get_hotness(n.comment_count, n.date_time_utc, now_utc)}
+                 for n in news_items}.values())
+    return insert_or_ignore(NewsItem, rows, session, ['url'])
+
+
+def update_news_item_comment_counts(news_items_by_id: Dict[Integer, domain.NewsItem], session: Session) -> int:
+    """
+    Updates comment counters of the news items with one executemany UPDATE; short description is updated only if
+    it's set (it's not parsed again for the known news items). The session is not committed.
+
+    Returns: number of news items to update
+    """
+
+    if len(news_items_by_id) == 0:
+        return 0
+
+    # bound parameter names must differ from the column names
+    statement = update(NewsItem) \
+        .where(NewsItem.id == bindparam('news_item_id')) \
+        .values(comment_count=bindparam('new_comment_count'),
+                comment_avg_hour=bindparam('new_comment_avg_hour'),
+                short_desc=func.coalesce(bindparam('new_short_desc'), NewsItem.short_desc))
+
+    session.execute(statement, [{'news_item_id': news_item_id, 'new_comment_count': n.comment_count,
+                                 'new_comment_avg_hour': n.comment_avg_hour, 'new_short_desc': n.short_desc}
+                                for news_item_id, n in news_items_by_id.items()])
+
+    return len(news_items_by_id)
+
+
+def update_news_items_hotness(since_time_utc: datetime.datetime, session: Session) -> int:
+    """
+    Recomputes hotness of the news items published since the time (it decays with age even if comment counts are
+    the same) with one executemany UPDATE; the session is not committed.
+
+    Returns: number of updated news items
+    """
+
+    now_utc = datetime.datetime.now(datetime.timezone.utc)
+    rows = [{'news_item_id': row.id, 'new_hotness': get_hotness(row.comment_count, row.date_time_utc, now_utc)}
+            for row in session.query(NewsItem.id, NewsItem.comment_count, NewsItem.date_time_utc)
+            .filter(NewsItem.date_time_utc >= since_time_utc)]
+
+    if len(rows) == 0:
+        return 0
+
+    session.execute(update(NewsItem).where(NewsItem.id == bindparam('news_item_id'))
+                    .values(hotness=bindparam('new_hotness')), rows)
+
+    return len(rows)
+
+
+def update_news_item_comment_counts_by_urls(news_items: List[domain.NewsItem], session: Session) -> int:
+    """
+    Updates comment counters and hotness of the stored news items by URL; unknown URLs are skipped. PostgreSQL gets
+    a single UPDATE ... FROM (VALUES ...) statement, the other databases get one executemany UPDATE. The session is
+    not committed.
+
+    Returns: number of updated news items
+    """
+
+    now_utc = datetime.datetime.now(datetime.timezone.utc)
+    rows = list({n.url: {'news_item_url': n.url, 'new_comment_count': n.comment_count,
+                         'new_comment_avg_hour': n.comment_avg_hour,
+                         'new_hotness': get_hotness(n.comment_count, n.date_time_utc, now_utc)}
+                 for n in news_items}.values())
+
+    if len(rows) == 0:
+        return 0
+
+    if session.get_bind().dialect.name == 'postgresql':
+        changes = values(column('news_item_url', String), column('new_comment_count', Integer),
+                         column('new_comment_avg_hour', Float), column('new_hotness', Float), name='changes') \
+            .data([(row['news_item_url'], row['new_comment_count'], row['new_comment_avg_hour'], row['new_hotness'])
+                   for row in rows])
+
+        statement = update(NewsItem) \
+            .where(NewsItem.url == changes.c.news_item_url) \
+            .values(comment_count=changes.c.new_comment_count,
+                    comment_avg_hour=changes.c.new_comment_avg_hour,
+                    hotness=changes.c.new_hotness)
+
+        return max(session.execute(statement).rowcount, 0)
+
+    # bound parameter names must differ from the column names
+    statement = update(NewsItem) \
+        .where(NewsItem.url == bindparam('news_item_url')) \
+        .values(comment_count=bindparam('new_comment_count'),
+                comment_avg_hour=bindparam('new_comment_avg_hour'),
+                hotness=bindparam('new_hotness'))
+
+    return max(session.execute(statement, rows).rowcount, 0)
+
+
 def get_news_item(news_item_id: Integer, session: Session) -> Optional[NewsItem]:
     return session.get(NewsItem, news_item_id)
 
@@ -62,47 +195,88 @@ def get_news_item_by_url(url: str, session: Session) -> Optional[NewsItem]:
     return session.query(NewsItem).filter(NewsItem.url == url).first()
 
 
+def get_news_item_ids_by_urls(urls: List[str], session: Session) -> Dict[str, Integer]:
+    if len(urls) == 0:
+        return dict()
+
+    return {row.url: row.id for row in session.query(NewsItem.id, NewsItem.url).filter(NewsItem.url.in_(urls))}
+
+
+def get_news_item_urls_with_short_desc(urls: List[str], session: Session) -> List[str]:
+    """
+    Returns: URLs of the stored news items that have short description
+    """
+
+    if len(urls) == 0:
+        return list()
+
+    return [row.url for row in session.query(NewsItem.url).filter(NewsItem.url.in_(urls),
+                                                                  NewsItem.short_desc.isnot(None))]
+
+
 def get_recent_news_items(since_time_utc: datetime.datetime, max_count: int, session: Session) -> List[NewsItem]:
     return session.query(NewsItem) \
         .filter(NewsItem.date_time_utc >= since_time_utc) \
-        .order_by(desc(NewsItem.comment_avg_hour)) \
+        .order_by(desc(NewsItem.hotness)) \
         .limit(max_count)
 
 
 def get_recent_news_items_for_chat(chat_id: Integer, since_time_utc: datetime.datetime, max_count: int,
                                    session: Session) -> List[NewsItem]:
-    rows = session.query(NewsItem) \
-        .outerjoin(NewsItemSent) \
-        .order_by(desc(NewsItem.comment_avg_hour)) \
-        .filter(and_(NewsItem.date_time_utc >= since_time_utc)) \
-        .add_entity(NewsItemSent) \
-        .all()
+    """
+    Returns: the hottest recent news items that are not sent to the chat yet
+    """
 
-    out = list()
+    is_sent_to_chat = session.query(NewsItemSent.id) \
+        .filter(and_(NewsItemSent.chat_id == chat_id, NewsItemSent.news_item_id == NewsItem.id)) \
+        .exists()
 
-    cur_news_item = None
-    cur_news_item_sent_for_chat = False
-    for row in rows:
-        if cur_news_item is None:
-            cur_news_item = row.NewsItem
-        elif row.NewsItem.id != cur_news_item.id:
-            if not cur_news_item_sent_for_chat and cur_news_item is not None:
-                out.append(cur_news_item)
-                if len(out) == max_count:
-                    return out
-
-            cur_news_item = row.NewsItem
-            cur_news_item_sent_for_chat = False
-
-        if row.NewsItemSent is not None and row.NewsItemSent.chat_id == chat_id:
-            cur_news_item_sent_for_chat = True
+    return session.query(NewsItem) \
+        .filter(and_(NewsItem.date_time_utc >= since_time_utc, ~is_sent_to_chat)) \
+        .order_by(desc(NewsItem.hotness)) \
+        .limit(max_count) \
+        .all()
 
-    if not cur_news_item_sent_for_chat and cur_news_item is not None:
-        out.append(cur_news_item)
-        if len(out) == max_count:
-            return out
 
-    return out
+def get_recent_news_items_for_subscribers(since_time_utc: datetime.datetime, max_count: int, session: Session) -> \
+        List[Tuple[Chat, NewsItem]]:
+    """
+    The same as get_recent_news_items_for_chat, but for every subscribed chat at once (single query).
+
+    Returns: (chat, news item) pairs ordered by chat, the hottest news items first; chats without unsent
+        news items are missed. News items waiting in the outbox for the chat are not returned either.
+    """
+
+    subscribed_chat_ids = session.query(db.subscriber.Subscriber.chat_id).distinct().subquery()
+
+    is_sent_to_chat = session.query(NewsItemSent.id) \
+        .filter(and_(NewsItemSent.chat_id == subscribed_chat_ids.c.chat_id,
+                     NewsItemSent.news_item_id == NewsItem.id)) \
+        .exists()
+
+    is_queued_for_chat = session.query(OutboxNewsItem.outbox_id) \
+        .join(OutboxMessage, OutboxMessage.id == OutboxNewsItem.outbox_id) \
+        .filter(and_(OutboxNewsItem.news_item_id == NewsItem.id,
+                     OutboxMessage.chat_id == subscribed_chat_ids.c.chat_id,
+                     OutboxMessage.status.in_([STATUS_PENDING, STATUS_CLAIMED]))) \
+        .exists()
+
+    ranked = session.query(subscribed_chat_ids.c.chat_id.label('chat_id'),
+                           NewsItem.id.label('news_item_id'),
+                           func.row_number().over(partition_by=subscribed_chat_ids.c.chat_id,
+                                                  order_by=(desc(NewsItem.hotness), NewsItem.id))
+                           .label('rank')) \
+        .select_from(subscribed_chat_ids) \
+        .join(NewsItem, NewsItem.date_time_utc >= since_time_utc) \
+        .filter(and_(~is_sent_to_chat, ~is_queued_for_chat)) \
+        .subquery()
+
+    return session.query(Chat, NewsItem) \
+        .join(ranked, ranked.c.chat_id == Chat.id) \
+        .join(NewsItem, NewsItem.id == ranked.c.news_item_id) \
+        .filter(ranked.c.rank <= max_count) \
+        .order_by(Chat.id, ranked.c.rank) \
+        .all()
 
 
 def update_news_item(news_item_id: Integer, date_time_utc: datetime.date, title: str, short_description: str,
@@ -128,6 +302,8 @@ def update_news_item(news_item_id: Integer, date_time_utc: datetime.date, title:
                 setattr(news_item, change[1], change[0])
                 changed_props.append((old_value, change[0]))
 
+    news_item.hotness = get_hotness(news_item.comment_count, news_item.date_time_utc)
+
     updated_props_str = ', '.join([f'{p[0]} -> {p[1]}' for p in changed_props]) if len(
         changed_props) > 0 else 'no changes'
 
@@ -1,11 +1,11 @@
 import datetime
 import logging
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
-from sqlalchemy import Column, Integer, ForeignKey, UniqueConstraint, and_, DateTime
+from sqlalchemy import Column, Integer, ForeignKey, UniqueConstraint, and_, DateTime, Index
 from sqlalchemy.orm import Session
 
-from hltv_upcoming_events_bot.db.common import Base
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
 
 _logger = logging.getLogger('hltv_upcoming_events_bot.db')
 
@@ -14,6 +14,8 @@ class NewsItemSent(Base):
     __tablename__ = "news_item_sent"
     __table_args__ = (
         UniqueConstraint('news_item_id', 'chat_id', name='unique_news_item_id_and_chat_id'),
+        # news items not sent to the chat yet are looked up by chat
+        Index('ix_news_item_sent_chat_id_news_item_id', 'chat_id', 'news_item_id'),
     )
     id = Column(Integer, primary_key=True)
     news_item_id = Column(Integer, ForeignKey('news_item.id'))
@@ -44,6 +46,19 @@ Optional[Integer]:
     return news_item_sent.id
 
 
+def add_news_items_sent(news_item_and_chat_ids: List[Tuple[Integer, Integer]], sent_time_utc: datetime.datetime,
+                        session: Session) -> int:
+    """
+    Adds sent marks with a single multi-row insert; the existing ones are kept as is. The session is not committed.
+
+    Returns: number of added sent marks
+    """
+
+    rows = [{'news_item_id': news_item_id, 'chat_id': chat_id, 'sent_time_utc': sent_time_utc}
+            for news_item_id, chat_id in set(news_item_and_chat_ids)]
+    return insert_or_ignore(NewsItemSent, rows, session, ['news_item_id', 'chat_id'])
+
+
 def get_news_item_sent_all(Integer, session: Session) -> List[NewsItemSent]:
     return session \
         .query(NewsItemSent) \
@@ -0,0 +1,199 @@
+import datetime
+import logging
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint, and_, func, or_
+from sqlalchemy.orm import Session
+
+from hltv_upcoming_events_bot import domain
+from hltv_upcoming_events_bot.db.chat import Chat
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
+
+_logger = logging.getLogger('hltv_upcoming_events_bot.db')
+
+STATUS_PENDING = 'pending'  # not sent yet or failed to be sent and waits for another attempt
+STATUS_CLAIMED = 'claimed'  # being sent by a worker
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'  # no attempts left
+
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (
+        # the same message is never put to the outbox twice for the same schedule slot
+        UniqueConstraint('chat_id', 'payload_hash', 'slot', name='outbox_chat_id_payload_hash_slot_key'),
+        # messages to send are looked up by status
+        Index('ix_outbox_status_id', 'status', 'id'),
+    )
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, ForeignKey('chat.id'), nullable=False)
+    payload_hash = Column(String(64), nullable=False)
+    slot = Column(String, nullable=False)
+    text = Column(String, nullable=False)
+    status = Column(String(16), nullable=False, default=STATUS_PENDING)
+    attempt_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False)
+    claimed_at = Column(DateTime)
+    done_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"OutboxMessage(id={self.id!r}, chat_id={self.chat_id!r}, slot={self.slot!r}, status={self.status!r})"
+
+
+class OutboxNewsItem(Base):
+    """
+    News item listed in a message; it's marked as sent to the chat when the message is delivered.
+    """
+
+    __tablename__ = "outbox_news_item"
+    __table_args__ = (
+        # news items waiting in the outbox are skipped when news for subscribers are selected
+        Index('ix_outbox_news_item_news_item_id', 'news_item_id'),
+    )
+    outbox_id = Column(Integer, ForeignKey('outbox.id'), primary_key=True)
+    news_item_id = Column(Integer, ForeignKey('news_item.id'), primary_key=True)
+
+    def __repr__(self):
+        return f"OutboxNewsItem(outbox_id={self.outbox_id!r}, news_item_id={self.news_item_id!r})"
+
+
+def add_outbox_messages(rows: List[Dict], created_at: datetime.datetime, session: Session) -> int:
+    """
+    Adds messages (dicts with chat_id, payload_hash, slot and text) with a single INSERT ... ON CONFLICT DO NOTHING;
+    messages already put to the outbox for the same slot are skipped. The session is not committed.
+
+    Returns: number of added messages
+    """
+
+    rows = [dict(row, status=STATUS_PENDING, attempt_count=0, created_at=created_at) for row in rows]
+    return insert_or_ignore(OutboxMessage, rows, session, ['chat_id', 'payload_hash', 'slot'])
+
+
+def get_outbox_message_ids(slot: str, chat_ids: List[Integer], session: Session) -> \
+        Dict[Tuple[Integer, str], Integer]:
+    """
+    Returns: IDs of the messages put to the outbox for the slot by (chat ID, payload hash)
+    """
+
+    if len(chat_ids) == 0:
+        return dict()
+
+    rows = session \
+        .query(OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.payload_hash) \
+        .filter(and_(OutboxMessage.slot == slot, OutboxMessage.chat_id.in_(chat_ids)))
+    return {(row.chat_id, row.payload_hash): row.id for row in rows}
+
+
+def add_outbox_news_items(outbox_and_news_item_ids: List[Tuple[Integer, Integer]], session: Session) -> int:
+    """
+    Links news items to the messages they are listed in; the existing links are kept as is. The session is not
+    committed.
+
+    Returns: number of added links
+    """
+
+    rows = [{'outbox_id': outbox_id, 'news_item_id': news_item_id}
+            for outbox_id, news_item_id in set(outbox_and_news_item_ids)]
+    return insert_or_ignore(OutboxNewsItem, rows, session, ['outbox_id', 'news_item_id'])
+
+
+def get_outbox_news_item_and_chat_ids(outbox_message_ids: List[Integer], session: Session) -> \
+        List[Tuple[Integer, Integer]]:
+    """
+    Returns: (news item ID, chat ID) pairs for the news items listed in the messages
+    """
+
+    if len(outbox_message_ids) == 0:
+        return list()
+
+    rows = session \
+        .query(OutboxNewsItem.news_item_id, OutboxMessage.chat_id) \
+        .join(OutboxMessage, OutboxMessage.id == OutboxNewsItem.outbox_id) \
+        .filter(OutboxNewsItem.outbox_id.in_(outbox_message_ids))
+    return [(row.news_item_id, row.chat_id) for row in rows]
+
+
+def claim_outbox_messages(limit: int, claimed_at: datetime.datetime, claim_timeout: datetime.timedelta,
+                          retry_delay: datetime.timedelta, session: Session) -> List[domain.OutboxMessage]:
+    """
+    Claims pending messages for sending and commits the session. Rows locked by the other workers are skipped
+    (FOR UPDATE SKIP LOCKED), so several workers can drain the outbox at the same time. Messages claimed longer than
+    `claim_timeout` ago are claimed again: the worker that claimed them is considered dead. Messages that failed to
+    be sent are claimed again not earlier than `retry_delay` after the previous attempt.
+
+    Returns: claimed messages in the order they were added
+    """
+
+    rows = session \
+        .query(OutboxMessage.id, Chat.telegram_id, OutboxMessage.text) \
+        .join(Chat, Chat.id == OutboxMessage.chat_id) \
+        .filter(or_(and_(OutboxMessage.status == STATUS_PENDING,
+                         or_(OutboxMessage.claimed_at.is_(None), OutboxMessage.claimed_at < claimed_at - retry_delay)),
+                    and_(OutboxMessage.status == STATUS_CLAIMED,
+                         OutboxMessage.claimed_at < claimed_at - claim_timeout))) \
+        .order_by(OutboxMessage.id) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True, of=OutboxMessage) \
+        .all()
+
+    if len(rows) > 0:
+        session \
+            .query(OutboxMessage) \
+            .filter(OutboxMessage.id.in_([row.id for row in rows])) \
+            .update({OutboxMessage.status: STATUS_CLAIMED, OutboxMessage.claimed_at: claimed_at,
+                     OutboxMessage.attempt_count: OutboxMessage.attempt_count + 1},
+                    synchronize_session=False)
+
+    session.commit()
+
+    return [domain.OutboxMessage(id=row.id, telegram_id=row.telegram_id, text=row.text) for row in rows]
+
+
+def set_outbox_messages_status(outbox_message_ids: List[Integer], status: str, done_at: datetime.datetime,
+                               session: Session) -> int:
+    """
+    Sets the status of the messages with a single UPDATE; the session is not committed.
+
+    Returns: number of updated messages
+    """
+
+    if len(outbox_message_ids) == 0:
+        return 0
+
+    return session \
+        .query(OutboxMessage) \
+        .filter(OutboxMessage.id.in_(outbox_message_ids)) \
+        .update({OutboxMessage.status: status, OutboxMessage.done_at: done_at}, synchronize_session=False)
+
+
+def release_failed_outbox_messages(outbox_message_ids: List[Integer], max_attempts: int, done_at: datetime.datetime,
+                                   session: Session) -> Tuple[int, int]:
+    """
+    Puts the messages that failed to be sent back to the outbox unless they have been tried `max_attempts` times
+    already; those are marked as failed. The session is not committed.
+
+    Returns: number of messages to retry and number of failed ones
+    """
+
+    if len(outbox_message_ids) == 0:
+        return 0, 0
+
+    retried_count = session \
+        .query(OutboxMessage) \
+        .filter(and_(OutboxMessage.id.in_(outbox_message_ids), OutboxMessage.attempt_count < max_attempts)) \
+        .update({OutboxMessage.status: STATUS_PENDING}, synchronize_session=False)
+    failed_count = session \
+        .query(OutboxMessage) \
+        .filter(and_(OutboxMessage.id.in_(outbox_message_ids), OutboxMessage.attempt_count >= max_attempts)) \
+        .update({OutboxMessage.status: STATUS_FAILED, OutboxMessage.done_at: done_at}, synchronize_session=False)
+
+    return retried_count, failed_count
+
+
+def get_outbox_status_counts(session: Session) -> Dict[str, int]:
+    """
+    Returns: number of messages by status
+    """
+
+    rows = session.query(OutboxMessage.status, func.count(OutboxMessage.id)).group_by(OutboxMessage.status)
+    return {status: count for status, count in rows}
@@ -1,11 +1,12 @@
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
 
 from sqlalchemy import Column, Integer, String
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, relationship
 
 import hltv_upcoming_events_bot.domain as domain
-from hltv_upcoming_events_bot.db.common import Base
+from hltv_upcoming_events_bot.db import dimension_cache
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
 
 _logger = logging.getLogger('hltv_upcoming_events_bot.db')
 
@@ -17,6 +18,8 @@ class Streamer(Base):
     language = Column(String, nullable=False)
     url = Column(String, nullable=False, unique=True)
 
+    translations = relationship('Translation', back_populates='streamer')
+
     def __repr__(self):
         return f"Streamer(id={self.id!r}, name={self.name!r}, language={self.language!r})"
 
@@ -24,25 +27,31 @@ class Streamer(Base):
         return domain.Streamer(name=self.name, language=self.language, url=self.url)
 
 
-def add_streamer_from_domain_object(streamer: domain.Streamer, session: Session) -> Optional[Streamer]:
-    return add_streamer(streamer.name, streamer.language, streamer.url, session)
+def add_streamers_from_domain_objects(streamers: List[domain.Streamer], session: Session) -> Dict[str, Integer]:
+    """
+    Adds streamers that are not in the database yet; the session is not committed.
 
+    Returns: streamer IDs by URL (the existing streamers included)
+    """
 
-def add_streamer(name: str, language: str, url: str, session: Session) -> Optional[Integer]:
-    streamer_id = get_streamer_id_by_url(url, session)
-    if streamer_id:
-        return streamer_id
+    cache = dimension_cache.get_caches(session).streamers
 
-    streamer = Streamer(name=name, language=language, url=url)
-    session.add(streamer)
+    rows = list({s.url: {'name': s.name, 'language': s.language, 'url': s.url} for s in streamers}.values())
+    out = cache.get_ids([row['url'] for row in rows])
 
-    try:
-        session.commit()
-        _logger.info(f"Streamer added (id={streamer.id}, name={streamer.name}, lang={streamer.language})")
-        return streamer
-    except Exception as e:
-        _logger.error(f"Failed to add streamer '{name}' with language '{language}': {e}")
-        return None
+    missing_rows = [row for row in rows if row['url'] not in out]
+    if len(missing_rows) == 0:
+        return out
+
+    added_count = insert_or_ignore(Streamer, missing_rows, session, ['url'])
+    if added_count > 0:
+        _logger.info(f'{added_count} streamer(s) added')
+
+    for streamer in session.query(Streamer).filter(Streamer.url.in_([row['url'] for row in missing_rows])):
+        out[streamer.url] = streamer.id
+        dimension_cache.put_after_commit(session, cache, streamer.url, streamer.id, streamer.to_domain_object())
+
+    return out
 
 
 def get_streamer(streamer_id: Integer, session: Session) -> Optional[Streamer]:
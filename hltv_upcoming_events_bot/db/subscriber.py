@@ -17,7 +17,7 @@ class Subscriber(Base):
     __tablename__ = "subscriber"
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("user.id"))
-    chat_id = Column(Integer, ForeignKey("chat.id"))
+    chat_id = Column(Integer, ForeignKey("chat.id"), index=True)
     subscribed_at = Column(DateTime)
 
     def __repr__(self):
@@ -65,6 +65,10 @@ def get_subscribers(session: Session) -> List[Subscriber]:
     return session.query(Subscriber).all()
 
 
+def get_subscribed_chats(session: Session) -> List[Chat]:
+    return session.query(Chat).join(Subscriber, Subscriber.chat_id == Chat.id).distinct().all()
+
+
 def get_subscriber(subscriber_id: Integer, session: Session) -> Optional[Subscriber]:
     return session.get(Subscriber, subscriber_id)
 
@@ -1,11 +1,12 @@
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
 
 from sqlalchemy import Column, Integer, String
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, relationship
 
 from hltv_upcoming_events_bot import domain
-from hltv_upcoming_events_bot.db.common import Base
+from hltv_upcoming_events_bot.db import dimension_cache
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
 
 _logger = logging.getLogger('hltv_upcoming_events_bot.db')
 
@@ -16,6 +17,10 @@ class Team(Base):
     name = Column(String, nullable=False, unique=True)
     url = Column(String)
 
+    # a team is referenced by a match either as team1 or team2
+    matches = relationship('Match', primaryjoin='or_(Team.id == Match.team1_id, Team.id == Match.team2_id)',
+                           viewonly=True)
+
     def __repr__(self):
         return f"Team(id={self.id!r}, name={self.name!r})"
 
@@ -31,20 +36,46 @@ class Team(Base):
 #     return add_team(team.name, team.url)
 
 
-def add_team(name: str, url: str, session: Session) -> Optional[Integer]:
-    team = get_team_by_name(name, session)
-    if team:
-        return team.id
+def add_teams_from_domain_objects(teams: List[domain.Team], session: Session) -> Dict[str, Integer]:
+    """
+    Adds teams that are not in the database yet; the session is not committed.
 
-    try:
-        team = Team(name=name, url=url)
-        session.add(team)
-        session.commit()
-        _logger.info(f"Team added (id={team.id}, name={team.name})")
-        return team.id
-    except Exception as e:
-        _logger.error(f"Failed to add team '{name}': {e}")
-        return None
+    Returns: team IDs by name (the existing teams included)
+    """
+
+    cache = dimension_cache.get_caches(session).teams
+
+    rows = list({t.name: {'name': t.name, 'url': t.url} for t in teams}.values())
+    out = cache.get_ids([row['name'] for row in rows])
+
+    missing_rows = [row for row in rows if row['name'] not in out]
+    if len(missing_rows) == 0:
+        return out
+
+    added_count = insert_or_ignore(Team, missing_rows, session, ['name'])
+    if added_count > 0:
+        _logger.info(f'{added_count} team(s) added')
+
+    for team in session.query(Team).filter(Team.name.in_([row['name'] for row in missing_rows])):
+        out[team.name] = team.id
+        dimension_cache.put_after_commit(session, cache, team.name, team.id, team.to_domain_object())
+
+    return out
+
+
+def get_teams_by_ids(team_ids: List[Integer], session: Session) -> Dict[Integer, domain.Team]:
+    """
+    Returns: domain objects by team ID (from the cache if possible)
+    """
+
+    return dimension_cache.get_objects(session, dimension_cache.get_caches(session).teams, Team, 'name', team_ids)
+
+
+def get_team_ids_by_names(names: List[str], session: Session) -> Dict[str, Integer]:
+    if len(names) == 0:
+        return dict()
+
+    return {row.name: row.id for row in session.query(Team.id, Team.name).filter(Team.name.in_(names))}
 
 
 def get_team(team_id: Integer, session: Session) -> Optional[Team]:
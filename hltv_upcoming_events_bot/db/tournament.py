@@ -1,11 +1,12 @@
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
 
-from sqlalchemy import Column, Integer, String
-from sqlalchemy.orm import Session
+from sqlalchemy import Column, Integer, String, or_
+from sqlalchemy.orm import Session, relationship
 
 import hltv_upcoming_events_bot.domain as domain
-from hltv_upcoming_events_bot.db.common import Base
+from hltv_upcoming_events_bot.db import dimension_cache
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
 
 _UNKNOWN_TOURNAMENT_NAME = 'Unknown'
 
@@ -19,6 +20,8 @@ class Tournament(Base):
     url = Column(String, unique=True)
     hltv_id = Column(Integer, unique=True)
 
+    matches = relationship('Match', back_populates='tournament')
+
     def __repr__(self):
         return f"Tournament(id={self.id!r}, name={self.name!r}, url={self.url!r})"
 
@@ -26,10 +29,6 @@ class Tournament(Base):
         return domain.Tournament(name=self.name, url=self.url, hltv_id=self.hltv_id)
 
 
-def add_tournament_from_domain_object(tournament: domain.Tournament, session: Session) -> Optional[Integer]:
-    return add_tournament(tournament.name, tournament.url, tournament.hltv_id, session)
-
-
 def add_tournament(name: str, url: str, hltv_id: int, session: Session) -> Optional[Integer]:
     tournament = Tournament(name=name, url=url, hltv_id=hltv_id)
     session.add(tournament)
@@ -46,6 +45,77 @@ def add_tournament(name: str, url: str, hltv_id: int, session: Session) -> Optio
     return tournament.id
 
 
+def add_tournaments_from_domain_objects(tournaments: List[domain.Tournament], session: Session) -> \
+        Dict[str, Integer]:
+    """
+    Adds tournaments that are not in the database yet; the ones found by URL or HLTV ID under another name are
+    renamed (and get the new URL) instead. The session is not committed.
+
+    Returns: tournament IDs by name (the existing tournaments included)
+    """
+
+    cache = dimension_cache.get_caches(session).tournaments
+
+    tournaments = list({t.name: t for t in tournaments}.values())
+    out = cache.get_ids([t.name for t in tournaments])
+
+    tournaments = [t for t in tournaments if t.name not in out]
+    if len(tournaments) == 0:
+        return out
+
+    names = [t.name for t in tournaments]
+    urls = [t.url for t in tournaments if t.url]
+    hltv_ids = [t.hltv_id for t in tournaments if t.hltv_id is not None]
+    existing = session.query(Tournament) \
+        .filter(or_(Tournament.name.in_(names), Tournament.url.in_(urls), Tournament.hltv_id.in_(hltv_ids))) \
+        .all()
+    existing_by_name = {t.name: t for t in existing}
+    existing_by_url = {t.url: t for t in existing if t.url}
+    existing_by_hltv_id = {t.hltv_id: t for t in existing if t.hltv_id is not None}
+
+    rows = list()
+    for t in tournaments:
+        if t.name in existing_by_name:
+            continue
+
+        # the tournament may be renamed (or moved to another URL) since it was added
+        tournament = existing_by_url.get(t.url) if t.url else None
+        if tournament is None and t.hltv_id is not None:
+            tournament = existing_by_hltv_id.get(t.hltv_id)
+
+        if tournament is not None:
+            _logger.info(f'Tournament renamed (id={tournament.id}): {tournament.name} -> {t.name}')
+            cache.invalidate(tournament.name)
+            tournament.name = t.name
+            if t.url:
+                tournament.url = t.url
+            continue
+
+        rows.append({'name': t.name, 'url': t.url, 'hltv_id': t.hltv_id})
+
+    session.flush()
+
+    added_count = insert_or_ignore(Tournament, rows, session, ['url'])
+    if added_count > 0:
+        _logger.info(f'{added_count} tournament(s) added')
+
+    for tournament in session.query(Tournament).filter(Tournament.name.in_(names)):
+        out[tournament.name] = tournament.id
+        dimension_cache.put_after_commit(session, cache, tournament.name, tournament.id,
+                                         tournament.to_domain_object())
+
+    return out
+
+
+def get_tournaments_by_ids(tournament_ids: List[Integer], session: Session) -> Dict[Integer, domain.Tournament]:
+    """
+    Returns: domain objects by tournament ID (from the cache if possible)
+    """
+
+    return dimension_cache.get_objects(session, dimension_cache.get_caches(session).tournaments, Tournament, 'name',
+                                       tournament_ids)
+
+
 def get_tournament(tournament_id: Integer, session: Session) -> Optional[Tournament]:
     return session.get(Tournament, tournament_id)
 
@@ -63,13 +133,21 @@ def get_tournament_id_by_name(name: str, session: Session) -> Optional[Integer]:
     return tournament.id
 
 
+def get_tournament_by_url(url: str, session: Session) -> Optional[Tournament]:
+    return session.query(Tournament).filter(Tournament.url == url).first()
+
+
+def get_tournament_by_url_or_hltv_id(url: str, hltv_id: Optional[int], session: Session) -> Optional[Tournament]:
+    condition = Tournament.url == url
+    if hltv_id is not None:
+        condition = or_(condition, Tournament.hltv_id == hltv_id)
+
+    return session.query(Tournament).filter(condition).first()
+
+
 # def add_unknown_tournament(session: Session = None) -> Optional[Integer]:
 #     return add_tournament(_UNKNOWN_TOURNAMENT_NAME, '', -1, session)
 
 
 def get_unknown_tournament_id(session: Session) -> Optional[Integer]:
-    tournament = get_tournament_id_by_name(_UNKNOWN_TOURNAMENT_NAME, session)
-    if tournament is not None:
-        return tournament.id
-
-    return None
+    return get_tournament_id_by_name(_UNKNOWN_TOURNAMENT_NAME, session)
@@ -1,10 +1,11 @@
 import logging
-from typing import Optional, List
+from typing import List, Tuple
 
-from sqlalchemy import Column, Integer, ForeignKey, and_
-from sqlalchemy.orm import Session
+from sqlalchemy import Column, Integer, ForeignKey, UniqueConstraint, and_
+from sqlalchemy.orm import Session, contains_eager, joinedload, relationship
 
-from hltv_upcoming_events_bot.db.common import Base
+import hltv_upcoming_events_bot.db as db
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
 
 _logger = logging.getLogger('hltv_upcoming_events_bot.db')
 
@@ -15,6 +16,11 @@ class Translation(Base):
     match_id = Column(Integer, ForeignKey('match.id'))
     streamer_id = Column(Integer, ForeignKey('streamer.id'))
 
+    match = relationship('Match', back_populates='translations')
+    streamer = relationship('Streamer', back_populates='translations')
+
+    __table_args__ = (UniqueConstraint('match_id', 'streamer_id', name='translation_match_id_streamer_id_key'),)
+
     def __repr__(self):
         return f"Translation(id={self.id!r}, match_id={self.match_id!r}, streamer_id={self.streamer_id!r})"
 
@@ -30,22 +36,16 @@ class Translation(Base):
 #     return add_translation(trans.streamer_name, trans.language.name, trans.url)
 
 
-def add_translation(match_id: Integer, streamer_id: Integer, session: Session) -> Optional[Integer]:
-    translation_id = get_translation(match_id, streamer_id, session)
-    if translation_id is not None:
-        return translation_id
+def add_translations(match_and_streamer_ids: List[Tuple[Integer, Integer]], session: Session) -> int:
+    """
+    Adds translations that are not in the database yet; the session is not committed.
 
-    translation = Translation(match_id=match_id, streamer_id=streamer_id)
-    session.add(translation)
+    Returns: number of added translations
+    """
 
-    try:
-        session.commit()
-        _logger.info(f"Translation added (id={translation.id}, match_id={translation.match_id},"
-                     f" streamer_id={translation.streamer_id})")
-        return translation.id
-    except Exception as e:
-        _logger.error(f"Failed to add translation for match (id='{match_id}') and streamer (id='{streamer_id}'): {e}")
-        return None
+    rows = [{'match_id': match_id, 'streamer_id': streamer_id}
+            for match_id, streamer_id in set(match_and_streamer_ids)]
+    return insert_or_ignore(Translation, rows, session, ['match_id', 'streamer_id'])
 
 
 def get_translations_by_match_id(match_id: Integer, session: Session) -> List[Translation]:
@@ -55,13 +55,17 @@ def get_translations_by_match_id(match_id: Integer, session: Session) -> List[Tr
         .all()
 
 
-def get_translation(match_id: Integer, streamer_id: Integer, session: Session) -> Optional[Integer]:
-    translation = session \
-        .query(Translation) \
-        .filter(and_(Translation.match_id == match_id, Translation.streamer_id == streamer_id)) \
-        .first()
-
-    if translation is None:
-        return None
+def get_translations_in_period(start_from: int, until_to: int, session: Session) -> List[Translation]:
+    """
+    Returns: translations of matches that start within the period along with their matches and streamers, loaded
+        by a single query; ordered by match time. Teams, tournaments and states are not loaded (they are mostly
+        cached, see get_teams_by_ids etc.)
+    """
 
-    return translation.id
+    return session \
+        .query(Translation) \
+        .join(Translation.match) \
+        .filter(and_(start_from < db.Match.unix_time_utc_sec, db.Match.unix_time_utc_sec < until_to)) \
+        .options(contains_eager(Translation.match), joinedload(Translation.streamer)) \
+        .order_by(db.Match.unix_time_utc_sec, db.Match.id, Translation.id) \
+        .all()
@@ -1,12 +1,13 @@
 import logging
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 from sqlalchemy import Boolean, Column, Integer, String, BigInteger
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session
 
 from hltv_upcoming_events_bot import domain
-from hltv_upcoming_events_bot.db.common import Base
+from hltv_upcoming_events_bot.db import dimension_cache
+from hltv_upcoming_events_bot.db.common import Base, insert_or_ignore
 
 _logger = logging.getLogger('hltv_upcoming_events_bot.db')
 
@@ -51,6 +52,37 @@ def add_user(telegram_id: int, username: str, first_name: str, last_name: str, i
     return match.id
 
 
+def add_users_from_domain_objects(users: List[domain.User], session: Session) -> Dict[int, Integer]:
+    """
+    Adds users that are not in the database yet; the session is not committed.
+
+    Returns: user IDs by Telegram ID (the existing users included)
+    """
+
+    cache = dimension_cache.get_caches(session).users
+
+    rows = list({u.telegram_id: {'telegram_id': u.telegram_id, 'username': u.username, 'first_name': u.first_name,
+                                 'last_name': u.last_name, 'is_bot': u.is_bot, 'is_premium': u.is_premium,
+                                 'language_code': u.language_code}
+                 for u in users}.values())
+    out = cache.get_ids([row['telegram_id'] for row in rows])
+
+    missing_rows = [row for row in rows if row['telegram_id'] not in out]
+    if len(missing_rows) == 0:
+        return out
+
+    added_count = insert_or_ignore(User, missing_rows, session, ['telegram_id'])
+    if added_count > 0:
+        _logger.info(f'{added_count} user(s) added')
+
+    telegram_ids = [row['telegram_id'] for row in missing_rows]
+    for row in session.query(User.id, User.telegram_id).filter(User.telegram_id.in_(telegram_ids)):
+        out[row.telegram_id] = row.id
+        dimension_cache.put_after_commit(session, cache, row.telegram_id, row.id)
+
+    return out
+
+
 def get_user(user_id: Integer, session: Session) -> Optional[User]:
     return session.get(User, user_id)
 
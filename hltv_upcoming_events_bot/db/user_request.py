@@ -1,6 +1,6 @@
 import datetime
 import logging
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, BigInteger, desc
 from sqlalchemy.orm import Session
@@ -17,7 +17,7 @@ class UserRequest(Base):
     id = Column(Integer, primary_key=True)
     chat_id = Column(Integer, ForeignKey('chat.id'))
     user_id = Column(Integer, ForeignKey('user.id'))
-    utc_time = Column(DateTime)
+    utc_time = Column(DateTime, index=True)
     telegram_utc_time = Column(DateTime)
     telegram_message_id = Column(BigInteger)
     text = Column(String)
@@ -52,5 +52,19 @@ def add_user_request(chat_id: Integer, user_id: Integer, utc_time: datetime.date
     return user_request.id
 
 
+def add_user_requests(rows: List[Dict], session: Session) -> int:
+    """
+    Adds user requests (dicts of UserRequest column values) in one batch; the session is not committed.
+
+    Returns: number of added requests
+    """
+
+    if len(rows) == 0:
+        return 0
+
+    session.execute(UserRequest.__table__.insert(), rows)
+    return len(rows)
+
+
 def get_recent_user_requests(n: int, session: Session) -> List[UserRequest]:
     return session.query(UserRequest).order_by(desc('utc_time')).limit(n)
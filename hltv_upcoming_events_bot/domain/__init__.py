@@ -4,6 +4,7 @@ from .match import Match
 from .match_stars import MatchStars
 from .match_state import MatchState, get_match_state_by_name, get_match_state_name
 from .news_item import NewsItem
+from .outbox_message import OutboxMessage
 from .streamer import Streamer
 from .team import Team
 from .tournament import Tournament
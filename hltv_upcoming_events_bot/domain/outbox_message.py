@@ -0,0 +1,8 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class OutboxMessage(object):
+    id: int
+    telegram_id: int
+    text: str
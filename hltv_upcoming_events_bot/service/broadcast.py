@@ -0,0 +1,223 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram.error import RetryAfter
+
+from hltv_upcoming_events_bot import config
+
+_logger = logging.getLogger('hltv_upcoming_events_bot.service.broadcast')
+
+
+@dataclass
+class BroadcastResult(object):
+    delivered: int = 0
+    failed: int = 0
+    retried: int = 0  # number of retries, a message may be retried several times
+    duration_sec: float = 0.0
+    delivered_chat_ids: List[int] = field(default_factory=list)
+    delivered_indexes: List[int] = field(default_factory=list)  # indexes of the delivered messages in the input list
+
+    def __str__(self) -> str:
+        return (f'{self.delivered} message(s) delivered, {self.failed} failed, {self.retried} retried '
+                f'in {self.duration_sec:.1f} sec')
+
+
+class TokenBucket(object):
+    """
+    Allows `rate_per_sec` operations per second on average and up to `capacity` operations at once.
+    """
+
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self._rate_per_sec = rate_per_sec
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token; waits until there is one.
+        """
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate_per_sec)
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait_sec = (1 - self._tokens) / self._rate_per_sec
+
+            time.sleep(wait_sec)
+
+
+@dataclass(order=True)
+class _Message(object):
+    send_at: float
+    seq: int
+    index: int = field(compare=False)
+    chat_id: int = field(compare=False)
+    text: str = field(compare=False)
+    attempt_count: int = field(default=0, compare=False)
+
+
+class _Broadcast(object):
+    def __init__(self, messages: List[Tuple[int, str]], send_func: Callable[[int, str], bool], rate_limit: TokenBucket,
+                 chat_interval_sec: float, max_retries: int, on_done: Optional[Callable[[int, bool], None]]):
+        self._send_func = send_func
+        self._on_done = on_done
+        self._rate_limit = rate_limit
+        self._chat_interval_sec = chat_interval_sec
+        self._max_retries = max_retries
+
+        self._seq = itertools.count()
+        now = time.monotonic()
+        self._queue = [_Message(now, next(self._seq), i, chat_id, text) for i, (chat_id, text) in enumerate(messages)]
+        heapq.heapify(self._queue)
+        self._pending_count = len(self._queue)
+        self._chat_send_at: Dict[int, float] = dict()
+        self._cond = threading.Condition()
+
+        self.result = BroadcastResult()
+
+    def run_worker(self):
+        while True:
+            message = self._take()
+            if message is None:
+                return
+
+            self._rate_limit.acquire()
+            self._send(message)
+
+    def _take(self):
+        """
+        Returns: the next message that can be sent right now (waits for it); None if all messages are processed
+        """
+
+        with self._cond:
+            while True:
+                if self._pending_count == 0:
+                    return None
+
+                if len(self._queue) == 0:
+                    # the rest of the messages are being sent by the other workers; some of them may be requeued
+                    self._cond.wait()
+                    continue
+
+                now = time.monotonic()
+                message = self._queue[0]
+                if message.send_at > now:
+                    self._cond.wait(message.send_at - now)
+                    continue
+
+                heapq.heappop(self._queue)
+
+                chat_send_at = self._chat_send_at.get(message.chat_id, 0.0)
+                if chat_send_at > now:
+                    # too soon for this chat; let the other chats go first
+                    self._put(message, chat_send_at)
+                    continue
+
+                self._chat_send_at[message.chat_id] = now + self._chat_interval_sec
+                return message
+
+    def _send(self, message: _Message):
+        try:
+            is_delivered = self._send_func(message.chat_id, message.text)
+        except RetryAfter as ex:
+            self._retry(message, ex.retry_after, ex)
+            return
+        except Exception as ex:
+            _logger.error(f'failed to send message (chat_id={message.chat_id}): {ex}')
+            is_delivered = False
+
+        self._done(message, is_delivered)
+
+    def _retry(self, message: _Message, delay_sec: float, ex: Exception):
+        if message.attempt_count >= self._max_retries:
+            _logger.error(f'failed to send message (chat_id={message.chat_id}), '
+                          f'{message.attempt_count} retries done: {ex}')
+            self._done(message, False)
+            return
+
+        with self._cond:
+            _logger.warning(f'retry to send message in {delay_sec} sec (chat_id={message.chat_id}): {ex}')
+            message.attempt_count += 1
+            self.result.retried += 1
+
+            send_at = time.monotonic() + delay_sec
+            self._chat_send_at[message.chat_id] = max(self._chat_send_at.get(message.chat_id, 0.0), send_at)
+            self._put(message, send_at)
+
+    def _done(self, message: _Message, is_delivered: bool):
+        # reported before the message is counted as processed, so broadcast() doesn't return until it's recorded
+        if self._on_done is not None:
+            try:
+                self._on_done(message.index, is_delivered)
+            except Exception as ex:
+                _logger.error(f'failed to record sent message (chat_id={message.chat_id}): {ex}')
+
+        with self._cond:
+            if is_delivered:
+                self.result.delivered += 1
+                self.result.delivered_chat_ids.append(message.chat_id)
+                self.result.delivered_indexes.append(message.index)
+            else:
+                self.result.failed += 1
+
+            self._pending_count -= 1
+            self._cond.notify_all()
+
+    def _put(self, message: _Message, send_at: float):
+        message.send_at = send_at
+        message.seq = next(self._seq)
+        heapq.heappush(self._queue, message)
+        self._cond.notify_all()
+
+
+def broadcast(messages: List[Tuple[int, str]], send_func: Callable[[int, str], bool], workers: int = None,
+              rate_per_sec: float = None, chat_interval_sec: float = None, max_retries: int = None,
+              on_done: Callable[[int, bool], None] = None) -> BroadcastResult:
+    """
+    Sends messages (chat ID, text) by several workers within Telegram limits: all messages share the global rate
+    limit and messages to the same chat are sent not more often than every `chat_interval_sec`. A message is sent
+    again later if Telegram asks to retry (RetryAfter); the chat waits for the requested time.
+
+    Args:
+        send_func: returns True if the message is delivered; raises RetryAfter to retry it
+        on_done: is called by the worker as soon as a message is delivered or failed, with the index of the message
+            in `messages` and whether it's delivered
+
+    Returns: delivered, failed and retried counts
+    """
+
+    workers = workers if workers is not None else config.BROADCAST_WORKERS
+    rate_per_sec = rate_per_sec if rate_per_sec is not None else config.BROADCAST_RATE_PER_SEC
+    chat_interval_sec = chat_interval_sec if chat_interval_sec is not None else config.BROADCAST_CHAT_INTERVAL_SEC
+    max_retries = max_retries if max_retries is not None else config.BROADCAST_MAX_RETRIES
+
+    start_time = time.monotonic()
+
+    # the bucket is not filled up in advance to not hit the limit with a burst at the very start
+    state = _Broadcast(messages, send_func, TokenBucket(rate_per_sec, 1), chat_interval_sec, max_retries, on_done)
+
+    threads = [threading.Thread(target=state.run_worker, name=f'broadcast-{i}')
+               for i in range(max(1, min(workers, len(messages))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = state.result
+    result.duration_sec = time.monotonic() - start_time
+    _logger.info(f'broadcast is done: {result}')
+
+    return result
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from lxml import etree
+
+from hltv_upcoming_events_bot import config
+from hltv_upcoming_events_bot.service import lxml_utils
+
+if TYPE_CHECKING:
+    # pywebparser is imported when a browser is created only, so pages can be replayed from the corpus without it
+    from pywebparser.pywebparser import Parser
+
+try:
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+except ImportError:
+    # selenium comes along with pywebparser; without it, readiness is checked by polling the page source
+    WebDriverWait = None
+
+_logger = logging.getLogger('hltv_upcoming_events_bot.service.browser_sessions')
+
+_MANAGER: Optional['BrowserSessionManager'] = None
+_MANAGER_LOCK = threading.Lock()
+
+
+class CookieStore(object):
+    """
+    Cookies by domain (e.g. Cloudflare's cf_clearance) kept on disk between runs, so the next run doesn't have to
+    pass the challenge again.
+    """
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._cookies: Dict[str, List[Dict]] = dict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def get_domains(self) -> List[str]:
+        with self._lock:
+            return list(self._cookies.keys())
+
+    def get(self, domain_name: str) -> List[Dict]:
+        with self._lock:
+            return list(self._cookies.get(domain_name, list()))
+
+    def put(self, domain_name: str, cookies: List[Dict]):
+        with self._lock:
+            self._cookies[domain_name] = cookies
+
+    def save(self):
+        with self._lock:
+            try:
+                with open(self._filename, 'w') as f:
+                    json.dump(self._cookies, f)
+            except Exception as ex:
+                _logger.error(f'failed to save cookies (filename={self._filename}): {ex}')
+
+    def _load(self):
+        if not os.path.exists(self._filename):
+            return
+
+        try:
+            with open(self._filename, 'r') as f:
+                self._cookies = json.load(f)
+        except Exception as ex:
+            _logger.error(f'failed to load cookies (filename={self._filename}): {ex}')
+
+
+class BrowserSession(object):
+    """
+    Parser (browser) with the number of navigations done by it and cookies synchronized with the cookie store.
+    """
+
+    def __init__(self, parser: 'Parser', cookie_store: CookieStore = None):
+        self.parser = parser
+        self.navigation_count = 0
+        self._cookie_store = cookie_store
+        self._domains_with_cookies_applied = set()
+
+    def goto(self, url: str):
+        self.parser.goto(url)
+        self.navigation_count += 1
+
+    def wait_until_ready(self, ready_xpath: etree.XPath, timeout_sec: float) -> bool:
+        """
+        Waits for the element to appear on the opened page (it may be rendered by scripts after the page is loaded);
+        the DOM is polled by WebDriver, so the page is not reloaded meanwhile.
+
+        Returns: True if the element is found within the timeout
+        """
+
+        driver = _get_driver(self.parser)
+        if driver is not None and WebDriverWait is not None:
+            try:
+                WebDriverWait(driver, timeout_sec, poll_frequency=config.BROWSER_READY_POLL_SEC).until(
+                    lambda d: len(d.find_elements(By.XPATH, ready_xpath.path)) > 0)
+                return True
+            except TimeoutException:
+                return False
+
+        deadline = time.monotonic() + timeout_sec
+        while True:
+            try:
+                if len(ready_xpath(lxml_utils.parse_html(lxml_utils.get_page_source(self.parser)))) > 0:
+                    return True
+            except Exception:
+                pass
+
+            if time.monotonic() >= deadline:
+                return False
+
+            time.sleep(config.BROWSER_READY_POLL_SEC)
+
+    def apply_stored_cookies(self, url: str) -> bool:
+        """
+        Adds stored cookies of the currently opened domain to the browser (once per domain).
+
+        Returns: True if any cookie is added, so the page should be reloaded
+        """
+
+        domain_name = urlparse(url).netloc
+        driver = _get_driver(self.parser)
+        if driver is None or self._cookie_store is None or domain_name in self._domains_with_cookies_applied:
+            return False
+
+        self._domains_with_cookies_applied.add(domain_name)
+
+        cookies = self._cookie_store.get(domain_name)
+        for cookie in cookies:
+            try:
+                driver.add_cookie(cookie)
+            except Exception as ex:
+                _logger.warning(f"failed to add cookie '{cookie.get('name')}' (domain={domain_name}): {ex}")
+
+        return len(cookies) > 0
+
+    def store_cookies(self, url: str):
+        driver = _get_driver(self.parser)
+        if driver is None or self._cookie_store is None:
+            return
+
+        try:
+            self._cookie_store.put(urlparse(url).netloc, driver.get_cookies())
+        except Exception as ex:
+            _logger.warning(f'failed to get cookies from browser (url={url}): {ex}')
+
+    def get_memory_mb(self) -> Optional[float]:
+        driver = _get_driver(self.parser)
+        if driver is None:
+            return None
+
+        try:
+            # Chrome only; it's JS heap of the current page, but it grows along with the whole browser
+            return driver.execute_script('return window.performance.memory.usedJSHeapSize') / (1024 * 1024)
+        except Exception:
+            return None
+
+    def close(self):
+        driver = _get_driver(self.parser)
+        if driver is None:
+            return
+
+        try:
+            driver.quit()
+        except Exception as ex:
+            _logger.warning(f'failed to close browser: {ex}')
+
+
+class BrowserSessionManager(object):
+    """
+    Keeps browsers alive between scheduled parsing runs, so every run doesn't pay for the browser start and
+    the challenge. Sessions are grouped by profile (the way Parser is created); a session is closed instead of being
+    returned after `max_navigations` or when its memory exceeds `max_memory_mb`.
+    """
+
+    def __init__(self, max_idle_per_profile: int, max_navigations: int, max_memory_mb: int,
+                 cookie_store: CookieStore = None):
+        self._max_idle_per_profile = max_idle_per_profile
+        self._max_navigations = max_navigations
+        self._max_memory_mb = max_memory_mb
+        self._cookie_store = cookie_store
+        self._idle_sessions: Dict[str, List[BrowserSession]] = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def cookie_store(self) -> Optional[CookieStore]:
+        return self._cookie_store
+
+    @contextmanager
+    def session(self, profile: str, parser_factory: Callable[[], 'Parser']) -> Iterator[BrowserSession]:
+        with self._lock:
+            idle_sessions = self._idle_sessions.setdefault(profile, list())
+            session = idle_sessions.pop() if len(idle_sessions) > 0 else None
+
+        if session is None:
+            _logger.info(f'start new browser (profile={profile})')
+            session = BrowserSession(parser_factory(), self._cookie_store)
+
+        try:
+            yield session
+        except Exception:
+            session.close()
+            raise
+
+        self._release(profile, session)
+
+    def close(self):
+        with self._lock:
+            sessions = [s for idle_sessions in self._idle_sessions.values() for s in idle_sessions]
+            self._idle_sessions.clear()
+
+        for session in sessions:
+            session.close()
+
+        if self._cookie_store is not None:
+            self._cookie_store.save()
+
+    def _release(self, profile: str, session: BrowserSession):
+        if session.navigation_count >= self._max_navigations:
+            _logger.info(f'recycle browser (profile={profile}): {session.navigation_count} navigations done')
+            session.close()
+            return
+
+        memory_mb = session.get_memory_mb()
+        if memory_mb is not None and memory_mb > self._max_memory_mb:
+            _logger.info(f'recycle browser (profile={profile}): {memory_mb:.0f} MB used')
+            session.close()
+            return
+
+        with self._lock:
+            idle_sessions = self._idle_sessions.setdefault(profile, list())
+            if len(idle_sessions) < self._max_idle_per_profile:
+                idle_sessions.append(session)
+                return
+
+        session.close()
+
+
+def get_manager() -> BrowserSessionManager:
+    global _MANAGER
+
+    with _MANAGER_LOCK:
+        if _MANAGER is None:
+            _MANAGER = BrowserSessionManager(config.PARSER_MAX_WORKERS, config.BROWSER_MAX_NAVIGATIONS,
+                                             config.BROWSER_MAX_MEMORY_MB, CookieStore(config.COOKIES_FILENAME))
+
+        return _MANAGER
+
+
+def save_cookies():
+    # nothing to save if no browser or HTTP session has been used yet
+    manager = _MANAGER
+    if manager is not None and manager.cookie_store is not None:
+        manager.cookie_store.save()
+
+
+def close():
+    """
+    Closes all idle browsers; it's called when the process doesn't need them anymore.
+    """
+
+    global _MANAGER
+
+    with _MANAGER_LOCK:
+        manager = _MANAGER
+        _MANAGER = None
+
+    if manager is not None:
+        manager.close()
+
+
+def _get_driver(parser: 'Parser'):
+    # Parser keeps its Selenium WebDriver as `driver`; cookies and memory are not available without it
+    return getattr(parser, 'driver', None)
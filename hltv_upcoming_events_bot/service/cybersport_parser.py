@@ -1,62 +1,140 @@
+import dataclasses
 import datetime
 import logging
-import time
-from typing import List, Optional
+from typing import TYPE_CHECKING, Callable, Collection, List, Optional
 
-import pywebparser.pywebparser as pwp
+from lxml import etree
+
+from hltv_upcoming_events_bot import config
 from hltv_upcoming_events_bot.domain import NewsItem
+from hltv_upcoming_events_bot.service import browser_sessions, lxml_utils
+from hltv_upcoming_events_bot.service.fetcher import Fetcher
+from hltv_upcoming_events_bot.service.parser_pool import ParserPool
+
+if TYPE_CHECKING:
+    import pywebparser.pywebparser as pwp
 
 _BASE_URL = 'https://www.cybersport.ru/tags/cs2?sort=-publishedAt'
 _logger = logging.getLogger('hltv_upcoming_events_bot.service.cybersport_parser')
 
+# comments per hour of a just published news item are counted as if it's published that long ago
+_MIN_COMMENT_DURATION_HOUR = 1 / 60
+
+# list page
+_ARTICLES_XPATH = etree.XPath('//article')
+_LINK_XPATH = etree.XPath('./a')
+_TIME_XPATH = etree.XPath('.//time')
+_TITLE_XPATH = etree.XPath(".//h3[@class='title_nSS03']")
+_COMMENT_COUNT_XPATH = etree.XPath(".//div[@class='count_7Zuhe']")
+
+# news item page
+_PARAGRAPHS_XPATH = etree.XPath("//div[contains(@class, 'text-content')]/p")
+
+
+def parse_news_to_date(date_time: datetime.datetime = None,
+                       parser_factory: Callable[[], 'pwp.Parser'] = None, max_workers: int = None,
+                       known_urls_func: Callable[[List[str]], Collection[str]] = None) -> List[NewsItem]:
+    """
+    Parses the list page first and then pages of the news items published since `date_time` (for short
+    descriptions); article pages are independent of each other, so they are parsed in parallel by a bounded set of
+    parsers.
+
+    Args:
+        parser_factory: creates parsers instead of taking warm browsers from the session manager (e.g. ReplayParser)
+        known_urls_func: gets URLs from the list page and returns the ones which short descriptions are known
+            already; pages of these news items are not parsed and their short descriptions are None
+
+    Returns: news items in the order they are published (the latest first)
+    """
 
-def parse_news_to_date(date_time: datetime.datetime = None) -> List[NewsItem]:
     _logger.info(f'Parse news until {date_time}')
 
     if date_time is None:
         date_time = datetime.datetime(1970, 1, 1)
 
-    parser = pwp.Parser(is_fast=True, delay_func=pwp.gaussian_low_delay, use_cloudflare_bypass=True)
-    parser.goto(_BASE_URL)
-
     out = list()
+    for news_item in parse_news_list(parser_factory):
+        if news_item.date_time_utc.astimezone(datetime.timezone.utc) < date_time.replace(tzinfo=datetime.timezone.utc):
+            break
+
+        out.append(news_item)
+
+    known_urls = set(known_urls_func([n.url for n in out])) if known_urls_func is not None else set()
+    new_news_items = [n for n in out if n.url not in known_urls]
+    _logger.info(f'{len(new_news_items)} of {len(out)} news item page(s) will be parsed')
+
+    pool = ParserPool(lambda: Fetcher('cybersport_article', _create_article_parser,
+                                      parser_factory() if parser_factory is not None else None),
+                      max_workers if max_workers is not None else config.NEWS_PARSER_MAX_WORKERS)
+
+    try:
+        short_descs = pool.map(_parse_short_desc, new_news_items)
+    finally:
+        browser_sessions.save_cookies()
+
+    short_desc_by_url = {news_item.url: short_desc for news_item, short_desc in zip(new_news_items, short_descs)}
+
+    return [dataclasses.replace(news_item, short_desc=short_desc_by_url.get(news_item.url)) for news_item in out]
+
+
+def parse_news_list(parser_factory: Callable[[], 'pwp.Parser'] = None) -> List[NewsItem]:
+    """
+    Parses the list page only: it's enough to get comment counters of the news items, their pages are not loaded.
+
+    Returns: news items in the order they are published (the latest first); short descriptions are None
+    """
+
+    fetcher = Fetcher('cybersport_list', _create_list_parser, parser_factory() if parser_factory is not None else None)
+    root = lxml_utils.parse_html(fetcher.get(_BASE_URL, _ARTICLES_XPATH))
 
-    article_elems = parser.find_elements('//article')
+    article_elems = _ARTICLES_XPATH(root)
     if len(article_elems) == 0:
         _logger.error('failed to parse news: no any news item found')
-        return out
+        return list()
 
-    articles_parser = pwp.Parser(is_fast=True, delay_func=None, use_cloudflare_bypass=True)
+    return [news_item for news_item in map(_parse_article_elem, article_elems) if news_item is not None]
 
-    for article_elem in article_elems:
-        news_item = _parse_article_elem(article_elem, articles_parser)
-        if news_item is None:
-            continue
 
-        if news_item.date_time_utc.astimezone(datetime.timezone.utc) < date_time.replace(tzinfo=datetime.timezone.utc):
-            break
+def _parse_short_desc(news_item: NewsItem, articles_fetcher: Fetcher) -> Optional[str]:
+    short_desc = _parse_news_item_page(news_item.url, articles_fetcher)
+    if not short_desc:
+        _logger.warning(f'failed to parse article (url={news_item.url}): failed to get short description')
+
+    return short_desc
 
-        out.append(news_item)
 
-    return out
+def _create_list_parser() -> 'pwp.Parser':
+    import pywebparser.pywebparser as pwp
 
+    return pwp.Parser(is_fast=True, delay_func=pwp.gaussian_low_delay, use_cloudflare_bypass=True)
+
+
+def _create_article_parser() -> 'pwp.Parser':
+    import pywebparser.pywebparser as pwp
+
+    return pwp.Parser(is_fast=True, delay_func=None, use_cloudflare_bypass=True)
+
+
+def _parse_article_elem(elem: etree.ElementBase) -> Optional[NewsItem]:
+    """
+    Returns: news item from the list page; short description is filled in from the news item page later
+    """
 
-def _parse_article_elem(elem: pwp.Element, articles_parser: pwp.Parser) -> Optional[NewsItem]:
     #
     # datetime
     #
 
-    link_elem = elem.find_element('./a')
+    link_elem = lxml_utils.find_first(elem, _LINK_XPATH)
     if link_elem is None:
         _logger.error("failed to parse article: couldn't find link element")
         return None
 
-    date_elem = link_elem.find_element('.//time')
+    date_elem = lxml_utils.find_first(link_elem, _TIME_XPATH)
     if date_elem is None:
         _logger.error("failed to parse article: couldn't find time element")
         return None
 
-    date_time_value = date_elem.get_attribute('datetime')
+    date_time_value = date_elem.get('datetime')
     if not date_time_value:
         _logger.error("failed to parse article: datetime attribute is either missed in the element or it's empty")
         return None
@@ -67,12 +145,12 @@ def _parse_article_elem(elem: pwp.Element, articles_parser: pwp.Parser) -> Optio
     # title
     #
 
-    title_elem = elem.find_element(".//h3[@class='title_nSS03']")
+    title_elem = lxml_utils.find_first(elem, _TITLE_XPATH)
     if title_elem is None:
         _logger.error("failed to parse article: couldn't find title element")
         return None
 
-    title = title_elem.text
+    title = lxml_utils.get_text(title_elem)
     if not title:
         _logger.error("failed to parse article: title is empty")
         return None
@@ -81,7 +159,7 @@ def _parse_article_elem(elem: pwp.Element, articles_parser: pwp.Parser) -> Optio
     # URL
     #
 
-    url = link_elem.get_attribute('href')
+    url = lxml_utils.get_url(link_elem, 'href', _BASE_URL)
     if not url:
         _logger.error("failed to parse article: URL link is either missed in the element or it's empty")
         return None
@@ -89,7 +167,7 @@ def _parse_article_elem(elem: pwp.Element, articles_parser: pwp.Parser) -> Optio
     # to skip advertisement materials;
     # they are trying to be opened in a new tab;
     # we were stuck at such item (specifically, https://cologne2024.cybersport.ru/)
-    target = link_elem.get_attribute('target')
+    target = link_elem.get('target')
     if target and target == '_blank':
         return None
 
@@ -100,61 +178,43 @@ def _parse_article_elem(elem: pwp.Element, articles_parser: pwp.Parser) -> Optio
     comment_count = 0
     comment_avg_hour = 0.0
 
-    comment_count_elem = elem.find_element(".//div[@class='count_7Zuhe']")
+    comment_count_elem = lxml_utils.find_first(elem, _COMMENT_COUNT_XPATH)
     if comment_count_elem is None:
         _logger.warning(f'failed to parse comment count for news item (title={title}): ')
     else:
-        comment_count = int(comment_count_elem.text)
+        comment_count = int(lxml_utils.get_text(comment_count_elem))
         duration = datetime.datetime.now().astimezone(datetime.timezone.utc) - date_time_utc
-        duration_hour = duration.seconds / 3600
+        # timedelta.seconds is only the part within a day, so news items older than a day looked fresh
+        duration_hour = max(duration.total_seconds() / 3600, _MIN_COMMENT_DURATION_HOUR)
         comment_avg_hour = comment_count / duration_hour
 
-    #
-    # short description
-    #
-
-    short_desc = _parse_news_item_page(url, articles_parser)
-    if not url:
-        _logger.warning("failed to parse article: failed to get short description")
-
-    return NewsItem(date_time_utc=date_time_utc, title=title, short_desc=short_desc, url=url,
+    return NewsItem(date_time_utc=date_time_utc, title=title, short_desc=None, url=url,
                     comment_count=comment_count, comment_avg_hour=comment_avg_hour)
 
 
-def _parse_news_item_page(url: str, parser: pwp.Parser) -> Optional[str]:
+def _parse_news_item_page(url: str, fetcher: Fetcher) -> Optional[str]:
     """
+    Exceptions (e.g. a browser that died) are re-raised with the URL for ParserPool, which logs them and doesn't
+    reuse the parser; a page without the description is not an error of the parser, so None is returned then.
+
     Returns: short description or None
     """
 
     _logger.info(f'Parse news item page {url}')
 
     try:
-        found = False
-        for i in range(1, 6):
-            parser.goto(url)
-            paragraph_elems = parser.find_elements("//div[contains(@class, 'text-content')]/p")
-            if len(paragraph_elems) > 0:
-                found = True
-                break
-
-            _logger.info(f'failed to parse news item (url={url}): no paragraphs found. Wait and retry ({i})...')
-            time.sleep(3)
-
-        if not found:
+        # the fetcher waits for the paragraphs to be rendered (and reloads the page if they are not)
+        paragraph_elems = _PARAGRAPHS_XPATH(lxml_utils.parse_html(fetcher.get(url, _PARAGRAPHS_XPATH)))
+        if len(paragraph_elems) == 0:
             _logger.error(f'failed to parse news item (url={url}): no paragraphs found')
             return None
-    except Exception as ex:
-        _logger.error(f"failed to parse news item's paragraphs: {ex}")
-        return None
 
-    # takes the first paragraph
-    try:
-        short_desc = paragraph_elems[0].text
+        # takes the first paragraph
+        short_desc = lxml_utils.get_text(paragraph_elems[0])
         if not short_desc:
             _logger.error(f"failed to parse news item (url={url}): first paragraph is empty")
             return None
-    except:
-        _logger.error('!!! short_desc !!!')
-        return None
+    except Exception as ex:
+        raise Exception(f'failed to parse news item page (url={url}): {ex}') from ex
 
     return short_desc
@@ -1,8 +1,8 @@
 import datetime
+import hashlib
 import logging
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
 
-from sqlalchemy import and_
 from sqlalchemy.orm import Session, sessionmaker
 
 from hltv_upcoming_events_bot import db
@@ -13,37 +13,110 @@ from hltv_upcoming_events_bot.db.common import get_engine
 _logger = logging.getLogger('hltv_upcoming_events_bot.service.db')
 
 
-def add_match(match: domain.Match):
-    with Session(get_engine()) as session:
-        db.add_match_from_domain_object(match, session)
+def add_translations(translations: List[domain.Translation], db_engine=None) -> int:
+    """
+    Adds translations along with their matches and streamers in one transaction; every kind of object is resolved
+    by a single query for the whole list, so the number of queries doesn't depend on the number of translations.
+
+    Returns: number of added translations
+    """
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        added_count, _ = _add_translations_with_session(translations, list(), session)
+        session.commit()
+
+    _logger.info(f'{added_count} of {len(translations)} translation(s) added')
+
+    return added_count
+
+
+def add_scraped_matches(matches_with_streamers: List[Tuple[domain.Match, List[domain.Streamer]]],
+                        scraped_at: datetime.datetime, db_engine=None) -> int:
+    """
+    The same as add_translations, but for parsed match pages: the matches are marked as scraped in the same
+    transaction, so a match is never skipped by the incremental parsing if its translations failed to be written.
+    Matches without streamers are stored as well, otherwise they will be scraped every time.
+
+    Returns: number of added translations
+    """
+
+    translations = [domain.Translation(match=match, streamer=streamer)
+                    for match, streamers in matches_with_streamers for streamer in streamers]
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        added_count, match_ids = _add_translations_with_session(
+            translations, [match for match, _ in matches_with_streamers], session)
+
+        if len(match_ids) > 0:
+            session.query(db.Match) \
+                .filter(db.Match.id.in_(list(match_ids.values()))) \
+                .update({db.Match.last_scraped_at: scraped_at}, synchronize_session=False)
+
+        session.commit()
+
+    _logger.info(f'{added_count} of {len(translations)} translation(s) added; '
+                 f'{len(matches_with_streamers)} match(es) marked as scraped')
+
+    return added_count
+
+
+def _add_translations_with_session(translations: List[domain.Translation], matches: List[domain.Match],
+                                   session: Session) -> Tuple[int, Dict[str, int]]:
+    """
+    Args:
+        matches: matches to add along with the ones of the translations
+
+    Returns: number of added translations and match IDs by URL
+    """
+
+    match_ids = db.add_matches_from_domain_objects(matches + [t.match for t in translations], session)
+    streamer_ids = db.add_streamers_from_domain_objects([t.streamer for t in translations], session)
+
+    ids = list()
+    for trans in translations:
+        match_id = match_ids.get(trans.match.url)
+        streamer_id = streamer_ids.get(trans.streamer.url)
+        if match_id is None or streamer_id is None:
+            _logger.error(f'failed to add translation (match_url={trans.match.url}, '
+                          f'streamer_url={trans.streamer.url}): failed to get match or streamer ID')
+            continue
+
+        ids.append((match_id, streamer_id))
+
+    return db.add_translations(ids, session), match_ids
 
 
-def add_streamer(streamer: domain.Streamer):
+def get_matches_last_scraped_at(match_urls: List[str]) -> Dict[str, Optional[datetime.datetime]]:
+    """
+    Returns: last scraping time by match URL; matches that are not in the database are missed in the result
+    """
+
     with Session(get_engine()) as session:
-        db.add_streamer_from_domain_object(streamer, session)
+        return db.get_matches_last_scraped_at_by_urls(match_urls, session)
+
 
+def get_matches_version(db_engine=None) -> Optional[datetime.datetime]:
+    """
+    Returns: version of the parsed matches and translations (see db.get_matches_version)
+    """
 
-def add_translation(match: domain.Match, streamer: domain.Streamer):
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        return db.get_matches_version(session)
+
+
+def get_tournament_by_url(url: str, hltv_id: Optional[int] = None) -> Optional[domain.Tournament]:
     with Session(get_engine()) as session:
-        match_id = db.get_match_id_by_url(match.url, session)
-        if match_id is None:
-            match = db.add_match_from_domain_object(match, session)
-            match_id = match.id
-            if match_id is None:
-                raise Exception(
-                    f'Failed to add translation (match_url={match.url}, streamer_name={streamer.name}, '
-                    f'streamer_url={streamer.url}): Failed to get match ID (match_url={match.url})')
-
-        streamer_id = db.get_streamer_id_by_url(streamer.url, session)
-        if streamer_id is None:
-            streamer = db.add_streamer_from_domain_object(streamer, session)
-            streamer_id = streamer.id
-            if streamer_id is None:
-                raise Exception(
-                    f'Failed to add translation (match_url={match.url}, streamer_name={streamer.name}, '
-                    f'streamer_url={streamer.url}): Failed to get streamer ID (streamer_url={streamer.url})')
-
-        db.add_translation(match_id, streamer_id, session)
+        tournament = db.get_tournament_by_url_or_hltv_id(url, hltv_id, session)
+        if tournament is None:
+            return None
+
+        return tournament.to_domain_object()
 
 
 def subscribe_chat_by_telegram_id(tg_id: int) -> RetCode:
@@ -84,10 +157,45 @@ def get_users() -> List[domain.User]:
     return out
 
 
-def get_recent_user_requests(n: int) -> List[domain.UserRequest]:
+def add_user_requests(user_requests: List[domain.UserRequest], db_engine=None) -> int:
+    """
+    Adds user requests in one transaction; chats and users are resolved (and added if needed) for the whole list
+    at once, the known ones are taken from the cache without a query.
+
+    Returns: number of added requests
+    """
+
+    if len(user_requests) == 0:
+        return 0
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        chat_ids = db.add_chats_from_domain_objects([r.chat for r in user_requests], session)
+        user_ids = db.add_users_from_domain_objects([r.user for r in user_requests], session)
+
+        rows = [{'chat_id': chat_ids[r.chat.telegram_id], 'user_id': user_ids[r.user.telegram_id],
+                 'utc_time': r.utc_time, 'telegram_utc_time': r.telegram_utc_time,
+                 'telegram_message_id': r.telegram_message_id, 'text': r.text}
+                for r in user_requests]
+
+        try:
+            added_count = db.add_user_requests(rows, session)
+            session.commit()
+        except Exception as ex:
+            session.rollback()
+            _logger.error(f'failed to add {len(rows)} user request(s): {ex}')
+            return 0
+
+    return added_count
+
+
+def get_recent_user_requests(n: int, db_engine=None) -> List[domain.UserRequest]:
     out = list()
 
-    with Session(get_engine()) as session:
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
         db_user_requests = db.get_recent_user_requests(n, session)
         for db_user_req in db_user_requests:
             out.append(db_user_req.to_domain_object(session))
@@ -108,22 +216,31 @@ def get_subscribers() -> List[domain.User]:
     return out
 
 
-def get_translations_in_period(start_from: int, until_to: int) -> List[domain.Translation]:
+def get_translations_in_period(start_from: int, until_to: int, db_engine=None) -> List[domain.Translation]:
     out = list()
-    with Session(get_engine()) as session:
-        matches = session.query(db.Match).filter(
-            and_(start_from < db.Match.unix_time_utc_sec, db.Match.unix_time_utc_sec < until_to)).all()
 
-        for match in matches:
-            match_translations = db.get_translations_by_match_id(match.id, session)
-            domain_match = None
-            for trans in match_translations:
-                if domain_match is None:
-                    domain_match = match.to_domain_object(session)
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
 
-                streamer = db.get_streamer(trans.streamer_id, session)
-                domain_streamer = streamer.to_domain_object()
-                out.append(domain.Translation(domain_match, domain_streamer))
+    with session_maker() as session:
+        translations = db.get_translations_in_period(start_from, until_to, session)
+
+        # teams, tournaments and states are small tables; they are taken from the dimension cache
+        matches = [trans.match for trans in translations]
+        teams = db.get_teams_by_ids([team_id for m in matches for team_id in (m.team1_id, m.team2_id)], session)
+        tournaments = db.get_tournaments_by_ids([m.tournament_id for m in matches], session)
+        states = db.get_match_states_by_ids([m.state_id for m in matches], session)
+
+        # translations of the same match share the domain object
+        domain_matches = dict()
+        for trans in translations:
+            domain_match = domain_matches.get(trans.match_id)
+            if domain_match is None:
+                match = trans.match
+                domain_match = match.to_domain_object(teams.get(match.team1_id), teams.get(match.team2_id),
+                                                      tournaments.get(match.tournament_id), states.get(match.state_id))
+                domain_matches[trans.match_id] = domain_match
+
+            out.append(domain.Translation(domain_match, trans.streamer.to_domain_object()))
 
     return out
 
@@ -133,40 +250,75 @@ def add_news_item(news_item_domain: domain.NewsItem) -> RetCode:
         return _add_news_item_with_session(news_item_domain, session)
 
 
-def add_news_items(news_items_domain: List[domain.NewsItem]) -> RetCode:
-    with Session(get_engine()) as session:
-        added_msgs = list()
-        updated_msgs = list()
-        failed_msgs = list()
-        for news_item_domain in news_items_domain:
-            ret = _add_news_item_with_session(news_item_domain, session)
-            msg = f'    {news_item_domain.date_time_utc}, {news_item_domain.title}'
-            if ret == RetCode.OK:
-                added_msgs.append(msg)
-            elif ret == RetCode.ALREADY_EXIST:
-                ret = _update_news_item_with_session(news_item_domain, session)
-                if ret == RetCode.OK:
-                    updated_msgs.append(msg)
-                else:
-                    failed_msgs.append(msg)
-            else:
-                failed_msgs.append(msg)
+def add_news_items(news_items_domain: List[domain.NewsItem], db_engine=None) -> RetCode:
+    """
+    Adds new news items and updates comment counters of the known ones (by URL); the known news items are looked
+    up by a single query, new ones are added by a single INSERT and the counters are updated by one executemany.
+    Hotness of all the news items since the oldest given one is recomputed then, so the recent news items are
+    stored ranked.
+    """
 
-        session.commit()
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
 
-        _logger.info(f"{len(added_msgs)} news item(s) added{':' if len(added_msgs) > 0 else ''}")
-        for msg in added_msgs:
-            _logger.info(f'    {msg}')
+    with session_maker() as session:
+        news_item_ids = db.get_news_item_ids_by_urls(list({n.url for n in news_items_domain}), session)
+
+        new_news_items = [n for n in news_items_domain if n.url not in news_item_ids]
+        known_news_items_by_id = {news_item_ids[n.url]: n for n in news_items_domain if n.url in news_item_ids}
+
+        try:
+            db.add_news_items_from_domain_objects(new_news_items, session)
+            db.update_news_item_comment_counts(known_news_items_by_id, session)
+            if len(news_items_domain) > 0:
+                db.update_news_items_hotness(min(n.date_time_utc for n in news_items_domain), session)
+            session.commit()
+        except Exception as ex:
+            session.rollback()
+            _logger.error(f'failed to add {len(news_items_domain)} news item(s): {ex}')
+            return RetCode.ERROR
 
-        _logger.info(f"{len(updated_msgs)} news item(s) updated{':' if len(updated_msgs) > 0 else ''}")
-        for msg in updated_msgs:
-            _logger.info(f'    {msg}')
+    _logger.info(f"{len(new_news_items)} news item(s) added{':' if len(new_news_items) > 0 else ''}")
+    for n in new_news_items:
+        _logger.info(f'    {n.date_time_utc}, {n.title}')
 
-        _logger.info(f"{len(failed_msgs)} news item(s) failed to add{':' if len(failed_msgs) > 0 else ''}")
-        for msg in failed_msgs:
-            _logger.info(f'    {msg}')
+    _logger.info(f'{len(known_news_items_by_id)} news item(s) updated')
 
-        return RetCode.OK
+    return RetCode.OK
+
+
+def get_news_item_urls_with_short_desc(urls: List[str], db_engine=None) -> Set[str]:
+    """
+    Returns: URLs of the stored news items which short descriptions are known already (by a single query)
+    """
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        return set(db.get_news_item_urls_with_short_desc(urls, session))
+
+
+def refresh_news_item_comment_counts(news_items_domain: List[domain.NewsItem], db_engine=None) -> int:
+    """
+    Updates comment counters and hotness of the stored news items (by URL) with a single statement; news items that
+    are not stored yet are skipped.
+
+    Returns: number of updated news items or -1 on error
+    """
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        try:
+            updated_count = db.update_news_item_comment_counts_by_urls(news_items_domain, session)
+            session.commit()
+        except Exception as ex:
+            session.rollback()
+            _logger.error(f'failed to refresh comment counts of {len(news_items_domain)} news item(s): {ex}')
+            return -1
+
+    _logger.info(f'comment counts of {updated_count} of {len(news_items_domain)} news item(s) refreshed')
+
+    return updated_count
 
 
 def _add_news_item_with_session(news_item_domain: domain.NewsItem, session: Session) -> RetCode:
@@ -199,6 +351,19 @@ def _update_news_item_with_session(news_item_domain: domain.NewsItem, session: S
     return RetCode.OK
 
 
+def get_recent_news(since_time_utc: datetime.datetime, max_count: int = None, db_engine=None) -> \
+        List[domain.NewsItem]:
+    """
+    Returns: the hottest news items since the time
+    """
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        news_items = db.get_recent_news_items(since_time_utc, max_count if max_count is not None else 20, session)
+        return [news_item.to_domain_object() for news_item in news_items]
+
+
 def get_recent_news_for_chat(chat_telegram_id: int, since_time_utc: datetime.datetime, max_count: int = None,
                              db_engine=None) -> \
         List[domain.NewsItem]:
@@ -220,25 +385,199 @@ def get_recent_news_for_chat(chat_telegram_id: int, since_time_utc: datetime.dat
     return out
 
 
+def get_recent_news_for_subscribers(since_time_utc: datetime.datetime, max_count: int = None, db_engine=None) -> \
+        Dict[int, List[domain.NewsItem]]:
+    """
+    The same as get_recent_news_for_chat, but for all the subscribed chats at once; the number of queries doesn't
+    depend on the number of subscribers.
+
+    Returns: news items by chat's telegram ID; every subscribed chat is in the result (with no news items as well)
+    """
+
+    out = dict()
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        for chat in db.get_subscribed_chats(session):
+            out[chat.telegram_id] = list()
+
+        rows = db.get_recent_news_items_for_subscribers(since_time_utc, max_count if max_count is not None else 20,
+                                                        session)
+        for chat, news_item in rows:
+            out.setdefault(chat.telegram_id, list()).append(news_item.to_domain_object())
+
+    return out
+
+
+def mark_news_items_as_sent_to_chats(news_items_by_telegram_id: Dict[int, List[domain.NewsItem]],
+                                     sent_time_utc: datetime.datetime = None, db_engine=None) -> Tuple[int, int]:
+    """
+    Marks news items as sent to the chats they are listed for; news items and chats are resolved by two queries and
+    all the marks are added by a single INSERT ... ON CONFLICT DO NOTHING, so marking twice is harmless.
+
+    Returns: numbers of added marks and skipped ones (already sent, unknown news items or chats)
+    """
+
+    if sent_time_utc is None:
+        sent_time_utc = datetime.datetime.utcnow()
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        added_count, skipped_count = _add_news_items_sent(news_items_by_telegram_id, sent_time_utc, session)
+        session.commit()
+
+    _logger.info(f'{added_count} news item(s) marked as sent, {skipped_count} skipped')
+
+    return added_count, skipped_count
+
+
 def mark_news_items_as_sent(news_items_domain: List[domain.NewsItem], sent_telegram_id_list: List[int],
-                            sent_time_utc: datetime.datetime, db_engine=None):
+                            sent_time_utc: datetime.datetime = None, db_engine=None) -> Tuple[int, int]:
+    """
+    Marks every news item as sent to every chat (see mark_news_items_as_sent_to_chats).
+
+    Returns: numbers of added marks and skipped ones
+    """
+
+    return mark_news_items_as_sent_to_chats({tg_id: news_items_domain for tg_id in sent_telegram_id_list},
+                                            sent_time_utc, db_engine)
+
+
+def add_outbox_messages(messages: List[Tuple[int, str]], slot: str,
+                        news_items_by_telegram_id: Dict[int, List[domain.NewsItem]] = None,
+                        db_engine=None) -> int:
+    """
+    Puts messages (Telegram chat ID, text) to the outbox in one transaction; a message with the same text is put
+    once per chat and schedule slot, so re-running a notification for the same slot doesn't send it twice.
+    News items listed for the chats are linked to their messages: they are marked as sent only when the message
+    is delivered (see mark_outbox_messages_as_done), but they are not selected for the chat again meanwhile.
+
+    Returns: number of added messages
+    """
+
+    created_at = datetime.datetime.utcnow()
+
     session_maker = sessionmaker(db_engine if db_engine else get_engine())
 
     with session_maker() as session:
-        for news_item_domain in news_items_domain:
-            news_item = db.get_news_item_by_url(news_item_domain.url, session)
-            if news_item is None:
-                _logger.error(f'failed to mark news item as sent: no such news item (title={news_item_domain.title}, '
-                              f'url={news_item_domain.url})')
-                return
+        chat_ids = db.get_chat_ids_by_telegram_ids(list({telegram_id for telegram_id, _ in messages}), session)
+
+        rows = list()
+        message_keys = dict()
+        for telegram_id, text in messages:
+            chat_id = chat_ids.get(telegram_id)
+            if chat_id is None:
+                _logger.error(f'failed to put message to outbox (telegram_id={telegram_id}): no such chat')
+                continue
+
+            payload_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            rows.append({'chat_id': chat_id, 'payload_hash': payload_hash, 'slot': slot, 'text': text})
+            message_keys[telegram_id] = (chat_id, payload_hash)
+
+        added_count = db.add_outbox_messages(rows, created_at, session)
+        if news_items_by_telegram_id is not None:
+            _add_outbox_news_items(slot, message_keys, news_items_by_telegram_id, session)
+
+        session.commit()
+
+    _logger.info(f'{added_count} message(s) put to outbox (slot={slot}), {len(messages) - added_count} skipped')
+
+    return added_count
+
+
+def claim_outbox_messages(limit: int, claim_timeout: datetime.timedelta, retry_delay: datetime.timedelta,
+                          db_engine=None) -> List[domain.OutboxMessage]:
+    """
+    Returns: pending messages claimed for sending by the caller (see db.claim_outbox_messages)
+    """
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        return db.claim_outbox_messages(limit, datetime.datetime.utcnow(), claim_timeout, retry_delay, session)
+
+
+def mark_outbox_messages_as_done(sent_ids: List[int], failed_ids: List[int], max_attempts: int, db_engine=None):
+    """
+    Marks the delivered messages as sent along with the news items listed in them. The failed ones are put back
+    to the outbox to be sent again unless they are tried `max_attempts` times already.
+    """
+
+    done_at = datetime.datetime.utcnow()
+
+    session_maker = sessionmaker(db_engine if db_engine else get_engine())
+
+    with session_maker() as session:
+        db.set_outbox_messages_status(sent_ids, db.outbox.STATUS_SENT, done_at, session)
+        db.add_news_items_sent(db.get_outbox_news_item_and_chat_ids(sent_ids, session), done_at, session)
+        retried_count, failed_count = db.release_failed_outbox_messages(failed_ids, max_attempts, done_at, session)
+        session.commit()
+
+    if failed_count > 0:
+        _logger.error(f'{failed_count} message(s) failed to be sent {max_attempts} time(s); give up')
+    if retried_count > 0:
+        _logger.warning(f'{retried_count} message(s) failed to be sent; they will be retried')
+
+
+def _add_outbox_news_items(slot: str, message_keys: Dict[int, Tuple[int, str]],
+                           news_items_by_telegram_id: Dict[int, List[domain.NewsItem]], session: Session) -> int:
+    """
+    Args:
+        message_keys: chat ID and payload hash of the message put to the outbox by Telegram chat ID
+
+    Returns: number of news items linked to the messages
+    """
+
+    outbox_ids = db.get_outbox_message_ids(slot, list({chat_id for chat_id, _ in message_keys.values()}), session)
+    urls = list({n.url for news_items in news_items_by_telegram_id.values() for n in news_items})
+    news_item_ids = db.get_news_item_ids_by_urls(urls, session)
+
+    ids = set()
+    for telegram_id, news_items in news_items_by_telegram_id.items():
+        outbox_id = outbox_ids.get(message_keys.get(telegram_id))
+        if outbox_id is None:
+            _logger.error(f'failed to link news items to message (telegram_id={telegram_id}): no such message')
+            continue
+
+        for news_item in news_items:
+            news_item_id = news_item_ids.get(news_item.url)
+            if news_item_id is None:
+                _logger.error(f'failed to link news item to message: no such news item (title={news_item.title}, '
+                              f'url={news_item.url})')
+                continue
+
+            ids.add((outbox_id, news_item_id))
+
+    return db.add_outbox_news_items(list(ids), session)
+
+
+def _add_news_items_sent(news_items_by_telegram_id: Dict[int, List[domain.NewsItem]],
+                         sent_time_utc: datetime.datetime, session: Session) -> Tuple[int, int]:
+    urls = list({n.url for news_items in news_items_by_telegram_id.values() for n in news_items})
+    news_item_ids = db.get_news_item_ids_by_urls(urls, session)
+    chat_ids = db.get_chat_ids_by_telegram_ids(list(news_items_by_telegram_id.keys()), session)
+
+    ids = set()
+    requested_count = 0
+    for telegram_id, news_items in news_items_by_telegram_id.items():
+        requested_count += len(news_items)
+
+        chat_id = chat_ids.get(telegram_id)
+        if chat_id is None:
+            _logger.error(f'failed to mark news items as sent for chat (telegram_id={telegram_id}): no such chat')
+            continue
+
+        for news_item in news_items:
+            news_item_id = news_item_ids.get(news_item.url)
+            if news_item_id is None:
+                _logger.error(f'failed to mark news item as sent: no such news item (title={news_item.title}, '
+                              f'url={news_item.url})')
+                continue
+
+            ids.add((news_item_id, chat_id))
 
-            for sent_telegram_id in sent_telegram_id_list:
-                chat = db.get_chat_by_telegram_id(sent_telegram_id, session)
-                if chat is None:
-                    _logger.error(f'failed to mark news item as sent for chat (telegram_id={sent_telegram_id}): '
-                                  f'no such chat')
-                    continue
+    added_count = db.add_news_items_sent(list(ids), sent_time_utc, session)
 
-                # add if not added
-                if len(db.get_news_item_sent_by_news_item_id_and_chat_id(news_item.id, chat.id, session)) == 0:
-                    db.add_news_item_sent(news_item.id, chat.id, sent_time_utc, session)
+    return added_count, requested_count - added_count
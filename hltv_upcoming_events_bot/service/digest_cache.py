@@ -0,0 +1,74 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Tuple
+
+
+@dataclass
+class DigestCacheStats(object):
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+
+    def __str__(self) -> str:
+        return f'{self.hits} hit(s), {self.misses} miss(es), {self.invalidations} invalidation(s)'
+
+
+class DigestCache(object):
+    """
+    Rendered messages by key (time window, filters, timezone etc.). A message is kept until `valid_until`
+    (e.g. the start of its first match, after which the message is outdated) but not longer than `ttl_sec`.
+
+    Every message is stored along with the version of the data it's rendered from (e.g. the time the data was
+    written last time), so the message is dropped once the data changes, even if it's changed by another process.
+    invalidate() drops all the messages right away.
+    """
+
+    def __init__(self, ttl_sec: float):
+        self._ttl_sec = ttl_sec
+        self._messages: Dict[Hashable, Tuple[str, Hashable, float]] = dict()
+        self._stats = DigestCacheStats()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable = None) -> Optional[str]:
+        """
+        Args:
+            version: current version of the data; the message rendered from another version is outdated
+        """
+
+        with self._lock:
+            msg, msg_version, expires_at = self._messages.get(key, (None, None, 0.0))
+            if msg is not None and msg_version != version:
+                self._stats.invalidations += 1
+                msg = None
+
+            if msg is None or expires_at <= time.time():
+                self._messages.pop(key, None)
+                self._stats.misses += 1
+                return None
+
+            self._stats.hits += 1
+            return msg
+
+    def put(self, key: Hashable, msg: str, valid_until: float = None, version: Hashable = None):
+        """
+        Args:
+            valid_until: UNIX time after which the message is outdated; None if it's valid within TTL
+            version: version of the data the message is rendered from (it must be got before the data)
+        """
+
+        expires_at = time.time() + self._ttl_sec
+        if valid_until is not None:
+            expires_at = min(expires_at, valid_until)
+
+        with self._lock:
+            self._messages[key] = (msg, version, expires_at)
+
+    def invalidate(self):
+        with self._lock:
+            self._messages.clear()
+            self._stats.invalidations += 1
+
+    def get_stats(self) -> DigestCacheStats:
+        with self._lock:
+            return DigestCacheStats(**vars(self._stats))
@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import cloudscraper
+from lxml import etree
+
+from hltv_upcoming_events_bot import config
+from hltv_upcoming_events_bot.service import browser_sessions, lxml_utils, page_corpus
+from hltv_upcoming_events_bot.service.browser_sessions import BrowserSession
+
+if TYPE_CHECKING:
+    from pywebparser.pywebparser import Parser
+
+_logger = logging.getLogger('hltv_upcoming_events_bot.service.fetcher')
+
+# signs of the anti-bot challenge page instead of the requested one
+_CHALLENGE_MARKERS = ['challenge-platform', 'cf-chl-', 'cf_chl_opt', '<title>Just a moment...</title>']
+
+_HTTP_SESSION: Optional[cloudscraper.CloudScraper] = None
+_HTTP_SESSION_LOCK = threading.Lock()
+
+_STATS: Dict[str, 'DomainFetchStats'] = dict()
+_STATS_LOCK = threading.Lock()
+
+
+class FetchTier(Enum):
+    HTTP = 1
+    BROWSER = 2
+
+
+@dataclass
+class DomainFetchStats(object):
+    http_ok: int = 0
+    http_failed: int = 0
+    browser_ok: int = 0
+    browser_failed: int = 0
+    http_failures_in_row: int = 0
+    http_skipped_count: int = 0  # requests since the HTTP tier was tried last time
+    browser_loads: int = 0  # page loads by browser, reloads included
+    browser_ready_sec: float = 0.0  # total time pages loaded by browser took to get the expected element
+
+    @property
+    def browser_avg_ready_sec(self) -> float:
+        return self.browser_ready_sec / self.browser_loads if self.browser_loads > 0 else 0.0
+
+
+class Fetcher(object):
+    """
+    Gets page HTML with a plain HTTP request first and escalates to the browser (Parser) only when the response is
+    a challenge page or doesn't contain the expected element. Domains where plain HTTP keeps failing go to the
+    browser straight away; HTTP is re-checked for them from time to time.
+
+    Browsers are taken from the process-wide session manager when needed (they are created by `parser_factory` and
+    are kept warm between runs under `profile` name) unless the parser is given explicitly. Recorded pages
+    (ReplayParser) are never requested by HTTP. The fetcher is not thread-safe: every worker owns its own one
+    (see ParserPool), while the HTTP session and statistics are shared.
+    """
+
+    def __init__(self, profile: str, parser_factory: Callable[[], 'Parser'], parser: 'Parser' = None):
+        self._profile = profile
+        self._parser_factory = parser_factory
+        self._session = BrowserSession(parser) if parser is not None else None
+        self._use_http = config.FETCHER_USE_HTTP and not isinstance(parser, page_corpus.ReplayParser)
+
+    def get(self, url: str, ready_xpath: etree.XPath) -> str:
+        """
+        Args:
+            ready_xpath: element that must be on the page; page without it is considered incomplete
+
+        Returns: page HTML; it's returned from the browser even if the expected element is not found there
+        """
+
+        domain_name = urlparse(url).netloc
+
+        if self._use_http and _is_http_tier_preferred(domain_name):
+            html = _get_by_http(url, ready_xpath)
+            _update_stats(domain_name, FetchTier.HTTP, html is not None)
+            if html is not None:
+                page_corpus.record(url, html)
+                return html
+
+            _logger.info(f'failed to get page by HTTP (url={url}); use browser')
+
+        if self._session is not None:
+            html, is_complete = _get_by_browser(self._session, url, ready_xpath)
+        else:
+            with browser_sessions.get_manager().session(self._profile, self._parser_factory) as session:
+                html, is_complete = _get_by_browser(session, url, ready_xpath)
+
+        _update_stats(domain_name, FetchTier.BROWSER, is_complete)
+        page_corpus.record(url, html)
+
+        return html
+
+
+def get_stats() -> Dict[str, DomainFetchStats]:
+    with _STATS_LOCK:
+        return {domain_name: DomainFetchStats(**vars(stats)) for domain_name, stats in _STATS.items()}
+
+
+def log_stats():
+    for domain_name, stats in get_stats().items():
+        _logger.info(f'{domain_name}: HTTP {stats.http_ok} ok / {stats.http_failed} failed, '
+                     f'browser {stats.browser_ok} ok / {stats.browser_failed} failed '
+                     f'({stats.browser_loads} page load(s), {stats.browser_avg_ready_sec:.2f} sec to get ready)')
+
+
+def _get_http_session() -> cloudscraper.CloudScraper:
+    global _HTTP_SESSION
+
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None:
+            _HTTP_SESSION = cloudscraper.create_scraper()
+
+            # reuse cookies got by browsers during the previous runs
+            cookie_store = browser_sessions.get_manager().cookie_store
+            if cookie_store is not None:
+                for domain_name in cookie_store.get_domains():
+                    for cookie in cookie_store.get(domain_name):
+                        _HTTP_SESSION.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'),
+                                                  path=cookie.get('path', '/'))
+
+        return _HTTP_SESSION
+
+
+def _get_by_http(url: str, ready_xpath: etree.XPath) -> Optional[str]:
+    try:
+        response = _get_http_session().get(url, timeout=config.FETCHER_HTTP_TIMEOUT_SEC)
+    except Exception as ex:
+        _logger.debug(f'HTTP request failed (url={url}): {ex}')
+        return None
+
+    if response.status_code != 200:
+        _logger.debug(f'HTTP request failed (url={url}): status code {response.status_code}')
+        return None
+
+    html = response.text
+    if any(marker in html for marker in _CHALLENGE_MARKERS):
+        _logger.debug(f'HTTP request failed (url={url}): challenge page is returned')
+        return None
+
+    if not _is_page_complete(html, ready_xpath):
+        _logger.debug(f'HTTP request failed (url={url}): page is incomplete')
+        return None
+
+    return html
+
+
+def _get_by_browser(session: BrowserSession, url: str, ready_xpath: etree.XPath) -> Tuple[str, bool]:
+    # recorded pages don't change, so neither waiting nor reloading makes them complete
+    is_replay = isinstance(session.parser, page_corpus.ReplayParser)
+    timeout_sec = 0 if is_replay else config.BROWSER_READY_TIMEOUT_SEC
+
+    is_ready = _load_by_browser(session, url, ready_xpath, timeout_sec)
+
+    if not is_ready and session.apply_stored_cookies(url):
+        # the challenge may be passed already by the previous run
+        is_ready = _load_by_browser(session, url, ready_xpath, timeout_sec)
+
+    for i in range(0 if is_replay else config.BROWSER_MAX_RELOADS):
+        if is_ready:
+            break
+
+        _logger.info(f'page is not ready in {config.BROWSER_READY_TIMEOUT_SEC} sec (url={url}); reload ({i + 1})')
+        is_ready = _load_by_browser(session, url, ready_xpath, timeout_sec)
+
+    html = lxml_utils.get_page_source(session.parser)
+    is_complete = _is_page_complete(html, ready_xpath)
+
+    if is_complete:
+        session.store_cookies(url)
+
+    return html, is_complete
+
+
+def _load_by_browser(session: BrowserSession, url: str, ready_xpath: etree.XPath, timeout_sec: float) -> bool:
+    """
+    Opens the page and waits for the expected element rather than reloading the page right away.
+
+    Returns: True if the element is on the page
+    """
+
+    session.goto(url)
+
+    start_time = time.perf_counter()
+    is_ready = session.wait_until_ready(ready_xpath, timeout_sec)
+    ready_sec = time.perf_counter() - start_time
+
+    _logger.debug(f"page {'is ready' if is_ready else 'is not ready'} in {ready_sec:.2f} sec (url={url})")
+
+    with _STATS_LOCK:
+        stats = _STATS.setdefault(urlparse(url).netloc, DomainFetchStats())
+        stats.browser_loads += 1
+        stats.browser_ready_sec += ready_sec
+
+    return is_ready
+
+
+def _is_page_complete(html: str, ready_xpath: etree.XPath) -> bool:
+    try:
+        return len(ready_xpath(lxml_utils.parse_html(html))) > 0
+    except Exception:
+        return False
+
+
+def _is_http_tier_preferred(domain_name: str) -> bool:
+    with _STATS_LOCK:
+        stats = _STATS.setdefault(domain_name, DomainFetchStats())
+        if stats.http_failures_in_row < config.FETCHER_HTTP_MAX_FAILURES_IN_ROW:
+            return True
+
+        # HTTP keeps failing for this domain (most likely, it's protected by the challenge now);
+        # check it from time to time only
+        stats.http_skipped_count += 1
+        if stats.http_skipped_count >= config.FETCHER_HTTP_PROBE_INTERVAL:
+            stats.http_skipped_count = 0
+            return True
+
+        return False
+
+
+def _update_stats(domain_name: str, tier: FetchTier, is_ok: bool):
+    with _STATS_LOCK:
+        stats = _STATS.setdefault(domain_name, DomainFetchStats())
+        if tier == FetchTier.HTTP:
+            if is_ok:
+                stats.http_ok += 1
+                stats.http_failures_in_row = 0
+            else:
+                stats.http_failed += 1
+                stats.http_failures_in_row += 1
+        else:
+            if is_ok:
+                stats.browser_ok += 1
+            else:
+                stats.browser_failed += 1
@@ -1,26 +1,70 @@
 import datetime
 import logging
 import re
-from typing import List, Optional, Tuple
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+from lxml import etree
 
 import hltv_upcoming_events_bot.domain as domain
 from hltv_upcoming_events_bot import config
 from hltv_upcoming_events_bot.domain.streamer import Streamer
-from pywebparser.pywebparser import Parser
+from hltv_upcoming_events_bot.service import browser_sessions, fetcher as fetcher_service, lxml_utils
+from hltv_upcoming_events_bot.service.fetcher import Fetcher
+from hltv_upcoming_events_bot.service.parser_pool import ParserPool
+
+if TYPE_CHECKING:
+    from pywebparser.pywebparser import Parser
 
+_PARSER_PROFILE = 'hltv'
 _logger = logging.getLogger('hltv_upcoming_events_bot.service.hltv_parser')
 
 
-def _parse_match_page(url: str, parser: Parser = None) -> Optional[Tuple[domain.Match, List[domain.Streamer]]]:
-    parser.goto(url)
+#
+# XPath expressions are compiled once and applied to the page source (lxml); the page source is got
+# by plain HTTP request if possible, the browser is used for navigation otherwise
+#
+
+# main page
+_UPCOMING_MATCHES_XPATH = etree.XPath("//h1[contains(@class, 'todaysMatches')]/following-sibling::div/a")
+_TEAM1_XPATH = etree.XPath(".//div[@class='teamrow'][1]/span")
+_TEAM2_XPATH = etree.XPath(".//div[@class='teamrow'][2]/span")
+_PLACEHOLDER_XPATH = etree.XPath("./div[@class='placeholderrow']")
+_STARS_XPATH = etree.XPath(".//div")
+_TIME_XPATH = etree.XPath(".//div/div[@class='middleExtra']")
+
+# match page
+_TOURNAMENT_LINK_XPATH = etree.XPath("//div[@class='timeAndEvent']/div[contains(@class, 'event')]/a")
+# some elements can be hidden, but that's not a problem as long as
+# they contain 'stream-box' property anyway
+_STREAMS_XPATH = etree.XPath(
+    "//div[@class='streams']/div[contains(@class, 'stream-box') and not(contains(@class, 'hltv-live'))]")
+_STREAM_NAME_XPATH = etree.XPath("./div[contains(@class, 'stream-box-embed')]")
+_STREAM_COUNTRY_FLAG_XPATH = etree.XPath("./img")
+_STREAM_EXTERNAL_LINK_XPATH = etree.XPath(".//div[contains(@class, 'external-stream')]/a")
+
+# tournament page
+_TOURNAMENT_NAME_XPATH = etree.XPath("//h1[@class='event-hub-title']")
+_FEATURED_PLAYOFF_MATCH_NAME_XPATH = etree.XPath("//div[contains(@class, 'featured-playoff-match-name')]")
+_TOURNAMENT_PAGE_READY_XPATH = etree.XPath(
+    "//h1[@class='event-hub-title'] | //div[contains(@class, 'featured-playoff-match-name')]")
+
+
+def _parse_match_page(url: str, fetcher: Fetcher) -> Optional[Tuple[domain.Match, List[domain.Streamer]]]:
+    return _extract_match_page(fetcher.get(url, _TOURNAMENT_LINK_XPATH), url)
 
-    tournament_name_elem = parser.find_element("//div[@class='timeAndEvent']/div[contains(@class, 'event')]/a")
-    if not tournament_name_elem:
+
+def _extract_match_page(html: str, url: str) -> Optional[Tuple[domain.Match, List[domain.Streamer]]]:
+    root = lxml_utils.parse_html(html)
+
+    tournament_name_elem = lxml_utils.find_first(root, _TOURNAMENT_LINK_XPATH)
+    if tournament_name_elem is None:
         _logger.error(f"failed to parse match page (url={url}) for getting tournament name: "
                       f"no such element (tournament name)")
         return None
 
-    tournament_url = tournament_name_elem.get_attribute('href')
+    tournament_url = lxml_utils.get_url(tournament_name_elem, 'href', url)
 
     #
     # get translations
@@ -28,31 +72,30 @@ def _parse_match_page(url: str, parser: Parser = None) -> Optional[Tuple[domain.
 
     streamers = list()
 
-    # some elements can be hidden, but that's not a problem as long as
-    # they contain 'stream-box' property anyway
-    streams_elems = parser.find_elements(
-        "//div[@class='streams']/div[contains(@class, 'stream-box') and not(contains(@class, 'hltv-live'))]")
-
-    for stream_elem in streams_elems:
-        stream_name_elem = stream_elem.find_element("./div[contains(@class, 'stream-box-embed')]")
-        if not stream_name_elem:
+    for stream_elem in _STREAMS_XPATH(root):
+        stream_name_elem = lxml_utils.find_first(stream_elem, _STREAM_NAME_XPATH)
+        if stream_name_elem is None:
             _logger.warning(f"failed to parse match page (url={url}) for getting translations")
             continue
 
-        streamer_name = stream_name_elem.text
+        streamer_name = lxml_utils.get_text(stream_name_elem)
+
+        country_flag_image_elem = lxml_utils.find_first(stream_name_elem, _STREAM_COUNTRY_FLAG_XPATH)
+        if country_flag_image_elem is None:
+            raise Exception(f'failed to parse match page (url={url}) for getting translation country '
+                            f'(streamer={streamer_name}): no such element (country flag)')
 
-        country_flag_image_elem = stream_name_elem.find_element("./img")
-        country = country_flag_image_elem.get_attribute('alt')
+        country = country_flag_image_elem.get('alt')
 
-        external_link_name_elem = stream_elem.find_element(".//div[contains(@class, 'external-stream')]/a")
-        if external_link_name_elem:
-            url = external_link_name_elem.get_attribute('href')
+        external_link_name_elem = lxml_utils.find_first(stream_elem, _STREAM_EXTERNAL_LINK_XPATH)
+        if external_link_name_elem is not None:
+            stream_url = lxml_utils.get_url(external_link_name_elem, 'href', url)
         else:
             # there is no external link; check if embedded link exists (it's usually
             # used for YouTube translations)
-            url = stream_name_elem.get_attribute('data-stream-embed')
+            stream_url = stream_name_elem.get('data-stream-embed')
 
-        streamers.append(Streamer(name=streamer_name, language=country, url=url))
+        streamers.append(Streamer(name=streamer_name, language=country, url=stream_url))
 
     match = domain.Match(domain.Team(''), domain.Team(''), datetime.datetime.utcnow(), domain.MatchStars.ZERO,
                          domain.Tournament(url=tournament_url), domain.MatchState.UNKNOWN, '')
@@ -60,61 +103,204 @@ def _parse_match_page(url: str, parser: Parser = None) -> Optional[Tuple[domain.
     return match, streamers
 
 
-def _parse_tournament_page(url: str, parser: Parser = None) -> Optional[domain.Tournament]:
-    parser.goto(url)
+def _parse_tournament_page(url: str, fetcher: Fetcher) -> Optional[domain.Tournament]:
+    return _extract_tournament_page(fetcher.get(url, _TOURNAMENT_PAGE_READY_XPATH), url)
 
-    name_elem = parser.find_element("//h1[@class='event-hub-title']")
-    if not name_elem:
+
+def _extract_tournament_page(html: str, url: str) -> Optional[domain.Tournament]:
+    root = lxml_utils.parse_html(html)
+
+    name_elem = lxml_utils.find_first(root, _TOURNAMENT_NAME_XPATH)
+    if name_elem is None:
         # try to parse as featured playoff match name
-        name_elem = parser.find_element("//div[contains(@class, 'featured-playoff-match-name')]")
-        if not name_elem:
+        name_elem = lxml_utils.find_first(root, _FEATURED_PLAYOFF_MATCH_NAME_XPATH)
+        if name_elem is None:
             _logger.error(f"failed to parse tournament page: no such element (name)")
             return None
 
-    name = name_elem.text
+    name = lxml_utils.get_text(name_elem)
 
+    hltv_id = _parse_tournament_hltv_id(url)
+    if hltv_id is None:
+        _logger.error(f"failed to parse tournament page: failed to parse URL for getting HLTV ID")
+        return None
+
+    return domain.Tournament(name, url, hltv_id)
+
+
+def _parse_tournament_hltv_id(url: str) -> Optional[int]:
     hltv_id = re.search(r'hltv.org\/events\/(\d+)\/', url)
     if not hltv_id or len(hltv_id.groups()) != 1:
-        _logger.error(f"failed to parse tournament page: failed to parse URL for getting HLTV ID")
         return None
 
-    return domain.Tournament(name, url, int(hltv_id.groups()[0]))
+    return int(hltv_id.groups()[0])
+
+
+class TournamentResolver(object):
+    """
+    Gets tournament by its page URL. Looks into in-process cache first, then calls lookup function (usually it's
+    the database lookup), and parses the tournament page only if the tournament is still unknown.
+
+    Cached entries live for `ttl_sec`; an expired entry is refreshed from the tournament page (not from the lookup
+    function) so renamed tournaments get their new names.
+    """
+
+    def __init__(self, lookup_func: Callable[[str, Optional[int]], Optional[domain.Tournament]] = None,
+                 ttl_sec: int = None):
+        self._lookup_func = lookup_func
+        self._ttl_sec = ttl_sec if ttl_sec is not None else config.TOURNAMENT_CACHE_TTL_SEC
+        self._cache: Dict[str, Tuple[domain.Tournament, float]] = dict()
+        self._lock = threading.Lock()
+
+    def resolve(self, url: str, fetcher: Fetcher) -> Optional[domain.Tournament]:
+        with self._lock:
+            cached = self._cache.get(url)
+
+        if cached is not None and time.monotonic() - cached[1] < self._ttl_sec:
+            return cached[0]
+
+        if cached is None and self._lookup_func is not None:
+            try:
+                tournament = self._lookup_func(url, _parse_tournament_hltv_id(url))
+            except Exception as ex:
+                _logger.error(f'failed to look up tournament (url={url}): {ex}')
+                tournament = None
+
+            if tournament is not None:
+                self._put(url, tournament)
+                return tournament
+
+        tournament = _parse_tournament_page(url, fetcher)
+        if tournament is not None:
+            self._put(url, tournament)
+
+        return tournament
+
+    def _put(self, url: str, tournament: domain.Tournament):
+        with self._lock:
+            self._cache[url] = (tournament, time.monotonic())
+
 
+def get_upcoming_translations(parser: 'Parser' = None, max_workers: int = None,
+                              tournament_resolver: TournamentResolver = None,
+                              parser_factory: Callable[[], 'Parser'] = None) -> Iterator[domain.Translation]:
+    """
+    Returns: translations of every match as soon as its page is parsed
+    """
 
-def get_upcoming_translations(parser: Parser = None) -> List[domain.Translation]:
-    if not parser:
-        parser = Parser(is_fast=True, use_cloudflare_bypass=True)
-        # parser = Parser(is_fast=False, use_delay=True)
+    for match, streamers in iter_upcoming_matches(parser, max_workers, tournament_resolver,
+                                                  parser_factory=parser_factory):
+        for streamer in streamers:
+            yield domain.Translation(match=match, streamer=streamer)
 
-    parser.goto(config.BASE_URL)
 
-    match_elem_list = parser.find_elements("//h1[contains(@class, 'todaysMatches')]/following-sibling::div/a")
+def parse_upcoming_matches(parser: 'Parser' = None, max_workers: int = None,
+                           tournament_resolver: TournamentResolver = None,
+                           match_filter: Callable[[List[domain.Match]], List[domain.Match]] = None,
+                           parser_factory: Callable[[], 'Parser'] = None) -> \
+        List[Tuple[domain.Match, List[domain.Streamer]]]:
+    """
+    Returns: parsed matches along with their streamers (see iter_upcoming_matches)
+    """
+
+    return list(iter_upcoming_matches(parser, max_workers, tournament_resolver, match_filter, parser_factory))
+
+
+def iter_upcoming_matches(parser: 'Parser' = None, max_workers: int = None,
+                          tournament_resolver: TournamentResolver = None,
+                          match_filter: Callable[[List[domain.Match]], List[domain.Match]] = None,
+                          parser_factory: Callable[[], 'Parser'] = None) -> \
+        Iterator[Tuple[domain.Match, List[domain.Streamer]]]:
+    """
+    Parses upcoming matches from the main page and then pages of these matches (tournament + streamers).
+
+    Args:
+        parser: the only parser to use (match pages are parsed one by one then) unless `parser_factory` is set
+        match_filter: gets all the upcoming matches and returns the ones which pages must be parsed; all the matches
+            are parsed if not set
+        parser_factory: creates parsers for match pages instead of taking warm browsers from the session manager
+            (e.g. ReplayParser)
+
+    Returns: parsed matches along with their streamers in the order their pages are parsed; match without streamers
+        is returned as well
+    """
+
+    if parser is None and parser_factory is not None:
+        parser = parser_factory()
+
+    fetcher = Fetcher(_PARSER_PROFILE, _create_parser, parser)
+
+    if not tournament_resolver:
+        # no shared resolver; still, it saves page loads for the matches of the same tournament
+        tournament_resolver = TournamentResolver()
+
+    matches = _parse_upcoming_matches(fetcher)
+    if match_filter is not None:
+        matches = match_filter(matches)
+
+    # now, fill in tournaments + streamers; match pages are independent of each other, so they are
+    # parsed in parallel by a bounded set of parsers
+    if parser_factory is None and parser is not None:
+        # no other browser is started for the caller that gives its own parser
+        pool = ParserPool(lambda: fetcher, 1)
+    else:
+        fetcher_factory = _create_fetcher if parser_factory is None else \
+            (lambda: Fetcher(_PARSER_PROFILE, parser_factory, parser_factory()))
+        pool = ParserPool(fetcher_factory, max_workers if max_workers is not None else config.PARSER_MAX_WORKERS)
+
+    try:
+        for parsed_match in pool.imap_unordered(
+                lambda match, match_fetcher: _parse_match(match, match_fetcher, tournament_resolver), matches):
+            if parsed_match is not None:
+                yield parsed_match
+    finally:
+        fetcher_service.log_stats()
+        browser_sessions.save_cookies()
+
+
+def _create_parser() -> 'Parser':
+    from pywebparser.pywebparser import Parser
+
+    return Parser(is_fast=True, use_cloudflare_bypass=True)
+    # return Parser(is_fast=False, use_delay=True)
+
+
+def _create_fetcher() -> Fetcher:
+    return Fetcher(_PARSER_PROFILE, _create_parser)
+
+
+def _parse_upcoming_matches(fetcher: Fetcher) -> List[domain.Match]:
+    return _extract_upcoming_matches(fetcher.get(config.BASE_URL, _UPCOMING_MATCHES_XPATH), config.BASE_URL)
+
+
+def _extract_upcoming_matches(html: str, page_url: str) -> List[domain.Match]:
+    root = lxml_utils.parse_html(html)
 
     matches = list()
 
     # parse every match
-    for match_elem in match_elem_list:
-        team1_elem = match_elem.find_element(".//div[@class='teamrow'][1]/span")
-        team2_elem = match_elem.find_element(".//div[@class='teamrow'][2]/span")
-        if not team1_elem or not team2_elem:
-            placeholder_elem = match_elem.find_element("./div[@class='placeholderrow']")
-            if not placeholder_elem:
+    for match_elem in _UPCOMING_MATCHES_XPATH(root):
+        team1_elem = lxml_utils.find_first(match_elem, _TEAM1_XPATH)
+        team2_elem = lxml_utils.find_first(match_elem, _TEAM2_XPATH)
+        if team1_elem is None or team2_elem is None:
+            placeholder_elem = lxml_utils.find_first(match_elem, _PLACEHOLDER_XPATH)
+            if placeholder_elem is None:
                 _logger.error(
-                    f"failed to parse nor team1 or team2 row elements or placeholder row element (url={parser.url}): no such element(s)")
+                    f"failed to parse nor team1 or team2 row elements or placeholder row element (url={page_url}): no such element(s)")
             continue
 
-        div_elem = match_elem.find_element(".//div")
-        stars_count = int(div_elem.get_attribute('stars'))
+        div_elem = lxml_utils.find_first(match_elem, _STARS_XPATH)
+        stars_count = int(div_elem.get('stars'))
 
-        time_elem = match_elem.find_element(".//div/div[@class='middleExtra']")
-        if not time_elem:
+        time_elem = lxml_utils.find_first(match_elem, _TIME_XPATH)
+        if time_elem is None:
             # match is already in progress
             continue
 
         # time is stored in microseconds
-        time_utc = int(time_elem.get_attribute('data-unix')) / 1000
+        time_utc = int(time_elem.get('data-unix')) / 1000
 
-        match_url = match_elem.get_attribute('href')
+        match_url = lxml_utils.get_url(match_elem, 'href', page_url)
 
         #
         # TOURNAMENTS + STREAMERS
@@ -122,28 +308,32 @@ def get_upcoming_translations(parser: Parser = None) -> List[domain.Translation]
         # tournaments & translations will be parsed later as long as we need to stay at the current page to
         # iterate over all upcoming matches
         #
-        match = domain.Match(domain.Team(team1_elem.text), domain.Team(team2_elem.text),
+        match = domain.Match(domain.Team(lxml_utils.get_text(team1_elem)),
+                             domain.Team(lxml_utils.get_text(team2_elem)),
                              datetime.datetime.fromtimestamp(time_utc),
                              domain.MatchStars(stars_count),
                              domain.Tournament(), domain.MatchState.PLANNED, match_url)
         matches.append(match)
 
-    # now, fill in tournaments + streamers
-    out = list()
-    for match in matches:
-        try:
-            parsed_data = _parse_match_page(match.url, parser)
-            if parsed_data is None:
-                continue
-
-            parsed_match = parsed_data[0]
-            parsed_streamers = parsed_data[1]
-
-            match.tournament = _parse_tournament_page(parsed_match.tournament.url, parser)
-            for streamer in parsed_streamers:
-                out.append(domain.Translation(match=match, streamer=streamer))
-        except Exception as ex:
-            _logger.error(f'Unexpected error during filling up upcoming translation list: {ex}')
-            continue
+    return matches
+
+
+def _parse_match(match: domain.Match, fetcher: Fetcher, tournament_resolver: TournamentResolver) -> \
+        Optional[Tuple[domain.Match, List[domain.Streamer]]]:
+    """
+    Fills in tournament of the match and gets its streamers. Is called from parser pool workers; errors are logged
+    by the pool (it also throws the parser away), so they are only given the match URL here.
+    """
+
+    try:
+        parsed_data = _parse_match_page(match.url, fetcher)
+        if parsed_data is None:
+            return None
+
+        parsed_match = parsed_data[0]
+        parsed_streamers = parsed_data[1]
 
-    return out
+        match.tournament = tournament_resolver.resolve(parsed_match.tournament.url, fetcher)
+        return match, parsed_streamers
+    except Exception as ex:
+        raise Exception(f'failed to parse match (match_url={match.url}): {ex}') from ex
@@ -0,0 +1,45 @@
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urljoin
+
+import lxml.html
+from lxml import etree
+
+if TYPE_CHECKING:
+    from pywebparser.pywebparser import Parser
+
+
+def get_page_source(parser: 'Parser') -> str:
+    """
+    Returns: HTML of the page currently opened in the parser (single browser round-trip)
+    """
+
+    return parser.find_element('//html').get_attribute('outerHTML')
+
+
+def parse_html(html: str) -> etree.ElementBase:
+    return lxml.html.fromstring(html)
+
+
+def find_first(elem: etree.ElementBase, xpath: etree.XPath) -> Optional[etree.ElementBase]:
+    found = xpath(elem)
+    return found[0] if len(found) > 0 else None
+
+
+def get_text(elem: etree.ElementBase) -> str:
+    """
+    Returns: element text the same way browser shows it (nested elements included, whitespaces collapsed)
+    """
+
+    return ' '.join(''.join(elem.itertext()).split())
+
+
+def get_url(elem: etree.ElementBase, attr_name: str, page_url: str) -> Optional[str]:
+    """
+    Returns: absolute URL from the attribute (browser resolves relative links the same way)
+    """
+
+    value = elem.get(attr_name)
+    if value is None:
+        return None
+
+    return urljoin(page_url, value)
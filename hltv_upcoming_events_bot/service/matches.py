@@ -1,16 +1,29 @@
 import datetime
 import logging
-from typing import Optional, List
+import queue
+import threading
+import time
+from typing import Callable, Optional, List, Tuple
 
 import schedule
 
 import hltv_upcoming_events_bot.service.db as db_service
 from hltv_upcoming_events_bot import config, domain
 from hltv_upcoming_events_bot.service import hltv_parser
+from hltv_upcoming_events_bot.service.digest_cache import DigestCache, DigestCacheStats
 
 _CACHED_MATCHES: Optional[List] = None
+_TOURNAMENT_RESOLVER = hltv_parser.TournamentResolver(db_service.get_tournament_by_url)
+_DIGEST_CACHE = DigestCache(config.MATCH_DIGEST_CACHE_TTL_SEC)
+
+# digest settings; they are a part of the digest cache key
+_TARGET_LANGUAGE = 'Russia'
+_USER_TIMEZONE = datetime.timezone(datetime.timedelta(hours=7))
 _logger = logging.getLogger('hltv_upcoming_events_bot.service.matches')
 
+# put to the queue of parsed matches after the last one
+_END_OF_MATCHES = object()
+
 
 def init():
     _setup_schedule()
@@ -19,6 +32,49 @@ def init():
 def get_upcoming_translations() -> List[domain.Translation]:
     _logger.info('Getting upcoming matches from database')
 
+    cur_time_utc_timestamp, tomorrow_noon_utc_timestamp = _get_upcoming_period()
+
+    translations = db_service.get_translations_in_period(cur_time_utc_timestamp, tomorrow_noon_utc_timestamp)
+    return translations
+
+
+def get_upcoming_matches_str() -> str:
+    """
+    Returns: digest of upcoming matches; it's rendered once and then taken from the cache until the matches are
+        updated (by any process: the version of the matches is checked in the database) or the first match of
+        the digest starts
+    """
+
+    _, tomorrow_noon_utc_timestamp = _get_upcoming_period()
+    key = (tomorrow_noon_utc_timestamp, _TARGET_LANGUAGE, _USER_TIMEZONE)
+
+    # the version is got before the matches, so the digest of the matches written meanwhile is not cached as the
+    # up-to-date one
+    version = db_service.get_matches_version()
+
+    msg = _DIGEST_CACHE.get(key, version)
+    if msg is not None:
+        return msg
+
+    msg, first_match_timestamp = _render_upcoming_matches(get_upcoming_translations())
+    _DIGEST_CACHE.put(key, msg, first_match_timestamp, version)
+
+    return msg
+
+
+def invalidate_digest_cache():
+    _DIGEST_CACHE.invalidate()
+
+
+def get_digest_cache_stats() -> DigestCacheStats:
+    return _DIGEST_CACHE.get_stats()
+
+
+def _get_upcoming_period() -> Tuple[int, int]:
+    """
+    Returns: UNIX times of now and of the next noon (UTC) which is at least 11 hours ahead
+    """
+
     cur_time_utc = datetime.datetime.utcnow()
     cur_time_utc_timestamp = round(cur_time_utc.timestamp())
     tomorrow_same_time_utc = cur_time_utc + (
@@ -27,12 +83,14 @@ def get_upcoming_translations() -> List[domain.Translation]:
                                           day=tomorrow_same_time_utc.day, hour=12)
     tomorrow_noon_utc_timestamp = round(tomorrow_noon_utc.timestamp())
 
-    translations = db_service.get_translations_in_period(cur_time_utc_timestamp, tomorrow_noon_utc_timestamp)
-    return translations
+    return cur_time_utc_timestamp, tomorrow_noon_utc_timestamp
 
 
-def get_upcoming_matches_str() -> str:
-    translations = get_upcoming_translations()
+def _render_upcoming_matches(translations: List[domain.Translation]) -> Tuple[str, Optional[float]]:
+    """
+    Returns: digest text and UNIX time of its first match (None if there are no matches)
+    """
+
     match_str_list = list()
 
     # the list of translations that we've got is not grouped;
@@ -45,7 +103,7 @@ def get_upcoming_matches_str() -> str:
 
     tournaments_names = set()
     for trans in translations:
-        is_target_translation = trans.streamer.language == 'Russia'
+        is_target_translation = trans.streamer.language == _TARGET_LANGUAGE
         if trans.match.stars.value == domain.MatchStars.ZERO.value or not is_target_translation:
             continue
 
@@ -70,8 +128,7 @@ def get_upcoming_matches_str() -> str:
         translations_str = '\n'.join([f"{get_streaming_platform_sign(s.url)} <a href='{s.url}'>{s.name}</a>" for s in streamers])
         tournament_name_str = f"(<b>{match.tournament.name}</b>)" if len(tournaments_names) != 1 else ''
 
-        # use UTC+7 timezone
-        user_time = match.time_utc.astimezone(datetime.timezone(datetime.timedelta(hours=7)))
+        user_time = match.time_utc.astimezone(_USER_TIMEZONE)
 
         match_str = f"{user_time.hour:02}:{user_time.minute:02} " \
                     f"{'⭐' * match.stars.value}\t{match.team1.name} - {match.team2.name} " + \
@@ -84,7 +141,10 @@ def get_upcoming_matches_str() -> str:
         msg += f'Сегодня игры <b>{tournaments_names.pop()}</b>\n\n'
 
     msg += '\n\n'.join(match_str_list)
-    return 'ничего интересного сегодня :(' if not msg else msg
+
+    first_match_timestamp = min((match.time_utc.timestamp() for match, _ in matches.values()), default=None)
+
+    return 'ничего интересного сегодня :(' if not msg else msg, first_match_timestamp
 
 
 def _setup_schedule():
@@ -97,30 +157,109 @@ def _setup_schedule():
     populate_translations()
 
 
-def populate_translations():
+def populate_translations(incremental: bool = None):
+    """
+    Parses upcoming matches and writes them to the database match by match: the writer thread takes parsed matches
+    from the bounded queue while the next pages are being loaded, so the matches parsed before a failure are kept.
+    """
+
     _logger.info("Getting the list of today's matches")
 
-    translations = _parse_upcoming_translations()
-    _add_translations_to_db(translations)
+    if incremental is None:
+        incremental = config.PARSER_INCREMENTAL
 
+    parsed_matches = queue.Queue(maxsize=config.PARSER_WRITE_QUEUE_SIZE)
 
-def _parse_upcoming_translations() -> List[domain.Translation]:
+    writer_thread = threading.Thread(target=_write_parsed_matches, args=(parsed_matches,), name='matches-writer')
+    writer_thread.start()
+
+    try:
+        _parse_upcoming_matches(incremental, parsed_matches.put)
+    finally:
+        parsed_matches.put(_END_OF_MATCHES)
+        writer_thread.join()
+
+
+def _parse_upcoming_matches(incremental: bool,
+                            consume_func: Callable[[Tuple[domain.Match, List[domain.Streamer]]], None]):
     # use try/except because if something goes wrong inside, the scheduler will
     # not emit the event next time
-    translations = list()
     try:
-        translations = hltv_parser.get_upcoming_translations()
+        for parsed_match in hltv_parser.iter_upcoming_matches(
+                tournament_resolver=_TOURNAMENT_RESOLVER,
+                match_filter=_select_matches_to_scrape if incremental else None):
+            consume_func(parsed_match)
     except Exception as ex:
         _logger.error(f'Exception while updating cache with upcoming matches: failed to get upcoming matches: {ex}')
 
-    return translations
 
+def _write_parsed_matches(parsed_matches: queue.Queue):
+    written_count = 0
+    is_end = False
+    while not is_end:
+        # wait for the next match and take the ones parsed meanwhile as well, so they are written in one batch
+        batch = [parsed_matches.get()]
+        while True:
+            try:
+                batch.append(parsed_matches.get_nowait())
+            except queue.Empty:
+                break
 
-def _add_translations_to_db(translations: List[domain.Translation]):
-    for trans in translations:
-        try:
-            db_service.add_translation(trans.match, trans.streamer)
-        except Exception as ex:
-            _logger.error(
-                f'Exception while updating cache with upcoming matches: failed to add translation '
-                f'(match_url={trans.match.url}, streamer_url={trans.streamer.url}): {ex}')
+        if _END_OF_MATCHES in batch:
+            batch = batch[:batch.index(_END_OF_MATCHES)]
+            is_end = True
+
+        if len(batch) == 0:
+            continue
+
+        # every batch gets its own scraping time: the latest one is the version of the matches (see
+        # get_upcoming_matches_str), so the bot sees every written batch;
+        # the batch is not marked as scraped if it fails to be written, so it's parsed again next time
+        if not _add_parsed_matches_to_db(batch, datetime.datetime.utcnow()):
+            continue
+
+        written_count += len(batch)
+
+        # matches and streams may be changed; the digests of this process are dropped right away
+        invalidate_digest_cache()
+
+    _logger.info(f'{written_count} parsed match(es) written to database; digest cache: {get_digest_cache_stats()}')
+
+
+def _select_matches_to_scrape(matches: List[domain.Match]) -> List[domain.Match]:
+    """
+    Selects matches which pages must be parsed: new matches, matches parsed too long ago and matches that start soon.
+    """
+
+    last_scraped_at_by_url = db_service.get_matches_last_scraped_at([m.url for m in matches])
+
+    cur_time_utc = datetime.datetime.utcnow()
+    cur_timestamp = time.time()
+
+    out = list()
+    for match in matches:
+        last_scraped_at = last_scraped_at_by_url.get(match.url)
+        if last_scraped_at is None \
+                or (cur_time_utc - last_scraped_at).total_seconds() > config.MATCH_RESCRAPE_AGE_SEC \
+                or match.time_utc.timestamp() - cur_timestamp < config.MATCH_RESCRAPE_BEFORE_START_SEC:
+            out.append(match)
+
+    _logger.info(f'{len(out)} of {len(matches)} upcoming match(es) will be parsed')
+
+    return out
+
+
+def _add_parsed_matches_to_db(matches_with_streamers: List[Tuple[domain.Match, List[domain.Streamer]]],
+                              scraped_at: datetime.datetime) -> bool:
+    """
+    Returns: True if the translations are written and the matches are marked as scraped (in one transaction)
+    """
+
+    try:
+        db_service.add_scraped_matches(matches_with_streamers, scraped_at)
+    except Exception as ex:
+        _logger.error(f'Exception while updating cache with upcoming matches: failed to add '
+                      f'{len(matches_with_streamers)} parsed match(es): {ex}')
+        return False
+
+    return True
@@ -1,10 +1,12 @@
 import datetime
 import logging
 from enum import Enum
-from typing import Optional, List
+from typing import Dict, Optional, List
+
+import schedule
 
 import hltv_upcoming_events_bot.service.db as db_service
-from hltv_upcoming_events_bot import domain
+from hltv_upcoming_events_bot import config, domain
 from hltv_upcoming_events_bot.service import cybersport_parser as parser
 
 _CACHED_MATCHES: Optional[List] = None
@@ -31,8 +33,7 @@ class RetCode(Enum):
 
 
 def start():
-    pass
-    # _setup_schedule()
+    _setup_schedule()
 
 
 def get_recent_news_str(news_items: List[domain.NewsItem]) -> str:
@@ -53,19 +54,38 @@ def get_recent_news_for_chat(chat_telegram_id: int, since_time_utc: datetime.dat
     return db_service.get_recent_news_for_chat(chat_telegram_id, since_time_utc, max_count)
 
 
+def get_recent_news_for_subscribers(since_time_utc: datetime.datetime, max_count: int = None) -> \
+        Dict[int, List[domain.NewsItem]]:
+    _logger.info(f'Get recent news for subscribers (since_time_utc={since_time_utc}, max={max_count})')
+    return db_service.get_recent_news_for_subscribers(since_time_utc, max_count)
+
+
 def populate_news(to_date_time: datetime.datetime = None):
     _logger.info(f"Populate news until '{to_date_time}'")
     _add_news_to_db(_parse_news(to_date_time))
 
 
-# def _setup_schedule():
-#     if config.DEBUG:
-#         schedule.every(3).minutes.do(populate_vacancies)
-#     else:
-#         schedule.every(4).to(6).hours.do(populate_vacancies)
-#
-#     # initial call
-#     populate_vacancies()
+def refresh_comment_counts():
+    """
+    Refreshes comment counters (and so hotness) of the stored news items from the list page only; it's much cheaper
+    than populate_news() since no news item page is loaded, so it can run often to keep the ranking fresh.
+    """
+
+    _logger.info('Refresh comment counts of news')
+
+    # use try/except because if something goes wrong inside, the scheduler will
+    # not emit the event next time
+    try:
+        news = parser.parse_news_list()
+    except Exception as ex:
+        _logger.error(f'failed to parse news list: {ex}')
+        return
+
+    db_service.refresh_news_item_comment_counts(news)
+
+
+def _setup_schedule():
+    schedule.every(config.NEWS_COMMENT_REFRESH_INTERVAL_MIN).minutes.do(refresh_comment_counts)
 
 
 def _parse_news(to_date_time: datetime.datetime = None) -> List[domain.NewsItem]:
@@ -74,7 +94,8 @@ def _parse_news(to_date_time: datetime.datetime = None) -> List[domain.NewsItem]
 
     news = list()
     try:
-        news = parser.parse_news_to_date(to_date_time)
+        # pages of the stored news items are not parsed again; only their comment counters are updated
+        news = parser.parse_news_to_date(to_date_time, known_urls_func=db_service.get_news_item_urls_with_short_desc)
     except Exception as ex:
         _logger.error(f'failed to parse news: {ex}')
 
@@ -0,0 +1,139 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from lxml import etree
+
+from hltv_upcoming_events_bot.service import lxml_utils
+
+_logger = logging.getLogger('hltv_upcoming_events_bot.service.page_corpus')
+
+_RECORDING_CORPUS: Optional['PageCorpus'] = None
+
+
+class PageCorpus(object):
+    """
+    Fetched pages (URL, HTML, time) stored in a gzip-compressed JSON Lines file. Pages are appended while recording;
+    the latest page wins for the same URL when the corpus is loaded.
+    """
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._pages: Dict[str, str] = dict()
+        self._lock = threading.Lock()
+
+        if os.path.exists(filename):
+            self._load()
+
+    @property
+    def filename(self) -> str:
+        return self._filename
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def get(self, url: str) -> Optional[str]:
+        with self._lock:
+            return self._pages.get(url)
+
+    def add(self, url: str, html: str, fetched_at: datetime.datetime = None):
+        record = {
+            'url': url,
+            'html': html,
+            'fetched_at': (fetched_at if fetched_at is not None else datetime.datetime.utcnow()).isoformat(),
+        }
+
+        with self._lock:
+            self._pages[url] = html
+            with gzip.open(self._filename, 'at', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _load(self):
+        with gzip.open(self._filename, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+
+                record = json.loads(line)
+                self._pages[record['url']] = record['html']
+
+        _logger.info(f'{len(self._pages)} page(s) loaded from corpus (filename={self._filename})')
+
+
+class _ReplayElement(object):
+    def __init__(self, html: str):
+        self._html = html
+
+    def get_attribute(self, name: str) -> Optional[str]:
+        return self._html if name == 'outerHTML' else None
+
+
+class ReplayParser(object):
+    """
+    Stand-in for Parser serving pages from the corpus without network access (pywebparser is not needed for that).
+    It supports what fetchers need: navigation and finding elements (getting the page source, first of all).
+    """
+
+    def __init__(self, corpus: PageCorpus):
+        self.url = None
+        self.navigation_count = 0
+        self._corpus = corpus
+        self._html = '<html></html>'
+
+    def goto(self, url: str):
+        self.url = url
+        self.navigation_count += 1
+
+        html = self._corpus.get(url)
+        if html is None:
+            _logger.warning(f'no such page in corpus (url={url})')
+            html = '<html></html>'
+
+        self._html = html
+
+    def find_element(self, xpath: str) -> Optional[_ReplayElement]:
+        """
+        Returns: the first element found by the XPath or None; only its outer HTML is available
+        """
+
+        if xpath == '//html':
+            # the page source as it's recorded
+            return _ReplayElement(self._html)
+
+        found = lxml_utils.parse_html(self._html).xpath(xpath)
+        if len(found) == 0 or not isinstance(found[0], etree.ElementBase):
+            return None
+
+        return _ReplayElement(etree.tostring(found[0], encoding='unicode', method='html'))
+
+
+def start_recording(filename: str):
+    """
+    Starts saving every fetched page to the corpus.
+    """
+
+    global _RECORDING_CORPUS
+
+    _logger.info(f'record fetched pages to {filename}')
+    _RECORDING_CORPUS = PageCorpus(filename)
+
+
+def stop_recording():
+    global _RECORDING_CORPUS
+
+    _RECORDING_CORPUS = None
+
+
+def record(url: str, html: str):
+    corpus = _RECORDING_CORPUS
+    if corpus is None:
+        return
+
+    try:
+        corpus.add(url, html)
+    except Exception as ex:
+        _logger.error(f'failed to record page (url={url}): {ex}')
@@ -0,0 +1,74 @@
+import datetime
+import logging
+import time
+from dataclasses import dataclass
+from typing import List
+
+from hltv_upcoming_events_bot.service import cybersport_parser, hltv_parser
+from hltv_upcoming_events_bot.service.page_corpus import PageCorpus, ReplayParser
+
+_logger = logging.getLogger('hltv_upcoming_events_bot.service.parser_benchmark')
+
+
+@dataclass
+class BenchmarkResult(object):
+    name: str
+    pages: int
+    items: int  # extracted matches or articles
+    duration_sec: float
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.pages / self.duration_sec if self.duration_sec > 0 else 0.0
+
+    @property
+    def ms_per_item(self) -> float:
+        return self.duration_sec * 1000 / self.items if self.items > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f'{self.name}: {self.items} item(s) from {self.pages} page(s) in {self.duration_sec:.3f} sec; '
+                f'{self.pages_per_sec:.1f} pages/sec, {self.ms_per_item:.2f} ms/item')
+
+
+class _CountingReplayParser(ReplayParser):
+    def __init__(self, corpus: PageCorpus, counter: List[int]):
+        super().__init__(corpus)
+        self._counter = counter
+
+    def goto(self, url: str):
+        super().goto(url)
+        self._counter[0] += 1
+
+
+def run_benchmark(corpus: PageCorpus, repeat: int = 1) -> List[BenchmarkResult]:
+    """
+    Runs HLTV and cybersport.ru parsers against recorded pages without network access. Time is spent on page
+    extraction only, so the numbers are comparable between runs on the same corpus.
+
+    Returns: result for every parser
+    """
+
+    return [
+        _measure('hltv', corpus, repeat,
+                 lambda parser_factory: len(hltv_parser.parse_upcoming_matches(
+                     max_workers=1, tournament_resolver=hltv_parser.TournamentResolver(),
+                     parser_factory=parser_factory))),
+        _measure('cybersport', corpus, repeat,
+                 lambda parser_factory: len(cybersport_parser.parse_news_to_date(
+                     datetime.datetime(1970, 1, 1), parser_factory=parser_factory))),
+    ]
+
+
+def _measure(name: str, corpus: PageCorpus, repeat: int, func) -> BenchmarkResult:
+    counter = [0]
+    items = 0
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        items += func(lambda: _CountingReplayParser(corpus, counter))
+    duration_sec = time.perf_counter() - start_time
+
+    result = BenchmarkResult(name, counter[0], items, duration_sec)
+    _logger.info(str(result))
+
+    return result
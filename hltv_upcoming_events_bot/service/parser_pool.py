@@ -0,0 +1,128 @@
+import itertools
+import logging
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Generic, Iterator, List, Optional, TypeVar
+
+_logger = logging.getLogger('hltv_upcoming_events_bot.service.parser_pool')
+
+_P = TypeVar('_P')
+_T = TypeVar('_T')
+_R = TypeVar('_R')
+
+_NO_ITEM = object()
+
+
+class ParserPool(Generic[_P]):
+    """
+    Bounded set of parsers (Parser instances or fetchers owning them) shared between worker threads.
+
+    Every worker takes its own parser for the duration of a task, so a browser is never used by two threads at
+    the same time. A parser that raised during a task is thrown away and a fresh one is created on demand; this way
+    one broken browser session doesn't affect the rest of the tasks.
+    """
+
+    def __init__(self, parser_factory: Callable[[], _P], size: int):
+        self._parser_factory = parser_factory
+        self._size = max(1, size)
+        self._idle_parsers = queue.LifoQueue()
+        self._created_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @contextmanager
+    def parser(self) -> Iterator[_P]:
+        parser = self._acquire()
+        try:
+            yield parser
+        except Exception:
+            self._discard(parser)
+            raise
+
+        self._idle_parsers.put(parser)
+
+    def map(self, func: Callable[[_T, _P], _R], items: List[_T]) -> List[Optional[_R]]:
+        """
+        Calls func(item, parser) for every item using up to `size` parsers in parallel.
+
+        Returns: results in the order of items; None for items that failed
+        """
+
+        if len(items) == 0:
+            return list()
+
+        with ThreadPoolExecutor(max_workers=min(self._size, len(items))) as executor:
+            return list(executor.map(lambda item: self._run(func, item), items))
+
+    def imap_unordered(self, func: Callable[[_T, _P], _R], items: List[_T]) -> Iterator[Optional[_R]]:
+        """
+        The same as map(), but results are yielded as soon as they are ready. Only a few items more than the number
+        of parsers are in progress at a time, so results don't pile up while the caller is busy with the previous
+        ones.
+
+        Returns: results in the order of completion; None for items that failed
+        """
+
+        if len(items) == 0:
+            return
+
+        max_in_progress = 2 * self._size
+        items_iter = iter(items)
+
+        with ThreadPoolExecutor(max_workers=min(self._size, len(items))) as executor:
+            in_progress = set()
+            for item in itertools.islice(items_iter, max_in_progress):
+                in_progress.add(executor.submit(self._run, func, item))
+
+            while len(in_progress) > 0:
+                done, in_progress = wait(in_progress, return_when=FIRST_COMPLETED)
+                for future in done:
+                    next_item = next(items_iter, _NO_ITEM)
+                    if next_item is not _NO_ITEM:
+                        in_progress.add(executor.submit(self._run, func, next_item))
+
+                    yield future.result()
+
+    def _run(self, func: Callable[[_T, _P], _R], item: _T) -> Optional[_R]:
+        try:
+            with self.parser() as parser:
+                return func(item, parser)
+        except Exception as ex:
+            _logger.error(f'failed to process item in parser pool: {ex}')
+            return None
+
+    def _acquire(self) -> _P:
+        while True:
+            try:
+                return self._idle_parsers.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                if self._created_count < self._size:
+                    self._created_count += 1
+                    break
+
+            # all the parsers are busy; wait for the one to be returned (or discarded, so the new one
+            # can be created instead)
+            try:
+                return self._idle_parsers.get(timeout=1)
+            except queue.Empty:
+                continue
+
+        try:
+            return self._parser_factory()
+        except Exception:
+            with self._lock:
+                self._created_count -= 1
+            raise
+
+    def _discard(self, parser: _P):
+        _logger.warning(f'parser is discarded from the pool after failure: {parser}')
+        with self._lock:
+            self._created_count -= 1
@@ -5,6 +5,7 @@ from typing import Callable, Optional
 
 import schedule
 
+import hltv_upcoming_events_bot.service.broadcast as broadcast_service
 import hltv_upcoming_events_bot.service.db as db_service
 import hltv_upcoming_events_bot.service.news as news_service
 from hltv_upcoming_events_bot import config
@@ -33,6 +34,9 @@ def init(send_message_func: Callable):
         schedule.every().day.at("06:05:00").do(_notify_subscribers_about_news, 24, 5)
         schedule.every().day.at("18:05:00").do(_notify_subscribers_about_news, 12, 3)
 
+    # messages left in the outbox (e.g. by the previous run) are sent as well
+    schedule.every(config.OUTBOX_DRAIN_INTERVAL_SEC).seconds.do(_drain_outbox)
+
     _SEND_MESSAGE_FUNC = send_message_func
 
 
@@ -73,14 +77,20 @@ def _notify_subscribers_about_matches():
     # not emit the event next time
     try:
         msg = get_upcoming_matches_str()
-        for subs in db_service.get_subscribers():
-            try:
-                _SEND_MESSAGE_FUNC(subs.telegram_id, msg)
-            except Exception as ex:
-                _logger.error(
-                    f'Exception while notifying subscriber about matches (telegram_id={subs.telegram_id}): {ex}')
+        subscribers = db_service.get_subscribers()
     except Exception as ex:
         _logger.error(f'Exception while getting upcoming matches text: {ex}')
+        return
+
+    try:
+        # one digest a day
+        slot = f'matches:{datetime.datetime.utcnow():%Y-%m-%d}'
+        db_service.add_outbox_messages([(subs.telegram_id, msg) for subs in subscribers], slot)
+    except Exception as ex:
+        _logger.error(f'Exception while putting matches notifications to outbox: {ex}')
+        return
+
+    _drain_outbox()
 
 
 def _notify_subscribers_about_news(for_last_n_hours: int, news_count: int):
@@ -92,18 +102,55 @@ def _notify_subscribers_about_news(for_last_n_hours: int, news_count: int):
 
     # use try/except because if something goes wrong inside, the scheduler will
     # not emit the event next time
-    for subs in db_service.get_subscribers():
-        try:
-            news_items = news_service.get_recent_news_for_chat(
-                subs.telegram_id, datetime.datetime.utcnow() - datetime.timedelta(hours=for_last_n_hours), news_count)
-        except Exception as ex:
-            _logger.error(f'Exception while getting recent news text: {ex}')
-            continue
-
-        msg = news_service.get_recent_news_str(news_items)
-
-        try:
-            _SEND_MESSAGE_FUNC(subs.telegram_id, msg)
-            db_service.mark_news_items_as_sent(news_items, [subs.telegram_id], datetime.datetime.utcnow())
-        except Exception as ex:
-            _logger.error(f'Exception while notifying subscriber about news (telegram_id={subs.telegram_id}): {ex}')
+    try:
+        news_items_by_telegram_id = news_service.get_recent_news_for_subscribers(
+            datetime.datetime.utcnow() - datetime.timedelta(hours=for_last_n_hours), news_count)
+    except Exception as ex:
+        _logger.error(f'Exception while getting recent news text: {ex}')
+        return
+
+    try:
+        # news items are marked as sent when their message is delivered
+        slot = f'news:{datetime.datetime.utcnow():%Y-%m-%dT%H}'
+        db_service.add_outbox_messages([(telegram_id, news_service.get_recent_news_str(news_items))
+                                        for telegram_id, news_items in news_items_by_telegram_id.items()],
+                                       slot, news_items_by_telegram_id)
+    except Exception as ex:
+        _logger.error(f'Exception while putting news notifications to outbox: {ex}')
+        return
+
+    _drain_outbox()
+
+
+def _drain_outbox():
+    """
+    Sends messages from the outbox batch by batch until there is nothing to send; it's run on schedule as well,
+    so messages left after a restart are sent too.
+    """
+
+    if not _SEND_MESSAGE_FUNC:
+        return
+
+    claim_timeout = datetime.timedelta(seconds=config.OUTBOX_CLAIM_TIMEOUT_SEC)
+    retry_delay = datetime.timedelta(seconds=config.OUTBOX_RETRY_DELAY_SEC)
+
+    # use try/except because if something goes wrong inside, the scheduler will
+    # not emit the event next time
+    try:
+        while True:
+            messages = db_service.claim_outbox_messages(config.OUTBOX_BATCH_SIZE, claim_timeout, retry_delay)
+            if len(messages) == 0:
+                break
+
+            # every message is recorded as soon as it's sent: after a crash in the middle of the batch, only the
+            # messages being sent at that moment are sent again
+            def on_done(index: int, is_delivered: bool):
+                message_ids = [messages[index].id]
+                db_service.mark_outbox_messages_as_done(message_ids if is_delivered else list(),
+                                                        list() if is_delivered else message_ids,
+                                                        config.OUTBOX_MAX_ATTEMPTS)
+
+            broadcast_service.broadcast([(m.telegram_id, m.text) for m in messages], _SEND_MESSAGE_FUNC,
+                                        on_done=on_done)
+    except Exception as ex:
+        _logger.error(f'Exception while sending messages from outbox: {ex}')
@@ -0,0 +1,138 @@
+import logging
+import queue
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import hltv_upcoming_events_bot.service.db as db_service
+from hltv_upcoming_events_bot import config
+from hltv_upcoming_events_bot import domain
+
+_logger = logging.getLogger('hltv_upcoming_events_bot.service.user_request_log')
+
+_STOP = object()
+
+_WRITER: Optional['UserRequestWriter'] = None
+_WRITER_LOCK = threading.Lock()
+
+
+class UserRequestWriter(object):
+    """
+    Write-behind log of bot commands: requests are put to the bounded in-memory queue and written to the database
+    by the background thread in batches, every `flush_interval_sec` or as soon as `batch_size` requests are queued.
+    Logging never waits for the database; requests that don't fit into the full queue are dropped.
+    """
+
+    def __init__(self, flush_interval_sec: float, batch_size: int, queue_size: int, db_engine=None):
+        self._flush_interval_sec = flush_interval_sec
+        self._batch_size = max(1, batch_size)
+        self._db_engine = db_engine
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='user-request-writer', daemon=True)
+        self._written_count = 0
+        self._dropped_count = 0
+
+    @property
+    def written_count(self) -> int:
+        return self._written_count
+
+    @property
+    def dropped_count(self) -> int:
+        return self._dropped_count
+
+    def start(self):
+        self._thread.start()
+
+    def log(self, user_request: domain.UserRequest):
+        try:
+            self._queue.put_nowait(user_request)
+        except queue.Full:
+            self._dropped_count += 1
+            _logger.warning(f'user request is dropped, the queue is full: {user_request.text}')
+
+    def stop(self):
+        """
+        Writes the requests that are still in the queue and stops the thread.
+        """
+
+        # the stop mark must get to the queue even if it's full; the writer is draining it meanwhile
+        self._queue.put(_STOP)
+        self._thread.join()
+
+        _logger.info(f'user request writer is stopped: {self._written_count} request(s) written, '
+                     f'{self._dropped_count} dropped')
+
+    def _run(self):
+        is_stopped = False
+        while not is_stopped:
+            batch, is_stopped = self._take_batch()
+            self._write(batch)
+
+    def _take_batch(self) -> Tuple[List[domain.UserRequest], bool]:
+        batch = list()
+        deadline = None
+
+        while len(batch) < self._batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if item is _STOP:
+                return batch, True
+
+            batch.append(item)
+            if deadline is None:
+                # the interval is counted from the first request of the batch, so the writer sleeps while idle
+                deadline = time.monotonic() + self._flush_interval_sec
+
+        return batch, False
+
+    def _write(self, batch: List[domain.UserRequest]):
+        if len(batch) == 0:
+            return
+
+        # use try/except because the writer thread must survive database failures
+        try:
+            self._written_count += db_service.add_user_requests(batch, self._db_engine)
+        except Exception as ex:
+            _logger.error(f'failed to write {len(batch)} user request(s): {ex}')
+
+
+def start():
+    global _WRITER
+
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = UserRequestWriter(config.USER_REQUEST_LOG_FLUSH_INTERVAL_SEC, config.USER_REQUEST_LOG_BATCH_SIZE,
+                                        config.USER_REQUEST_LOG_QUEUE_SIZE)
+            _WRITER.start()
+
+
+def log(user_request: domain.UserRequest):
+    writer = _WRITER
+    if writer is None:
+        # the bot is not started by `bot start` (e.g. in tests); write it straight away then
+        db_service.add_user_requests([user_request])
+        return
+
+    writer.log(user_request)
+
+
+def stop():
+    """
+    Writes all logged requests to the database; it's called when the bot is stopped.
+    """
+
+    global _WRITER
+
+    with _WRITER_LOCK:
+        writer = _WRITER
+        _WRITER = None
+
+    if writer is not None:
+        writer.stop()
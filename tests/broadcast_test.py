@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import defaultdict
+
+from telegram.error import RetryAfter
+
+from hltv_upcoming_events_bot.service import broadcast as broadcast_service
+
+
+def test_broadcast_retries_and_limits():
+    send_times = defaultdict(list)
+    retry_chat_ids = {3, 7}
+    lock = threading.Lock()
+
+    def send(chat_id: int, text: str) -> bool:
+        with lock:
+            send_times[chat_id].append(time.monotonic())
+            if chat_id in retry_chat_ids:
+                retry_chat_ids.remove(chat_id)
+                raise RetryAfter(0.05)
+
+        return chat_id != 5
+
+    messages = [(chat_id, 'digest') for chat_id in range(10)] + [(0, 'second message')]
+    start_time = time.monotonic()
+    result = broadcast_service.broadcast(messages, send, workers=4, rate_per_sec=100, chat_interval_sec=0.1,
+                                         max_retries=2)
+    duration_sec = time.monotonic() - start_time
+
+    assert result.delivered == 10
+    assert result.failed == 1
+    assert result.retried == 2
+    assert sorted(result.delivered_chat_ids) == [0, 0, 1, 2, 3, 4, 6, 7, 8, 9]
+
+    # 13 attempts at 100 per second
+    assert duration_sec >= 0.1
+
+    # the second message to the same chat waits for the chat interval, the retried one waits as requested
+    assert send_times[0][1] - send_times[0][0] >= 0.1
+    assert send_times[3][1] - send_times[3][0] >= 0.05
+
+
+def test_broadcast_gives_up_after_max_retries():
+    def send(chat_id: int, text: str) -> bool:
+        raise RetryAfter(0)
+
+    result = broadcast_service.broadcast([(1, 'digest')], send, workers=2, rate_per_sec=1000, chat_interval_sec=0,
+                                         max_retries=3)
+
+    assert result.delivered == 0
+    assert result.failed == 1
+    assert result.retried == 3
+
+
+def test_broadcast_reports_every_message():
+    done = dict()
+
+    def on_done(index: int, is_delivered: bool):
+        # reported by the worker before broadcast() returns
+        done[index] = is_delivered
+
+    messages = [(chat_id, 'digest') for chat_id in range(5)]
+    result = broadcast_service.broadcast(messages, lambda chat_id, text: chat_id != 2, workers=3, rate_per_sec=1000,
+                                         chat_interval_sec=0, on_done=on_done)
+
+    assert result.delivered == 4
+    assert done == {0: True, 1: True, 2: False, 3: True, 4: True}
@@ -47,6 +47,16 @@ def db_engine():  # 1
     # yield db_session
     # connection.close()
 
+    yield _create_db_engine()
+
+
+@pytest.fixture(scope='function')
+def fresh_db_engine():
+    # for tests that change the seeded data or count statements: nothing is left there by the other tests
+    yield _create_db_engine()
+
+
+def _create_db_engine():
     engine = create_engine("sqlite+pysqlite:///:memory:", echo=True, future=True)
     session = Session(engine)
     Chat().metadata.create_all(engine)
@@ -60,7 +70,7 @@ def db_engine():  # 1
 
     session.commit()
 
-    yield engine
+    return engine
 
 
 @pytest.fixture(scope='function')
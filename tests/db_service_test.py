@@ -1,8 +1,19 @@
+import dataclasses
 import datetime
+import re
+from contextlib import contextmanager
 
 import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
 
+import hltv_upcoming_events_bot.db as db
+from hltv_upcoming_events_bot.db import dimension_cache
 import hltv_upcoming_events_bot.service.db as db_service
+from hltv_upcoming_events_bot.db.common import Base
+from hltv_upcoming_events_bot.service.user_request_log import UserRequestWriter
+from hltv_upcoming_events_bot import config, domain
+from hltv_upcoming_events_bot.domain import NewsItem
 
 
 @pytest.mark.parametrize('chat_tg_id', [
@@ -80,3 +91,394 @@ def test_get_recent_news_items_for_chat_with_mark_as_sent(db_engine, db_data_new
     news_items = db_service.get_recent_news_for_chat(234, now - datetime.timedelta(days=100), 20, db_engine)
 
     assert len(news_items) == 0
+
+
+@contextmanager
+def _count_statements(db_engine):
+    statements = list()
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db_engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db_engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _make_translations(match_count: int, streamer_count: int, time_utc: datetime.datetime = None,
+                       first_match_id: int = 0):
+    tournament = domain.Tournament('Tournament 1', 'https://www.hltv.org/events/1/tournament-1', 1)
+    if time_utc is None:
+        time_utc = datetime.datetime.now() + datetime.timedelta(hours=1)
+
+    out = list()
+    for i in range(first_match_id, first_match_id + match_count):
+        match = domain.Match(domain.Team(f'Team {i}'), domain.Team(f'Team {i + 1}'), time_utc, domain.MatchStars.ONE,
+                             tournament, domain.MatchState.PLANNED, f'https://www.hltv.org/matches/{i}/match')
+        for j in range(streamer_count):
+            out.append(domain.Translation(match, domain.Streamer(f'Streamer {j}', 'Russia',
+                                                                 f'https://www.twitch.tv/streamer{j}')))
+
+    return out
+
+
+@pytest.mark.usefixtures('fresh_db_engine')
+def test_add_translations(fresh_db_engine):
+    translations = _make_translations(20, 5)
+
+    with _count_statements(fresh_db_engine) as statements:
+        added_count = db_service.add_translations(translations, fresh_db_engine)
+
+    assert added_count == 100
+    # the number of queries doesn't depend on the number of translations
+    assert len(statements) <= 15
+
+    # nothing is added twice
+    assert db_service.add_translations(translations, fresh_db_engine) == 0
+
+    with Session(fresh_db_engine) as session:
+        assert session.query(db.Match).filter(db.Match.url.like('https://www.hltv.org/matches/%')).count() == 20
+        assert len(db.get_translations_by_match_id(
+            db.get_match_id_by_url('https://www.hltv.org/matches/0/match', session), session)) == 5
+
+
+@pytest.mark.usefixtures('fresh_db_engine')
+def test_add_scraped_matches(fresh_db_engine, monkeypatch):
+    scraped_at = datetime.datetime(2031, 1, 1, 10, 0)
+    translations = _make_translations(1, 2, first_match_id=8000)
+    match_without_streamers = _make_translations(1, 1, first_match_id=8100)[0].match
+    parsed_matches = [(translations[0].match, [t.streamer for t in translations]), (match_without_streamers, [])]
+
+    assert db_service.add_scraped_matches(parsed_matches, scraped_at, fresh_db_engine) == 2
+
+    urls = [match.url for match, _ in parsed_matches]
+    with Session(fresh_db_engine) as session:
+        assert db.get_matches_last_scraped_at_by_urls(urls, session) == {url: scraped_at for url in urls}
+
+    # nothing is marked as scraped if translations fail to be written, so the match is parsed again next time
+    def fail_to_add_translations(match_and_streamer_ids, session):
+        raise RuntimeError('database is gone')
+
+    monkeypatch.setattr(db, 'add_translations', fail_to_add_translations)
+    failed_match = _make_translations(1, 1, first_match_id=8200)[0]
+
+    with pytest.raises(RuntimeError):
+        db_service.add_scraped_matches([(failed_match.match, [failed_match.streamer])], scraped_at, fresh_db_engine)
+
+    with Session(fresh_db_engine) as session:
+        assert db.get_matches_last_scraped_at_by_urls([failed_match.match.url], session) == dict()
+
+
+@pytest.mark.usefixtures('fresh_db_engine')
+def test_add_scraped_matches_updates_known_matches(fresh_db_engine):
+    with Session(fresh_db_engine) as session:
+        db.tournament.add_tournament('Unknown', '', -2, session)
+
+    match = _make_translations(1, 1, first_match_id=8300)[0].match
+    db_service.add_scraped_matches([(match, [])], datetime.datetime(2031, 1, 1, 10, 0), fresh_db_engine)
+
+    # the match is rescheduled and the second team is known now; its tournament failed to be resolved this time
+    rescraped = dataclasses.replace(match, team2=domain.Team('Team 9000'),
+                                    time_utc=match.time_utc + datetime.timedelta(hours=3),
+                                    state=domain.MatchState.DELAYED, tournament=None)
+    db_service.add_scraped_matches([(rescraped, [])], datetime.datetime(2031, 1, 1, 11, 0), fresh_db_engine)
+
+    with Session(fresh_db_engine) as session:
+        stored = db.get_match_by_url(match.url, session).to_domain_object()
+        assert stored.team2.name == 'Team 9000'
+        assert stored.time_utc == rescraped.time_utc.replace(microsecond=0)
+        assert stored.state == domain.MatchState.DELAYED
+        assert stored.tournament.name == 'Tournament 1'
+
+
+@pytest.mark.usefixtures('fresh_db_engine')
+def test_add_scraped_matches_renames_tournament_by_hltv_id(fresh_db_engine):
+    match = _make_translations(1, 1, first_match_id=8400)[0].match
+    db_service.add_scraped_matches([(match, [])], datetime.datetime(2031, 1, 1, 10, 0), fresh_db_engine)
+
+    # the tournament got another name and URL, but its HLTV ID is the same
+    tournament = domain.Tournament('Tournament 1 Finals', 'https://www.hltv.org/events/1/tournament-1-finals', 1)
+    rescraped = dataclasses.replace(match, tournament=tournament)
+    db_service.add_scraped_matches([(rescraped, [])], datetime.datetime(2031, 1, 1, 11, 0), fresh_db_engine)
+
+    with Session(fresh_db_engine) as session:
+        stored = db.get_match_by_url(match.url, session)
+        assert stored.tournament.to_domain_object() == tournament
+        assert db.get_tournament_id_by_name('Tournament 1', session) is None
+
+
+@pytest.mark.parametrize('match_count', [1, 10])
+@pytest.mark.usefixtures('fresh_db_engine')
+def test_get_translations_in_period(match_count, fresh_db_engine):
+    time_utc = datetime.datetime(2030, 1, match_count)
+    db_service.add_translations(_make_translations(match_count, 3, time_utc, 1000 * match_count), fresh_db_engine)
+
+    timestamp = int(time_utc.timestamp())
+    with _count_statements(fresh_db_engine) as statements:
+        translations = db_service.get_translations_in_period(timestamp - 60, timestamp + 60, fresh_db_engine)
+
+    # matches and streamers are loaded at once; teams, tournaments and states are cached by add_translations()
+    assert len(statements) == 1
+
+    assert len(translations) == match_count * 3
+    assert translations[0].match.team1.name == f'Team {1000 * match_count}'
+    assert translations[0].match.tournament.name == 'Tournament 1'
+    assert translations[0].match.state == domain.MatchState.PLANNED
+    assert {t.streamer.name for t in translations} == {'Streamer 0', 'Streamer 1', 'Streamer 2'}
+
+
+@pytest.mark.usefixtures('fresh_db_engine', 'db_data_news_items')
+def test_get_recent_news_for_subscribers(fresh_db_engine, db_data_news_items):
+    with Session(fresh_db_engine) as session:
+        db.add_chat(456, 'chat_title 4', 'private chat type', session)
+        for tg_id in [345, 456]:
+            db.add_subscriber_from_domain_object(domain.Chat(tg_id, '', ''), session)
+
+    # the hottest news item is sent to one of the chats already
+    by_hotness = sorted(db_data_news_items, key=lambda ni: db.get_hotness(ni.comment_count, ni.date_time_utc),
+                        reverse=True)
+    db_service.mark_news_items_as_sent_to_chats({456: by_hotness[:1]}, datetime.datetime.utcnow(), fresh_db_engine)
+
+    since = datetime.datetime.now() - datetime.timedelta(days=1)
+    with _count_statements(fresh_db_engine) as statements:
+        news_items_by_tg_id = db_service.get_recent_news_for_subscribers(since, 2, fresh_db_engine)
+
+    assert len(statements) == 2
+
+    assert news_items_by_tg_id == {345: by_hotness[:2], 456: by_hotness[1:3]}
+
+    with _count_statements(fresh_db_engine) as statements:
+        counts = db_service.mark_news_items_as_sent_to_chats(news_items_by_tg_id, datetime.datetime.utcnow(),
+                                                             fresh_db_engine)
+
+    assert counts == (4, 0)
+    assert len(statements) == 3
+
+    # marking twice is harmless
+    assert db_service.mark_news_items_as_sent_to_chats(news_items_by_tg_id, db_engine=fresh_db_engine) == (0, 4)
+
+    news_items_by_tg_id = db_service.get_recent_news_for_subscribers(since, 2, fresh_db_engine)
+    assert news_items_by_tg_id == {345: by_hotness[2:4], 456: by_hotness[3:4]}
+
+
+@pytest.mark.usefixtures('fresh_db_engine', 'db_data_news_items')
+def test_mark_news_items_as_sent(fresh_db_engine, db_data_news_items):
+    unknown_news_item = NewsItem(datetime.datetime.now(), 'Unknown', '', 'http://unknown.com/1.html', 0, 0.0)
+    news_items = db_data_news_items[:2] + [unknown_news_item]
+
+    with _count_statements(fresh_db_engine) as statements:
+        inserted, skipped = db_service.mark_news_items_as_sent(news_items, [345, 999], db_engine=fresh_db_engine)
+
+    # unknown news item and unknown chat are skipped instead of stopping at the first one
+    assert len(statements) == 3
+    assert (inserted, skipped) == (2, 4)
+
+    with Session(fresh_db_engine) as session:
+        chat_id = db.get_chat_by_telegram_id(345, session).id
+        news_item_id = db.get_news_item_by_url(db_data_news_items[1].url, session).id
+        assert len(db.get_news_item_sent_by_news_item_id_and_chat_id(news_item_id, chat_id, session)) == 1
+
+
+@pytest.mark.usefixtures('fresh_db_engine')
+def test_dimension_cache(fresh_db_engine):
+    time_utc = datetime.datetime(2031, 1, 1)
+    db_service.add_translations(_make_translations(2, 2, time_utc, 5000), fresh_db_engine)
+
+    # new matches and teams (Team 5100, Team 5101); the rest is cached
+    with _count_statements(fresh_db_engine) as statements:
+        db_service.add_translations(_make_translations(1, 2, time_utc, 5100) + _make_translations(2, 2, time_utc, 5000),
+                                    fresh_db_engine)
+
+    tables = [re.search(r'(?:FROM|INTO) "?(\w+)', s).group(1) for s in statements]
+    assert sorted(tables) == ['match', 'match', 'team', 'team', 'translation']
+
+    # nothing is cached if the transaction is rolled back
+    with Session(fresh_db_engine) as session:
+        db.add_matches_from_domain_objects([t.match for t in _make_translations(1, 1, time_utc, 5200)], session)
+        session.rollback()
+
+    with Session(fresh_db_engine) as session:
+        assert db.get_match_by_url('https://www.hltv.org/matches/5200/match', session) is None
+        assert dimension_cache.get_caches(session).teams.get_ids(['Team 5200']) == dict()
+
+
+def test_dimension_cache_expires(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(dimension_cache.time, 'monotonic', lambda: now)
+
+    cache = dimension_cache.DimensionCache(max_size=10, ttl_sec=60)
+    cache.put('Team 1', 1, domain.Team('Team 1'))
+    assert cache.get_ids(['Team 1']) == {'Team 1': 1}
+
+    # the team may be renamed by another process meanwhile
+    now += 61
+    assert cache.get_ids(['Team 1']) == dict()
+    assert cache.get_objects([1]) == dict()
+
+
+def _make_user_request(chat_tg_id: int, user_tg_id: int, text: str) -> domain.UserRequest:
+    return domain.UserRequest(chat=domain.Chat(telegram_id=chat_tg_id, title=None, type='private'),
+                              user=domain.User(telegram_id=user_tg_id, username=f'user{user_tg_id}', first_name=None,
+                                               last_name=None, is_bot=False, is_premium=False, language_code='ru'),
+                              utc_time=datetime.datetime.utcnow(), telegram_utc_time=datetime.datetime.utcnow(),
+                              telegram_message_id=1, text=text)
+
+
+def test_user_request_writer(tmp_path):
+    # file database: the writer thread needs its own connection to the same database
+    engine = create_engine(f'sqlite:///{tmp_path / "user_request.db"}', future=True)
+    Base.metadata.create_all(engine)
+
+    writer = UserRequestWriter(flush_interval_sec=60, batch_size=3, queue_size=100, db_engine=engine)
+    writer.start()
+    for i in range(4):
+        writer.log(_make_user_request(7000 + i % 2, 8000, f'text {i}'))
+
+    # the queued requests are written on stop without waiting for the flush interval
+    writer.stop()
+
+    assert writer.written_count == 4
+    assert writer.dropped_count == 0
+    assert sorted(r.text for r in db_service.get_recent_user_requests(10, engine)) == [f'text {i}' for i in range(4)]
+
+    with Session(engine) as session:
+        assert len(db.get_users(session)) == 1
+        assert db.get_chat_by_telegram_id(7001, session) is not None
+
+    # chats and users are known now, so only the requests are inserted
+    with _count_statements(engine) as statements:
+        assert db_service.add_user_requests([_make_user_request(7000, 8000, 'text 5')], engine) == 1
+
+    assert len(statements) == 1
+    assert statements[0].startswith('INSERT INTO user_request')
+
+
+@pytest.mark.usefixtures('fresh_db_engine', 'db_data_news_items')
+def test_outbox(fresh_db_engine, db_data_news_items):
+    messages = [(123, 'digest'), (234, 'digest'), (999, 'digest')]
+    assert db_service.add_outbox_messages(messages, 'matches:2031-01-01', db_engine=fresh_db_engine) == 2
+
+    # restart in the same slot: nothing is put twice
+    assert db_service.add_outbox_messages(messages, 'matches:2031-01-01', db_engine=fresh_db_engine) == 0
+
+    claim_timeout = datetime.timedelta(minutes=10)
+    retry_delay = datetime.timedelta(minutes=5)
+    first = db_service.claim_outbox_messages(1, claim_timeout, retry_delay, fresh_db_engine)
+    second = db_service.claim_outbox_messages(10, claim_timeout, retry_delay, fresh_db_engine)
+    assert [m.telegram_id for m in first + second] == [123, 234]
+    assert db_service.claim_outbox_messages(10, claim_timeout, retry_delay, fresh_db_engine) == list()
+
+    # the worker that claimed the first message died; it's claimed again after the timeout
+    db_service.mark_outbox_messages_as_done([second[0].id], [], 2, fresh_db_engine)
+    assert db_service.claim_outbox_messages(10, datetime.timedelta(0), retry_delay, fresh_db_engine) == first
+
+    # the failed message is sent again after the retry delay until the attempts are over
+    db_service.mark_outbox_messages_as_done([], [first[0].id], 2, fresh_db_engine)
+    assert db_service.claim_outbox_messages(10, claim_timeout, retry_delay, fresh_db_engine) == list()
+    assert db_service.claim_outbox_messages(10, claim_timeout, datetime.timedelta(0), fresh_db_engine) == list()
+    with Session(fresh_db_engine) as session:
+        assert db.get_outbox_status_counts(session) == {'sent': 1, 'failed': 1}
+
+
+@pytest.mark.usefixtures('fresh_db_engine', 'db_data_news_items')
+def test_outbox_marks_news_items_as_sent_when_delivered(fresh_db_engine, db_data_news_items):
+    claim_timeout = datetime.timedelta(minutes=10)
+    retry_delay = datetime.timedelta(0)
+    with Session(fresh_db_engine) as session:
+        db.add_subscriber_from_domain_object(domain.Chat(345, '', ''), session)
+        chat_id = db.get_chat_by_telegram_id(345, session).id
+        news_item_ids = [db.get_news_item_by_url(n.url, session).id for n in db_data_news_items]
+
+    def get_sent_news_item_ids():
+        with Session(fresh_db_engine) as session:
+            return [news_item_id for news_item_id in news_item_ids
+                    if len(db.get_news_item_sent_by_news_item_id_and_chat_id(news_item_id, chat_id, session)) > 0]
+
+    since_time_utc = datetime.datetime.now() - datetime.timedelta(days=7)
+    news_items = db_service.get_recent_news_for_subscribers(since_time_utc, 2, fresh_db_engine)[345]
+    assert len(news_items) == 2
+    assert db_service.add_outbox_messages([(345, 'news')], 'news:2031-01-01T06', {345: news_items},
+                                          db_engine=fresh_db_engine) == 1
+
+    # the queued news items are neither sent nor selected again for the next message
+    assert get_sent_news_item_ids() == list()
+    next_news_items = db_service.get_recent_news_for_subscribers(since_time_utc, 2, fresh_db_engine)[345]
+    assert len(next_news_items) == 2
+    assert {n.url for n in next_news_items}.isdisjoint({n.url for n in news_items})
+
+    # the first attempt fails: the message is retried, so the news items are still not sent
+    message = db_service.claim_outbox_messages(10, claim_timeout, retry_delay, fresh_db_engine)[0]
+    db_service.mark_outbox_messages_as_done([], [message.id], 3, fresh_db_engine)
+    assert get_sent_news_item_ids() == list()
+
+    assert db_service.claim_outbox_messages(10, claim_timeout, retry_delay, fresh_db_engine) == [message]
+    db_service.mark_outbox_messages_as_done([message.id], [], 3, fresh_db_engine)
+    with Session(fresh_db_engine) as session:
+        assert sorted(get_sent_news_item_ids()) == sorted(db.get_news_item_by_url(n.url, session).id
+                                                          for n in news_items)
+
+
+@pytest.mark.usefixtures('fresh_db_engine')
+def test_add_news_items(fresh_db_engine):
+    date_time_utc = datetime.datetime(2031, 1, 1, 10, 0)
+    news_items = [NewsItem(date_time_utc, f'Title {i}', f'Desc {i}', f'https://news.com/add/{i}', i, float(i))
+                  for i in range(3)]
+    assert db_service.add_news_items(news_items, fresh_db_engine) == db_service.RetCode.OK
+
+    urls = [n.url for n in news_items] + ['https://news.com/add/unknown']
+    assert db_service.get_news_item_urls_with_short_desc(urls, fresh_db_engine) == {n.url for n in news_items}
+
+    # the known news items come from the list page only (no short description)
+    refreshed = [NewsItem(date_time_utc, f'Title {i}', None, f'https://news.com/add/{i}', i + 10, i + 0.5)
+                 for i in range(4)]
+    with _count_statements(fresh_db_engine) as statements:
+        assert db_service.add_news_items(refreshed, fresh_db_engine) == db_service.RetCode.OK
+
+    # lookup, insert, one executemany update of the counters and the same for hotness (plus the query of the rows)
+    assert len(statements) == 5
+
+    with Session(fresh_db_engine) as session:
+        stored = [db.get_news_item_by_url(n.url, session) for n in refreshed]
+        assert [n.short_desc for n in stored] == ['Desc 0', 'Desc 1', 'Desc 2', None]
+        assert [n.comment_count for n in stored] == [10, 11, 12, 13]
+        assert [n.comment_avg_hour for n in stored] == [0.5, 1.5, 2.5, 3.5]
+        assert [n.hotness for n in stored] == sorted(n.hotness for n in stored)
+        # the news items are published in the future, so their age is 0
+        assert stored[0].hotness == \
+            pytest.approx(10 / config.NEWS_HOTNESS_AGE_OFFSET_HOURS ** config.NEWS_HOTNESS_GRAVITY)
+
+
+@pytest.mark.usefixtures('fresh_db_engine')
+def test_refresh_news_item_comment_counts(fresh_db_engine):
+    date_time_utc = datetime.datetime(2031, 1, 2, 10, 0)
+    news_items = [NewsItem(date_time_utc, f'Title {i}', f'Desc {i}', f'https://news.com/refresh/{i}', i, float(i))
+                  for i in range(2)]
+    db_service.add_news_items(news_items, fresh_db_engine)
+
+    # the list page has an unknown news item as well; it's skipped
+    refreshed = [NewsItem(date_time_utc, f'Title {i}', None, f'https://news.com/refresh/{i}', 100 + i, 50.0)
+                 for i in range(3)]
+    with _count_statements(fresh_db_engine) as statements:
+        assert db_service.refresh_news_item_comment_counts(refreshed, fresh_db_engine) == 2
+
+    assert len(statements) == 1
+
+    with Session(fresh_db_engine) as session:
+        stored = [db.get_news_item_by_url(n.url, session) for n in news_items]
+        assert [n.comment_count for n in stored] == [100, 101]
+        assert [n.short_desc for n in stored] == ['Desc 0', 'Desc 1']
+        assert stored[0].hotness == pytest.approx(db.get_hotness(100, date_time_utc))
+        assert db.get_news_item_by_url('https://news.com/refresh/2', session) is None
+
+
+def test_hotness_decays():
+    now_utc = datetime.datetime(2031, 1, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+    # older than a day: the age must not wrap around
+    old = db.get_hotness(500, datetime.datetime(2030, 12, 30, 11, 0), now_utc)
+    fresh = db.get_hotness(20, datetime.datetime(2031, 1, 1, 11, 0), now_utc)
+
+    assert fresh > old > 0
+    assert db.get_hotness(None, datetime.datetime(2031, 1, 1, 11, 0), now_utc) == 0
@@ -0,0 +1,83 @@
+import pytest
+from lxml import etree
+
+from hltv_upcoming_events_bot import config
+from hltv_upcoming_events_bot.service import fetcher as fetcher_service
+from hltv_upcoming_events_bot.service.fetcher import Fetcher
+from hltv_upcoming_events_bot.service.page_corpus import PageCorpus, ReplayParser
+
+_READY_XPATH = etree.XPath("//div[contains(@class, 'text-content')]/p")
+
+
+class _Element(object):
+    def __init__(self, html: str):
+        self._html = html
+
+    def get_attribute(self, name: str) -> str:
+        return self._html
+
+
+class _ScriptRenderedPage(object):
+    """
+    Page which paragraphs are rendered by scripts: they appear after the page source is requested `ready_after` times
+    since the page is opened.
+    """
+
+    def __init__(self, ready_after: int):
+        self._ready_after = ready_after
+        self._source_count = 0
+        self.loads = 0
+
+    def goto(self, url: str):
+        self.loads += 1
+        self._source_count = 0
+
+    def find_element(self, xpath: str) -> _Element:
+        self._source_count += 1
+        content = '<p>Short desc</p>' if self._source_count > self._ready_after else ''
+        return _Element(f'<html><body><div class="text-content">{content}</div></body></html>')
+
+
+@pytest.fixture(autouse=True)
+def fast_readiness(monkeypatch):
+    monkeypatch.setattr(config, 'FETCHER_USE_HTTP', False)
+    monkeypatch.setattr(config, 'BROWSER_READY_POLL_SEC', 0.01)
+    monkeypatch.setattr(config, 'BROWSER_READY_TIMEOUT_SEC', 0.2)
+
+
+def test_waits_for_element_instead_of_reload():
+    page = _ScriptRenderedPage(ready_after=3)
+
+    html = Fetcher('test', None, page).get('https://slow.example.com/news-1', _READY_XPATH)
+
+    assert 'Short desc' in html
+    assert page.loads == 1
+
+    stats = fetcher_service.get_stats()['slow.example.com']
+    assert stats.browser_ok == 1
+    assert stats.browser_loads == 1
+    assert 0 < stats.browser_avg_ready_sec < config.BROWSER_READY_TIMEOUT_SEC
+
+
+def test_reloads_after_timeout():
+    page = _ScriptRenderedPage(ready_after=1000)
+
+    html = Fetcher('test', None, page).get('https://broken.example.com/news-1', _READY_XPATH)
+
+    assert 'Short desc' not in html
+    assert page.loads == 1 + config.BROWSER_MAX_RELOADS
+    assert fetcher_service.get_stats()['broken.example.com'].browser_failed == 1
+
+
+def test_replay_does_not_wait_for_missing_page(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'BROWSER_READY_TIMEOUT_SEC', 10)
+    parser = ReplayParser(PageCorpus(str(tmp_path / 'corpus.jsonl.gz')))
+
+    html = Fetcher('test', None, parser).get('https://missing.example.com/news-1', _READY_XPATH)
+
+    assert html == '<html></html>'
+    assert parser.navigation_count == 1
+
+    stats = fetcher_service.get_stats()['missing.example.com']
+    assert stats.browser_failed == 1
+    assert stats.browser_ready_sec < 1
@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+
+from hltv_upcoming_events_bot import domain
+from hltv_upcoming_events_bot.service import matches as matches_service
+
+
+def _make_translation(match_id: int, time_utc: datetime.datetime) -> domain.Translation:
+    tournament = domain.Tournament('Tournament 1', 'https://www.hltv.org/events/1/tournament-1', 1)
+    match = domain.Match(domain.Team(f'Team {match_id}'), domain.Team(f'Team {match_id + 1}'), time_utc,
+                         domain.MatchStars.ONE, tournament, domain.MatchState.PLANNED,
+                         f'https://www.hltv.org/matches/{match_id}/match')
+    return domain.Translation(match, domain.Streamer('Streamer', 'Russia', 'https://www.twitch.tv/streamer'))
+
+
+@pytest.fixture()
+def translations(monkeypatch):
+    translations = [_make_translation(1, datetime.datetime.now() + datetime.timedelta(hours=1))]
+    calls = list()
+    versions = [datetime.datetime(2031, 1, 1, 10, 0)]
+
+    def get_translations_in_period(start, until):
+        calls.append((start, until))
+        return list(translations)
+
+    monkeypatch.setattr(matches_service.db_service, 'get_translations_in_period', get_translations_in_period)
+    monkeypatch.setattr(matches_service.db_service, 'get_matches_version', lambda: versions[-1])
+    matches_service.invalidate_digest_cache()
+
+    yield translations, calls, versions
+
+    matches_service.invalidate_digest_cache()
+
+
+def test_digest_is_cached_until_invalidated(translations):
+    translations, calls, _ = translations
+    stats = matches_service.get_digest_cache_stats()
+
+    msg = matches_service.get_upcoming_matches_str()
+    assert 'Team 1 - Team 2' in msg
+    assert matches_service.get_upcoming_matches_str() == msg
+    assert len(calls) == 1
+
+    # new scraped data
+    translations.append(_make_translation(3, datetime.datetime.now() + datetime.timedelta(hours=2)))
+    matches_service.invalidate_digest_cache()
+
+    assert 'Team 3 - Team 4' in matches_service.get_upcoming_matches_str()
+    assert len(calls) == 2
+
+    new_stats = matches_service.get_digest_cache_stats()
+    assert new_stats.hits - stats.hits == 1
+    assert new_stats.misses - stats.misses == 2
+
+
+def test_digest_is_rendered_again_when_matches_are_written_by_another_process(translations):
+    translations, calls, versions = translations
+
+    matches_service.get_upcoming_matches_str()
+    matches_service.get_upcoming_matches_str()
+    assert len(calls) == 1
+
+    # the parser process writes new matches; invalidate_digest_cache() is not called in this process
+    translations.append(_make_translation(3, datetime.datetime.now() + datetime.timedelta(hours=2)))
+    versions.append(datetime.datetime(2031, 1, 1, 10, 15))
+
+    assert 'Team 3 - Team 4' in matches_service.get_upcoming_matches_str()
+    assert len(calls) == 2
+
+
+def test_digest_expires_when_first_match_starts(translations):
+    translations, calls, _ = translations
+    translations[0] = _make_translation(1, datetime.datetime.now() - datetime.timedelta(seconds=1))
+
+    matches_service.get_upcoming_matches_str()
+    matches_service.get_upcoming_matches_str()
+    assert len(calls) == 2
@@ -0,0 +1,177 @@
+import datetime
+from typing import List
+
+import pytest
+
+from hltv_upcoming_events_bot import config
+from hltv_upcoming_events_bot.service import cybersport_parser, hltv_parser, parser_benchmark
+from hltv_upcoming_events_bot.service.page_corpus import PageCorpus, ReplayParser
+
+_MATCH_COUNT = 5
+_ARTICLE_COUNT = 4
+
+
+def _hltv_main_page() -> str:
+    time_ms = int((datetime.datetime.now() + datetime.timedelta(hours=3)).timestamp() * 1000)
+    matches = ''.join(
+        f'<a href="/matches/{i}/team-{i}-vs-team-{i + 100}">'
+        f'<div stars="1"><div class="teamrow"><span>Team {i}</span></div>'
+        f'<div class="teamrow"><span>Team {i + 100}</span></div>'
+        f'<div class="middleExtra" data-unix="{time_ms}"></div></div></a>'
+        for i in range(_MATCH_COUNT))
+
+    return f'<html><body><h1 class="todaysMatches">Matches</h1><div>{matches}</div></body></html>'
+
+
+def _hltv_match_page() -> str:
+    return ('<html><body><div class="timeAndEvent"><div class="event text-ellipsis">'
+            '<a href="/events/7000/some-cup">Some Cup</a></div></div>'
+            '<div class="streams"><div class="stream-box">'
+            '<div class="stream-box-embed"><img alt="Russia"/>streamer</div>'
+            '<div class="external-stream"><a href="https://www.twitch.tv/streamer">open</a></div>'
+            '</div></div></body></html>')
+
+
+def _cybersport_list_page() -> str:
+    articles = ''.join(
+        f'<article><a href="/tags/cs2/news-{i}"><time datetime="2024-01-0{i + 1}T10:00:00+00:00"></time>'
+        f'<h3 class="title_nSS03">News {i}</h3></a><div class="count_7Zuhe">{i}</div></article>'
+        for i in reversed(range(_ARTICLE_COUNT)))
+
+    return f'<html><body>{articles}</body></html>'
+
+
+@pytest.fixture()
+def corpus(tmp_path) -> PageCorpus:
+    corpus = PageCorpus(str(tmp_path / 'corpus.jsonl.gz'))
+
+    corpus.add(config.BASE_URL, _hltv_main_page())
+    for i in range(_MATCH_COUNT):
+        corpus.add(f'{config.BASE_URL}/matches/{i}/team-{i}-vs-team-{i + 100}', _hltv_match_page())
+    corpus.add(f'{config.BASE_URL}/events/7000/some-cup',
+               '<html><body><h1 class="event-hub-title">Some Cup</h1></body></html>')
+
+    corpus.add(cybersport_parser._BASE_URL, _cybersport_list_page())
+    for i in range(_ARTICLE_COUNT):
+        corpus.add(f'https://www.cybersport.ru/tags/cs2/news-{i}',
+                   f'<html><body><div class="text-content"><p>Short desc {i}</p></div></body></html>')
+
+    return corpus
+
+
+class _TrackingReplayParser(ReplayParser):
+    def __init__(self, corpus: PageCorpus, loaded_urls: List[str]):
+        super().__init__(corpus)
+        self._loaded_urls = loaded_urls
+
+    def goto(self, url: str):
+        super().goto(url)
+        self._loaded_urls.append(url)
+
+
+def test_corpus_reload(corpus):
+    reloaded = PageCorpus(corpus.filename)
+
+    assert len(reloaded) == len(corpus)
+    assert reloaded.get(config.BASE_URL) == corpus.get(config.BASE_URL)
+
+
+def test_replay_parser_find_element(corpus):
+    parser = ReplayParser(corpus)
+    parser.goto(cybersport_parser._BASE_URL)
+
+    assert parser.find_element("//h3[@class='title_nSS03']").get_attribute('outerHTML') == \
+        '<h3 class="title_nSS03">News 3</h3>'
+    assert parser.find_element('//table') is None
+
+
+def test_replay_hltv(corpus):
+    translations = list(hltv_parser.get_upcoming_translations(max_workers=2,
+                                                              tournament_resolver=hltv_parser.TournamentResolver(),
+                                                              parser_factory=lambda: ReplayParser(corpus)))
+
+    assert len(translations) == _MATCH_COUNT
+    assert all(t.match.tournament.name == 'Some Cup' for t in translations)
+    assert all(t.match.tournament.hltv_id == 7000 for t in translations)
+    assert all(t.streamer.url == 'https://www.twitch.tv/streamer' for t in translations)
+
+
+def test_replay_hltv_on_given_parser(corpus):
+    parser = ReplayParser(corpus)
+
+    matches = hltv_parser.parse_upcoming_matches(parser, max_workers=2,
+                                                 tournament_resolver=hltv_parser.TournamentResolver())
+
+    # no other browser is started: all the pages are loaded by the given parser
+    assert len(matches) == _MATCH_COUNT
+    assert parser.navigation_count == _MATCH_COUNT + 2
+
+
+def test_replay_cybersport(corpus):
+    news_items = cybersport_parser.parse_news_to_date(datetime.datetime(2024, 1, 2),
+                                                      parser_factory=lambda: ReplayParser(corpus), max_workers=3)
+
+    assert [n.title for n in news_items] == ['News 3', 'News 2', 'News 1']
+    assert news_items[0].short_desc == 'Short desc 3'
+    # article pages are parsed in parallel, but the order is kept
+    assert [n.short_desc for n in news_items] == ['Short desc 3', 'Short desc 2', 'Short desc 1']
+    assert news_items[0].url == 'https://www.cybersport.ru/tags/cs2/news-3'
+
+
+def test_replay_cybersport_skips_known_pages(corpus):
+    loaded_urls = list()
+
+    known_url = 'https://www.cybersport.ru/tags/cs2/news-2'
+    news_items = cybersport_parser.parse_news_to_date(datetime.datetime(2024, 1, 2),
+                                                      parser_factory=lambda: _TrackingReplayParser(corpus, loaded_urls),
+                                                      known_urls_func=lambda urls: [u for u in urls if u == known_url])
+
+    assert [n.title for n in news_items] == ['News 3', 'News 2', 'News 1']
+    assert [n.short_desc for n in news_items] == ['Short desc 3', None, 'Short desc 1']
+    assert known_url not in loaded_urls
+    assert len(loaded_urls) == 3
+
+
+def test_replay_cybersport_discards_failed_parser(corpus):
+    failed_url = 'https://www.cybersport.ru/tags/cs2/news-2'
+    parsers = list()
+
+    class _FailingReplayParser(ReplayParser):
+        def goto(self, url: str):
+            if url == failed_url:
+                raise RuntimeError('browser is closed')
+            super().goto(url)
+
+    def create_parser() -> ReplayParser:
+        parsers.append(_FailingReplayParser(corpus))
+        return parsers[-1]
+
+    news_items = cybersport_parser.parse_news_to_date(datetime.datetime(2024, 1, 2), parser_factory=create_parser,
+                                                      max_workers=1)
+
+    assert [n.short_desc for n in news_items] == ['Short desc 3', None, 'Short desc 1']
+    # the list page parser and the article parser that failed are replaced by a new one
+    assert len(parsers) == 3
+
+
+def test_replay_cybersport_list_only(corpus):
+    loaded_urls = list()
+
+    news_items = cybersport_parser.parse_news_list(parser_factory=lambda: _TrackingReplayParser(corpus, loaded_urls))
+
+    assert [n.comment_count for n in news_items] == [3, 2, 1, 0]
+    assert all(n.short_desc is None for n in news_items)
+    assert loaded_urls == [cybersport_parser._BASE_URL]
+
+
+def test_benchmark(corpus):
+    hltv_result, cybersport_result = parser_benchmark.run_benchmark(corpus)
+
+    assert hltv_result.items == _MATCH_COUNT
+    assert hltv_result.pages == _MATCH_COUNT + 2
+    assert cybersport_result.items == _ARTICLE_COUNT
+    assert cybersport_result.pages == _ARTICLE_COUNT + 1
+
+    # generous budget: extraction from local pages must not wait for anything
+    assert hltv_result.ms_per_item < 200
+    assert cybersport_result.ms_per_item < 200
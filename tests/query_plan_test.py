@@ -0,0 +1,105 @@
+import datetime
+import re
+from typing import Callable, List, Tuple
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+import hltv_upcoming_events_bot.db as db
+import hltv_upcoming_events_bot.service.db as db_service
+from hltv_upcoming_events_bot import domain
+from hltv_upcoming_events_bot.db.common import Base
+
+# full scan of a table (not of a subquery and not of an index)
+_FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+
+_NOW = datetime.datetime(2030, 6, 1, 12)
+
+
+@pytest.fixture(scope='module')
+def seeded_db_engine():
+    engine = create_engine('sqlite+pysqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+
+    translations = list()
+    for i in range(50):
+        match = domain.Match(domain.Team(f'Team {i}'), domain.Team(f'Team {i + 1}'),
+                             _NOW + datetime.timedelta(hours=i), domain.MatchStars.ONE,
+                             domain.Tournament(f'Tournament {i % 5}', f'https://www.hltv.org/events/{i % 5}/t', i % 5),
+                             domain.MatchState.PLANNED, f'https://www.hltv.org/matches/{i}/match')
+        for j in range(3):
+            translations.append(domain.Translation(match, domain.Streamer(f'Streamer {j}', 'Russia',
+                                                                          f'https://www.twitch.tv/streamer{j}')))
+
+    db_service.add_translations(translations, engine)
+
+    with Session(engine) as session:
+        for i in range(50):
+            db.add_news_item(_NOW - datetime.timedelta(hours=i), f'News {i}', '', f'https://news.com/{i}.html', i,
+                             float(i), session)
+        session.commit()
+
+        for i in range(10):
+            chat_id = db.add_chat(1000 + i, f'Chat {i}', 'private', session)
+            user_id = db.add_user(2000 + i, f'user{i}', '', '', False, False, 'en', session)
+            db.add_subscriber_from_domain_object(domain.Chat(1000 + i, '', ''), session)
+            db.add_user_request(chat_id, user_id, _NOW - datetime.timedelta(minutes=i), _NOW, i, '/news', session)
+
+    yield engine
+
+
+def _get_full_scans(engine, func: Callable) -> List[Tuple[str, str]]:
+    """
+    Calls func and runs EXPLAIN QUERY PLAN for every SELECT statement issued by it.
+
+    Returns: (table, statement) pairs for tables read without any index
+    """
+
+    statements = list()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    assert len(statements) > 0
+
+    out = list()
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters):
+                found = _FULL_SCAN_RE.match(row.detail)
+                if found and found.group(1) in Base.metadata.tables:
+                    out.append((found.group(1), statement))
+
+    return out
+
+
+@pytest.mark.parametrize('name,func', [
+    ('get_translations_in_period',
+     lambda engine: db_service.get_translations_in_period(int(_NOW.timestamp()),
+                                                          int((_NOW + datetime.timedelta(hours=5)).timestamp()),
+                                                          engine)),
+    ('get_recent_news_for_chat',
+     lambda engine: db_service.get_recent_news_for_chat(1000, _NOW - datetime.timedelta(hours=12), 3, engine)),
+    ('get_recent_news_for_subscribers',
+     lambda engine: db_service.get_recent_news_for_subscribers(_NOW - datetime.timedelta(hours=12), 3, engine)),
+    ('mark_news_items_as_sent',
+     lambda engine: db_service.mark_news_items_as_sent(
+         [domain.NewsItem(_NOW, 'News 1', '', 'https://news.com/1.html', 1, 1.0)], [1001], db_engine=engine)),
+    ('get_matches_last_scraped_at',
+     lambda engine: db_service.get_matches_last_scraped_at(['https://www.hltv.org/matches/1/match'])),
+    ('get_recent_user_requests',
+     lambda engine: db_service.get_recent_user_requests(5, engine)),
+])
+def test_no_full_scans(name, func, seeded_db_engine, monkeypatch):
+    # for the service functions that always use the default engine
+    monkeypatch.setattr(db_service, 'get_engine', lambda: seeded_db_engine)
+
+    assert _get_full_scans(seeded_db_engine, lambda: func(seeded_db_engine)) == []